@@ -1,7 +1,7 @@
 from typing import Annotated, Any
 from uuid import UUID
 
-from fastapi import APIRouter, Depends, HTTPException, Query, UploadFile, File
+from fastapi import APIRouter, Depends, HTTPException, Query, Request, Response, UploadFile, File
 from sqlalchemy import select
 from fastapi.responses import FileResponse, RedirectResponse, StreamingResponse
 from pathlib import Path
@@ -41,19 +41,26 @@ async def read_attachments(
     response_class=StreamingResponse,
     responses={
         200: {"description": "File stream"},
-        404: {"description": "Attachment content not found"}
+        206: {"description": "Requested byte range"},
+        302: {"description": "Redirect to a presigned S3 URL (ATTACHMENT_DOWNLOAD_MODE=redirect)"},
+        304: {"description": "Not modified (If-None-Match)"},
+        404: {"description": "Attachment content not found"},
+        416: {"description": "Requested range not satisfiable"},
     }
 )
-async def download_attachment_file(session: SessionDep, attachment_id: UUID | str):
+async def download_attachment_file(session: SessionDep, attachment_id: UUID | str, request: Request):
     """
-    Create a attachment file.
+    Download an attachment file.
     """
     attachment = await crud_attachment.get_attachment(session, attachment_id)
-    from app.services.s3_service import object_exists, upload_bytes, stream_object
+    from app.services.s3_service import (
+        get_cached_presigned_url, object_exists, open_object, peek_presigned_url, upload_bytes,
+    )
 
     key = str(attachment.file)
-    exists = await object_exists(key)
-    if not exists:
+    filename = attachment.file_name or "file"
+
+    async def upload_legacy_file() -> None:
         legacy_path = Path(settings.MEDIA_ROOT / "attachment" / (attachment.file_name or ""))
         if legacy_path.exists() and legacy_path.is_file():
             data = legacy_path.read_bytes()
@@ -62,11 +69,35 @@ async def download_attachment_file(session: SessionDep, attachment_id: UUID | st
             # If no legacy file and no S3 object, return 404
             raise HTTPException(status_code=404, detail="Attachment content not found")
 
-    # Stream file from S3
-    iterator, headers = await stream_object(key)
-    filename = attachment.file_name or "file"
+    if settings.ATTACHMENT_DOWNLOAD_MODE == "redirect":
+        # ссылка в кеше выдана для существующего объекта: HEAD в S3 нужен только при промахе
+        url = peek_presigned_url(key, filename)
+        if url is None:
+            if not await object_exists(key):
+                await upload_legacy_file()
+            url = await get_cached_presigned_url(key, filename)
+        return RedirectResponse(url, status_code=302)
+
+    range_header = request.headers.get("range")
+    if_none_match = request.headers.get("if-none-match")
+    status, iterator, headers = await open_object(key, range_header=range_header, if_none_match=if_none_match)
+    if status == 404:
+        await upload_legacy_file()
+        status, iterator, headers = await open_object(key, range_header=range_header, if_none_match=if_none_match)
+    if status == 304:
+        return Response(status_code=304, headers=headers)
+    if status == 416:
+        raise HTTPException(status_code=416, detail="Requested range not satisfiable")
+    if status == 404:
+        raise HTTPException(status_code=404, detail="Attachment content not found")
+
     headers["Content-Disposition"] = f"attachment; filename=\"{filename}\""
-    return StreamingResponse(iterator, media_type=headers.get("Content-Type", "application/octet-stream"), headers=headers)
+    return StreamingResponse(
+        iterator,
+        status_code=status,
+        media_type=headers.get("Content-Type", "application/octet-stream"),
+        headers=headers,
+    )
 
 
 @router.post(
@@ -22,6 +22,7 @@ from app.schemas.emitter import EmitterUpdate
 from fastapi.responses import JSONResponse
 import app.utils.message as message_utils
 from app.utils.message import publish_message
+from app.utils.tracing import span
 
 router = APIRouter()
 
@@ -118,9 +119,12 @@ async def send_message(session: SessionDep,
         "channel_id": channel_id,
     }
     message_in = schemas_message.MessageCreate(**message_data)
-    message = await message_utils.create_message(session, current_user, message_in, attachments)
-    await notify_channel(message.channel_id, schemas_message.MessagePublic(**message.__dict__))
-    await publish_message(message)
+    with span("api.send_message", channel_id=channel_id, sender_id=current_user.id):
+        with span("api.create_message"):
+            message = await message_utils.create_message(session, current_user, message_in, attachments)
+        with span("ws.notify", channel_id=message.channel_id):
+            await notify_channel(message.channel_id, schemas_message.MessagePublic(**message.__dict__))
+        await publish_message(message)
     return message
 
 
@@ -1,12 +1,17 @@
 import asyncio
+import json
 import logging
+import time
 from uuid import UUID
 
 from fastapi import (APIRouter, Depends, WebSocket, WebSocketDisconnect)
 
+from app.config import settings
 from app.managers.websocket import ChannelWebSocketManager, BotWebSocketManager
 from app.api.dependencies.websocket import AuthWebsocketDataChannelDep, AuthWebsocketDataBotDep
 from app.managers.websocket import WebSocketManagerBase
+from app.managers.websocket.base import WebSocketConnection
+from app.metrics.websocket import websocket_metrics
 
 router = APIRouter()
 
@@ -24,6 +29,64 @@ async def notify_bot(bot_id: UUID | str, message) -> None:
     await bot_websocket_manager.notify_bot(bot_id, message)
 
 
+# служебные сообщения клиента: строкой ("ping") или JSON ({"type": "ping"})
+CONTROL_TYPES = {"ping", "pong", "pause", "resume"}
+PING_MESSAGE = json.dumps({"type": "ping"})
+PONG_MESSAGE = json.dumps({"type": "pong"})
+
+
+def control_type(text: str | None) -> str | None:
+    if not text:
+        return None
+    text = text.strip()
+    if text in CONTROL_TYPES:
+        return text
+    if not text.startswith("{"):
+        return None
+    try:
+        data = json.loads(text)
+    except ValueError:
+        return None
+    kind = data.get("type") if isinstance(data, dict) else None
+    return kind if kind in CONTROL_TYPES else None
+
+
+async def receive_loop(websocket: WebSocket, connection: WebSocketConnection) -> str:
+    """
+    Читает входящие сообщения до отключения клиента и возвращает причину закрытия.
+    Между сообщениями задача спит в receive, поэтому отключение видно сразу, без опроса.
+    """
+    timeouts = [t for t in (settings.WS_PING_INTERVAL, settings.WS_IDLE_TIMEOUT) if t > 0]
+    timeout = min(timeouts) if timeouts else None
+    last_seen = time.monotonic()
+    while True:
+        try:
+            message = await asyncio.wait_for(websocket.receive(), timeout)
+        except asyncio.TimeoutError:
+            idle = time.monotonic() - last_seen
+            if settings.WS_IDLE_TIMEOUT > 0 and idle >= settings.WS_IDLE_TIMEOUT:
+                await websocket.close(code=1001)
+                return "idle"
+            if settings.WS_PING_INTERVAL > 0:
+                connection.enqueue(PING_MESSAGE)
+            continue
+
+        if message["type"] == "websocket.disconnect":
+            return "client"
+        last_seen = time.monotonic()
+        text = message.get("text")
+        size = len(text.encode()) if text is not None else len(message.get("bytes") or b"")
+        websocket_metrics.observe_received(connection.metrics_label, size)
+
+        kind = control_type(text)
+        if kind == "ping":
+            connection.enqueue(PONG_MESSAGE)
+        elif kind == "pause":
+            connection.pause()
+        elif kind == "resume":
+            connection.resume()
+
+
 async def websocket_handler(websocket: WebSocket, auth_data: dict, websocket_manager: WebSocketManagerBase):
     user = auth_data["user"]
     entity = auth_data["entity"]
@@ -32,16 +95,22 @@ async def websocket_handler(websocket: WebSocket, auth_data: dict, websocket_man
 
     # Принимаем WebSocket-соединение
     await websocket.accept()
-    await websocket_manager.add_connection(entity['id'], connection_uuid, websocket)
+    connection = await websocket_manager.add_connection(entity['id'], connection_uuid, websocket)
 
+    reason = "error"
     try:
-        while True:
-            await asyncio.sleep(0.5)
+        reason = await receive_loop(websocket, connection)
+        if reason == "idle":
+            logger.info(f"Соединение с сущностью {entity['id']} закрыто по неактивности пользователя {user['id']}.")
+        else:
+            logger.info(f"Соединение с сущностью {entity['id']} закрыто пользователем {user['id']}.")
     except WebSocketDisconnect:
+        reason = "client"
         logger.info(f"Соединение с сущностью {entity['id']} закрыто пользователем {user['id']}.")
     except Exception as e:
         logger.error(f"Непредвиденная ошибка в WebSocket-соединении с сущностью {entity['id']}: {e}")
     finally:
+        websocket_metrics.inc_disconnect(websocket_manager.metrics_label, reason)
         await websocket_manager.remove_connection(entity['id'], connection_uuid)
         logger.info(f"Соединение с сущностью {entity['id']} закрыто.")
 
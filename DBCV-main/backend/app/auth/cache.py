@@ -1,17 +1,40 @@
 from __future__ import annotations
+import asyncio
+import hashlib
+import json
+import logging
 import time
-from typing import Optional, Tuple, Dict
+from typing import Any, Awaitable, Callable, Mapping, Optional, Tuple, Dict
+
+from redis.asyncio import Redis
+
 from app.auth.types import AccessToken
+from app.config import settings
+from app.managers.data_manager import redis_lock
+from app.utils.secret_box import decrypt_blob_to_dict, encrypt_dict_to_blob
+
+logger = logging.getLogger(__name__)
+
+
+def token_key_prefix(credential_id: Any) -> str:
+    """Префикс ключей токенов одной учётки: по нему токены удаляются при её изменении."""
+    return f"auth:token:{credential_id}:"
 
 
 class TokenCache:
     """
-    Простой in-memory кеш access-токенов.
-    Ключ строю из (bot_id, provider, profile, strategy, scopes_fingerprint).
+    Кеш access-токенов: в памяти процесса и в Redis (зашифрованным через secret_box), общий для воркеров.
+    Ключ строю из id учётки и хеша (bot_id, provider, profile, strategy, scopes, payload):
+    разные учётки не делят токены, а изменённая учётка сразу получает новый.
+    Токен обновляется заранее, за AUTH_TOKEN_REFRESH_AHEAD секунд до истечения: пока он действует,
+    обновление идёт в фоне. Одновременно обновляет токен только один вызов (в процессе и в кластере).
     """
 
-    def __init__(self):
-        self._store: Dict[Tuple[str, str, str, str, str], AccessToken] = {}
+    def __init__(self, redis: Optional[Redis] = None, refresh_ahead: float = 0):
+        self._redis = redis
+        self._refresh_ahead = refresh_ahead
+        self._store: Dict[str, AccessToken] = {}
+        self._inflight: Dict[str, asyncio.Task] = {}
 
     @staticmethod
     def _fingerprint_scopes(scopes: Optional[list[str]]) -> str:
@@ -23,6 +46,22 @@ class TokenCache:
     def _now() -> float:
         return time.time()
 
+    def _key(self, bot_id: str, provider: str, profile: str, strategy: str, scopes: Optional[list[str]],
+             credential: Optional[Mapping[str, Any]] = None) -> str:
+        credential = credential or {}
+        payload = json.dumps(credential.get("payload"), sort_keys=True, default=str)
+        parts: Tuple[str, ...] = (str(bot_id), provider, profile, strategy, self._fingerprint_scopes(scopes), payload)
+        digest = hashlib.blake2b("|".join(parts).encode("utf-8"), digest_size=16).hexdigest()
+        return token_key_prefix(credential.get("id") or "-") + digest
+
+    def _usable(self, token: Optional[AccessToken]) -> bool:
+        return token is not None and (not token.expires_at or token.expires_at > self._now() + 30)  # 30 сек запас
+
+    def _fresh(self, token: Optional[AccessToken]) -> bool:
+        return token is not None and (
+            not token.expires_at or token.expires_at > self._now() + max(self._refresh_ahead, 30)
+        )
+
     def get(
         self,
         *,
@@ -31,12 +70,11 @@ class TokenCache:
         profile: str,
         strategy: str,
         scopes: Optional[list[str]] = None,
+        credential: Optional[Mapping[str, Any]] = None,
     ) -> Optional[AccessToken]:
-        key = (bot_id, provider, profile, strategy, self._fingerprint_scopes(scopes))
+        key = self._key(bot_id, provider, profile, strategy, scopes, credential)
         token = self._store.get(key)
-        if not token:
-            return None
-        if token.expires_at and token.expires_at <= (self._now() + 30):  # 30 сек запас
+        if not self._usable(token):
             # протух — удаляю
             self._store.pop(key, None)
             return None
@@ -51,6 +89,102 @@ class TokenCache:
         strategy: str,
         scopes: Optional[list[str]],
         token: AccessToken,
+        credential: Optional[Mapping[str, Any]] = None,
     ) -> None:
-        key = (bot_id, provider, profile, strategy, self._fingerprint_scopes(scopes))
-        self._store[key] = token
+        self._store[self._key(bot_id, provider, profile, strategy, scopes, credential)] = token
+
+    async def get_or_mint(
+        self,
+        *,
+        bot_id: str,
+        provider: str,
+        profile: str,
+        strategy: str,
+        scopes: Optional[list[str]],
+        mint: Callable[[], Awaitable[AccessToken]],
+        credential: Optional[Mapping[str, Any]] = None,
+    ) -> AccessToken:
+        key = self._key(bot_id, provider, profile, strategy, scopes, credential)
+        token = self._store.get(key)
+        if not self._usable(token):
+            token = await self._load(key)
+        if self._fresh(token):
+            return token
+        if self._usable(token):
+            self._refresh(key, mint)
+            return token
+        return await asyncio.shield(self._refresh(key, mint))
+
+    def _refresh(self, key: str, mint: Callable[[], Awaitable[AccessToken]]) -> asyncio.Task:
+        task = self._inflight.get(key)
+        if task is None:
+            task = asyncio.create_task(self._mint(key, mint))
+            self._inflight[key] = task
+            task.add_done_callback(lambda t: self._on_refreshed(key, t))
+        return task
+
+    def _on_refreshed(self, key: str, task: asyncio.Task) -> None:
+        self._inflight.pop(key, None)
+        if not task.cancelled() and task.exception() is not None:
+            logger.warning(f"Token refresh failed for {key}: {task.exception()!r}")
+
+    async def _mint(self, key: str, mint: Callable[[], Awaitable[AccessToken]]) -> AccessToken:
+        if self._redis is None:
+            token = await mint()
+            self._store[key] = token
+            return token
+
+        async with redis_lock(self._redis, key):
+            # токен мог обновить другой воркер, пока мы ждали блокировку
+            token = await self._load(key)
+            if self._fresh(token):
+                return token
+            token = await mint()
+            self._store[key] = token
+            await self._save(key, token)
+            return token
+
+    async def _load(self, key: str) -> Optional[AccessToken]:
+        if self._redis is None:
+            return None
+        try:
+            blob = await self._redis.get(key)
+            if not blob:
+                return None
+            token = AccessToken(**decrypt_blob_to_dict(blob.decode() if isinstance(blob, bytes) else blob))
+        except Exception as e:
+            logger.warning(f"Failed to load cached token {key}: {e}")
+            return None
+        if self._usable(token):
+            self._store[key] = token
+            return token
+        return None
+
+    async def invalidate_credential(self, credential_id: Any) -> None:
+        """Удаляет токены учётки (в памяти процесса и в Redis) после её изменения или удаления."""
+        prefix = token_key_prefix(credential_id)
+        for key in [key for key in self._store if key.startswith(prefix)]:
+            self._store.pop(key, None)
+        if self._redis is None:
+            return
+        try:
+            keys = [key async for key in self._redis.scan_iter(match=prefix + "*")]
+            if keys:
+                await self._redis.delete(*keys)
+        except Exception as e:
+            logger.warning(f"Failed to invalidate tokens of credential {credential_id}: {e}")
+
+    async def _save(self, key: str, token: AccessToken) -> None:
+        ttl = int(token.expires_at - self._now()) if token.expires_at else settings.AUTH_TOKEN_DEFAULT_TTL
+        if ttl <= 0:
+            return
+        try:
+            await self._redis.set(key, encrypt_dict_to_blob(token.model_dump()), ex=ttl)
+        except Exception as e:
+            logger.warning(f"Failed to store token {key}: {e}")
+
+
+token_cache = TokenCache(
+    Redis.from_url(settings.CACHE_REDIS_URL),
+    refresh_ahead=settings.AUTH_TOKEN_REFRESH_AHEAD,
+)
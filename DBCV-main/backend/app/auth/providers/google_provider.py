@@ -40,19 +40,17 @@ class GoogleProvider:
 
         print(f"[google] using scopes: {scopes}")
 
-        cached = cache.get(bot_id=bot_id, provider=provider, profile=profile, strategy=strategy, scopes=scopes)
-        if cached:
-            return cached
-
-        if strategy == "service_account":
-            token = await self._from_service_account(creds_cfg["payload"], scopes)
-        elif strategy == "oauth":
-            token = await self._from_oauth_refresh(creds_cfg["payload"])
-        else:
+        async def mint() -> AccessToken:
+            if strategy == "service_account":
+                return await self._from_service_account(creds_cfg["payload"], scopes)
+            if strategy == "oauth":
+                return await self._from_oauth_refresh(creds_cfg["payload"])
             raise RuntimeError(f"google: unsupported strategy: {strategy}")
 
-        cache.put(bot_id=bot_id, provider=provider, profile=profile, strategy=strategy, scopes=scopes, token=token)
-        return token
+        return await cache.get_or_mint(
+            bot_id=bot_id, provider=provider, profile=profile, strategy=strategy, scopes=scopes, mint=mint,
+            credential=creds_cfg,
+        )
 
     def apply_headers(self, headers: dict, token: AccessToken, hints: Mapping[str, Any]) -> None:
         headers["Authorization"] = f"{token.token_type} {token.access_token}"
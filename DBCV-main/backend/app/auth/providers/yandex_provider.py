@@ -41,18 +41,17 @@ class YandexCloudProvider:
         strategy = str(creds_cfg.get("strategy", "service_account"))
         scopes = None  # Yandex Cloud IAM не требует scopes
 
-        cached = cache.get(bot_id=bot_id, provider=provider, profile=profile, strategy=strategy, scopes=scopes)
-        if cached:
-            return cached
-
         payload = creds_cfg["payload"]
-        if "oauth_token" in payload:
-            token = await self._from_oauth(payload["oauth_token"])
-        else:
-            token = await self._from_service_account(payload)
 
-        cache.put(bot_id=bot_id, provider=provider, profile=profile, strategy=strategy, scopes=scopes, token=token)
-        return token
+        async def mint() -> AccessToken:
+            if "oauth_token" in payload:
+                return await self._from_oauth(payload["oauth_token"])
+            return await self._from_service_account(payload)
+
+        return await cache.get_or_mint(
+            bot_id=bot_id, provider=provider, profile=profile, strategy=strategy, scopes=scopes, mint=mint,
+            credential=creds_cfg,
+        )
 
     def apply_headers(self, headers: dict, token: AccessToken, hints: Mapping[str, Any]) -> None:
         headers["Authorization"] = f"Bearer {token.access_token}"
@@ -123,20 +122,18 @@ class YandexIdOAuthProvider:
         strategy = str(creds_cfg.get("strategy", "oauth"))
         scopes = None
 
-        cached = cache.get(bot_id=bot_id, provider=provider, profile=profile, strategy=strategy, scopes=scopes)
-        if cached:
-            return cached
-
         payload = creds_cfg["payload"]
         if "access_token" in payload and not payload.get("expires_at"):
-            token = AccessToken(token_type="OAuth", access_token=payload["access_token"], expires_at=None)
-        elif "refresh_token" in payload:
-            token = await self._refresh(payload)
-        else:
+            # долгоживущий токен из учётки: кешировать нечего
+            return AccessToken(token_type="OAuth", access_token=payload["access_token"], expires_at=None)
+        if "refresh_token" not in payload:
             raise RuntimeError("yandex_id: provide access_token or refresh_token with client credentials")
 
-        cache.put(bot_id=bot_id, provider=provider, profile=profile, strategy=strategy, scopes=scopes, token=token)
-        return token
+        return await cache.get_or_mint(
+            bot_id=bot_id, provider=provider, profile=profile, strategy=strategy, scopes=scopes,
+            mint=lambda: self._refresh(payload),
+            credential=creds_cfg,
+        )
 
     def apply_headers(self, headers: dict, token: AccessToken, hints: Mapping[str, Any]) -> None:
         headers["Authorization"] = f"OAuth {token.access_token}"
@@ -2,22 +2,26 @@ import uuid
 from urllib.parse import urlparse
 from typing import Mapping, Any, Optional
 
-from app.auth.cache import TokenCache
+from app.auth.cache import token_cache
 from app.auth.providers.google_provider import GoogleProvider
 from app.auth.providers.amocrm_provider import AmoCrmProvider
 from app.auth.providers.yandex_provider import YandexCloudProvider, YandexIdOAuthProvider
 
 
+# провайдеры без состояния — одни на процесс
+PROVIDERS = {
+    "google": GoogleProvider(),
+    "amocrm": AmoCrmProvider(),
+    "yandex_cloud": YandexCloudProvider(),
+    "yandex_id": YandexIdOAuthProvider(),
+}
+
+
 class AuthService:
     def __init__(self, resolver):
         self._resolver = resolver
-        self._cache = TokenCache()
-        self._providers = {
-            "google": GoogleProvider(),
-            "amocrm": AmoCrmProvider(),
-            "yandex_cloud": YandexCloudProvider(),
-            "yandex_id": YandexIdOAuthProvider(),
-        }
+        self._cache = token_cache
+        self._providers = PROVIDERS
 
     async def apply(
         self,
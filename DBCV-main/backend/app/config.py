@@ -70,6 +70,16 @@ class Settings(BaseSettings):
     S3_ACCESS_KEY: str | None = os.getenv("S3_ACCESS_KEY")
     S3_SECRET_KEY: str | None = os.getenv("S3_SECRET_KEY")
     S3_BUCKET: str = os.getenv("S3_BUCKET", "dbcv-media")
+    # выдача вложений: proxy - поток через API (Range, ETag), redirect - 302 на presigned-ссылку S3
+    ATTACHMENT_DOWNLOAD_MODE: str = os.getenv("ATTACHMENT_DOWNLOAD_MODE", "proxy")
+    ATTACHMENT_PRESIGNED_TTL: int = int(os.getenv("ATTACHMENT_PRESIGNED_TTL", 3600))
+    # общий клиент S3: пул соединений и таймауты
+    S3_MAX_POOL_CONNECTIONS: int = int(os.getenv("S3_MAX_POOL_CONNECTIONS", 50))
+    S3_CONNECT_TIMEOUT: float = float(os.getenv("S3_CONNECT_TIMEOUT", 5))
+    S3_READ_TIMEOUT: float = float(os.getenv("S3_READ_TIMEOUT", 60))
+    S3_MAX_ATTEMPTS: int = int(os.getenv("S3_MAX_ATTEMPTS", 3))
+    # размер чанка при потоковой пересылке вложений из S3
+    ATTACHMENT_STREAM_CHUNK_SIZE: int = int(os.getenv("ATTACHMENT_STREAM_CHUNK_SIZE", 64 * 1024))
 
     # broker streams
     USER_STREAM_NAME: str = "user_messages"
@@ -78,12 +88,95 @@ class Settings(BaseSettings):
     BOT_STREAM_GROUP: str = "bot_group"
     EMITTER_STREAM_NAME: str = "emitters"
     EMITTER_STREAM_GROUP: str = "emitters_group"
+    STREAM_MAX_RECORDS: int = int(os.getenv("STREAM_MAX_RECORDS", 100))
+    # обработка сообщений: общий лимит и лимит на ключ (отправитель, бот, канал)
+    WORKER_MAX_CONCURRENCY: int = int(os.getenv("WORKER_MAX_CONCURRENCY", os.getenv("DB_POOL_SIZE", 10)))
+    WORKER_KEY_CONCURRENCY: int = int(os.getenv("WORKER_KEY_CONCURRENCY", 1))
+    # восстановление неподтверждённых сообщений (XAUTOCLAIM)
+    STREAM_CLAIM_MIN_IDLE_MS: int = int(os.getenv("STREAM_CLAIM_MIN_IDLE_MS", 60_000))
+    STREAM_CLAIM_BATCH_SIZE: int = int(os.getenv("STREAM_CLAIM_BATCH_SIZE", 100))
+    STREAM_CLAIM_MIN_INTERVAL: float = float(os.getenv("STREAM_CLAIM_MIN_INTERVAL", 1.0))
+    STREAM_CLAIM_MAX_INTERVAL: float = float(os.getenv("STREAM_CLAIM_MAX_INTERVAL", 30.0))
+    STREAM_MAX_DELIVERIES: int = int(os.getenv("STREAM_MAX_DELIVERIES", 5))
 
     DB_POOL_SIZE: int = int(os.getenv("DB_POOL_SIZE", 10))
     DB_MAX_OVERFLOW: int = int(os.getenv("DB_MAX_OVERFLOW", 10))
     REDIS_URL: str = os.getenv("REDIS_URL", "redis://redis:6379/0")
     CACHE_REDIS_URL: str = os.getenv("CACHE_REDIS_URL", "redis://cache-redis:6389/0")
     PROXIES: str = os.getenv("PROXIES", "")
+
+    # bot engine
+    BOT_GRAPH_CACHE_SIZE: int = int(os.getenv("BOT_GRAPH_CACHE_SIZE", 256))
+    # write-behind: изменения переменных копятся в Redis и пачками сбрасываются в Postgres воркерами
+    VARIABLES_WRITE_BEHIND: bool = os.getenv("VARIABLES_WRITE_BEHIND", "false").lower() in ("1", "true", "yes")
+    VARIABLES_FLUSH_INTERVAL: float = float(os.getenv("VARIABLES_FLUSH_INTERVAL", 1.0))
+    VARIABLES_FLUSH_BATCH_SIZE: int = int(os.getenv("VARIABLES_FLUSH_BATCH_SIZE", 500))
+    # локальный кеш процесса перед Redis для почти статичных ключей
+    LOCAL_CACHE_SIZE: int = int(os.getenv("LOCAL_CACHE_SIZE", 1024))
+    LOCAL_CACHE_TTL: float = float(os.getenv("LOCAL_CACHE_TTL", 60))
+    LOCAL_CACHE_PREFIXES: str = os.getenv("LOCAL_CACHE_PREFIXES", "bot:,channel:")
+    LOCAL_CACHE_CHANNEL: str = os.getenv("LOCAL_CACHE_CHANNEL", "cache:invalidate")
+    # расшифрованные учётные данные: только в памяти процесса, недолго
+    CREDENTIALS_CACHE_SIZE: int = int(os.getenv("CREDENTIALS_CACHE_SIZE", 256))
+    CREDENTIALS_CACHE_TTL: float = float(os.getenv("CREDENTIALS_CACHE_TTL", 60))
+    # межпроцессная блокировка загрузки ключа из БД (single-flight между репликами)
+    CACHE_DISTRIBUTED_LOCK: bool = os.getenv("CACHE_DISTRIBUTED_LOCK", "false").lower() in ("1", "true", "yes")
+    CACHE_LOCK_TTL_MS: int = int(os.getenv("CACHE_LOCK_TTL_MS", 5000))
+    CACHE_LOCK_WAIT: float = float(os.getenv("CACHE_LOCK_WAIT", 5.0))
+    # формат значений кеша: json, orjson, msgpack; сжатие: "" или zstd
+    CACHE_CODEC: str = os.getenv("CACHE_CODEC", "json")
+    CACHE_COMPRESSION: str = os.getenv("CACHE_COMPRESSION", "")
+    CACHE_COMPRESSION_THRESHOLD: int = int(os.getenv("CACHE_COMPRESSION_THRESHOLD", 4096))
+    CACHE_COMPRESSION_LEVEL: int = int(os.getenv("CACHE_COMPRESSION_LEVEL", 3))
+    # логи ботов в WebSocket: пачки, уровень по умолчанию (переопределяется в hash BOT_LOG_LEVELS_KEY), сэмплирование
+    BOT_LOG_BATCH_SIZE: int = int(os.getenv("BOT_LOG_BATCH_SIZE", 50))
+    BOT_LOG_FLUSH_INTERVAL: float = float(os.getenv("BOT_LOG_FLUSH_INTERVAL", 0.5))
+    BOT_LOG_LEVEL: str = os.getenv("BOT_LOG_LEVEL", "INFO")
+    BOT_LOG_LEVELS_KEY: str = os.getenv("BOT_LOG_LEVELS_KEY", "bot_logs:levels")
+    BOT_LOG_SAMPLE_RATE: float = float(os.getenv("BOT_LOG_SAMPLE_RATE", 1.0))
+    BOT_LOG_STATE_TTL: float = float(os.getenv("BOT_LOG_STATE_TTL", 2.0))
+    BOT_LOG_STATE_CACHE_SIZE: int = int(os.getenv("BOT_LOG_STATE_CACHE_SIZE", 10000))
+    BOT_LOG_WATCH_TTL: float = float(os.getenv("BOT_LOG_WATCH_TTL", 60))
+    # WebSocket: очередь отправки на подключение; при переполнении drop_oldest, drop_new или disconnect
+    WS_SEND_QUEUE_SIZE: int = int(os.getenv("WS_SEND_QUEUE_SIZE", 256))
+    WS_SEND_TIMEOUT: float = float(os.getenv("WS_SEND_TIMEOUT", 10))
+    WS_OVERFLOW_POLICY: str = os.getenv("WS_OVERFLOW_POLICY", "drop_oldest")
+    # heartbeat: сообщение {"type": "ping"} клиенту после WS_PING_INTERVAL секунд без входящих;
+    # при WS_IDLE_TIMEOUT > 0 соединение закрывается, если клиент молчит дольше (0 - не закрывать)
+    WS_PING_INTERVAL: float = float(os.getenv("WS_PING_INTERVAL", 30))
+    WS_IDLE_TIMEOUT: float = float(os.getenv("WS_IDLE_TIMEOUT", 0))
+    # трассировка: none, otlp (TRACING_OTLP_ENDPOINT, OTLP/HTTP) или file (JSON Lines в TRACING_FILE)
+    TRACING_EXPORTER: str = os.getenv("TRACING_EXPORTER", "none")
+    TRACING_OTLP_ENDPOINT: str = os.getenv("TRACING_OTLP_ENDPOINT", "http://localhost:4318/v1/traces")
+    TRACING_FILE: str = os.getenv("TRACING_FILE", "traces.jsonl")
+    TRACING_SAMPLE_RATE: float = float(os.getenv("TRACING_SAMPLE_RATE", 1.0))
+    TRACING_SERVICE_PREFIX: str = os.getenv("TRACING_SERVICE_PREFIX", "dbcv-")
+    # порт /metrics воркеров FastStream (0 - не поднимать); API отдаёт /metrics на своём порту
+    METRICS_PORT: int = int(os.getenv("METRICS_PORT", 9100))
+    # broadcast - уведомления всем узлам API, registry - только узлам с подключениями к сущности;
+    # registry включать, когда все узлы API обновлены: старые узлы не регистрируются в реестре
+    WS_ROUTING: str = os.getenv("WS_ROUTING", "broadcast")
+    WS_ROUTE_TTL: float = float(os.getenv("WS_ROUTE_TTL", 60))
+    # префикс id узла для логов и реестра; к нему всегда добавляется суффикс процесса
+    WS_NODE_ID: str = os.getenv("WS_NODE_ID", "")
+    # пользовательский код шагов
+    CODE_CACHE_SIZE: int = int(os.getenv("CODE_CACHE_SIZE", 1024))
+    CODE_EXECUTION_TIMEOUT: float = float(os.getenv("CODE_EXECUTION_TIMEOUT", 30))
+    # inline - в event loop воркера, process - в отдельных процессах (простой код, см. is_trivial, всё равно inline)
+    CODE_EXECUTION_BACKEND: str = os.getenv("CODE_EXECUTION_BACKEND", "inline")
+    CODE_PROCESS_POOL_SIZE: int = int(os.getenv("CODE_PROCESS_POOL_SIZE", 0))
+    CODE_PROCESS_MEMORY_LIMIT_MB: int = int(os.getenv("CODE_PROCESS_MEMORY_LIMIT_MB", 512))
+    CODE_INLINE_MAX_LENGTH: int = int(os.getenv("CODE_INLINE_MAX_LENGTH", 2000))
+    # HTTP-запросы шагов: клиенты по конфигурации прокси (LRU), лимиты соединений, HTTP/2 (нужен пакет h2)
+    HTTP_CLIENT_POOL_SIZE: int = int(os.getenv("HTTP_CLIENT_POOL_SIZE", 32))
+    HTTP_CLIENT_TIMEOUT: float = float(os.getenv("HTTP_CLIENT_TIMEOUT", 30))
+    HTTP_MAX_CONNECTIONS: int = int(os.getenv("HTTP_MAX_CONNECTIONS", 100))
+    HTTP_MAX_KEEPALIVE_CONNECTIONS: int = int(os.getenv("HTTP_MAX_KEEPALIVE_CONNECTIONS", 20))
+    HTTP_MAX_CONNECTIONS_PER_HOST: int = int(os.getenv("HTTP_MAX_CONNECTIONS_PER_HOST", 20))
+    HTTP_CLIENT_HTTP2: bool = os.getenv("HTTP_CLIENT_HTTP2", "false").lower() in ("1", "true", "yes")
+    # токены внешних API: обновление заранее, за N секунд до истечения; TTL в Redis для токенов без срока
+    AUTH_TOKEN_REFRESH_AHEAD: float = float(os.getenv("AUTH_TOKEN_REFRESH_AHEAD", 300))
+    AUTH_TOKEN_DEFAULT_TTL: int = int(os.getenv("AUTH_TOKEN_DEFAULT_TTL", 3600))
     OPENAI_API_KEY: str = os.getenv("OPENAI_API_KEY", "")
 
     MCP_SERVICE_URL: str = os.getenv("MCP_SERVICE_URL", "http://mcp-dbcv:8005")
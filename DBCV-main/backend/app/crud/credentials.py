@@ -16,20 +16,28 @@ async def _raise_not_found() -> None:
     raise HTTPException(status_code=404, detail="Credential not found.")
 
 
-async def _invalidate_credential_cache(bot_id: str, provider: str, strategy: str) -> None:
-    """Инвалидирует кэш credentials для указанного bot_id, provider и strategy."""
+async def _invalidate_credential_cache(bot_id: str, provider: str, cred_id: UUID | str) -> None:
+    """Инвалидирует кэш credentials бота для провайдера и учётки cred_id (в Redis и в памяти процессов) и её токены."""
     from redis.asyncio import Redis
     from app.config import settings
+    from app.managers.codecs import cache_codec
+    from app.managers.local_cache import credentials_cache
+    from app.auth.cache import token_cache
+    keys = [
+        f"bot:{bot_id}:credentials",
+        f"credentials:bot:{bot_id}:provider:{provider}",
+        f"credentials:id:{cred_id}",
+    ]
     try:
         redis = Redis.from_url(settings.CACHE_REDIS_URL)
-        # Удаляем конкретные ключи кэша
-        await redis.delete(
-            f"credential:bot:{bot_id}:provider:{provider}:strategy:{strategy}:default",
-            f"credential:bot:{bot_id}:provider:{provider}:strategy:{strategy}:singleton"
-        )
+        await redis.delete(*[cache_codec.key(key) for key in keys])
+        for key in keys:
+            await credentials_cache.publish_invalidation(redis, key)
         await redis.aclose()
     except Exception:
         pass  # Игнорируем ошибки кэша
+    # токены, выпущенные по старым данным учётки
+    await token_cache.invalidate_credential(cred_id)
 
 
 async def get_credential(session: AsyncSession, cred_id: UUID | str,
@@ -99,7 +107,7 @@ async def create_credential(
         )
     
     # Инвалидируем кэш credentials после создания
-    await _invalidate_credential_cache(str(cred_in.bot_id), cred_in.provider.value, cred_in.strategy.value)
+    await _invalidate_credential_cache(str(cred_in.bot_id), cred_in.provider.value, db_obj.id)
     
     return db_obj
 
@@ -131,7 +139,7 @@ async def update_credential(
             )
     
     # Инвалидируем кэш credentials после обновления
-    await _invalidate_credential_cache(str(cred.bot_id), cred.provider, cred.strategy)
+    await _invalidate_credential_cache(str(cred.bot_id), cred.provider, cred.id)
 
     return cred
 
@@ -139,8 +147,7 @@ async def update_credential(
 async def delete_credential(session: AsyncSession, cred_id: UUID | str, bot_id: UUID | str) -> None:
     cred = await get_credential(session, cred_id, bot_id=bot_id)
     provider = cred.provider
-    strategy = cred.strategy
     await session.delete(cred)
     
     # Инвалидируем кэш credentials после удаления
-    await _invalidate_credential_cache(str(bot_id), provider, strategy)
\ No newline at end of file
+    await _invalidate_credential_cache(str(bot_id), provider, cred_id)
\ No newline at end of file
@@ -1,14 +1,15 @@
+import asyncio
 import json
 import logging
 import traceback
 from abc import abstractmethod, ABC
+from contextlib import AsyncExitStack, contextmanager
 import random
-from copy import deepcopy
 from datetime import datetime
 from typing import Any, Optional, Dict
 from uuid import uuid4
 
-from jqqb_evaluator.evaluator import Evaluator
+from httpx import Headers
 from redis.asyncio import Redis
 
 from app.auth.credentials_resolver import CredentialsResolver
@@ -16,18 +17,22 @@ from app.auth.service import AuthService
 from app.config import settings
 
 from app.database import sessionmanager
+from app.engine.graph import (CompiledBotGraph, CompiledConnection, CompiledConnectionGroup, CompiledTemplateGraph,
+                              get_bot_graph)
 from app.engine.request import make_request
-from app.engine.variables import variable_substitution_pydantic, update_variables_dict, variable_substitution
+from app.engine.variables import variable_substitution_pydantic, update_variables_dict
 from app.loggers import BotLogger
 from app.loggers.bot import NoopBotLogger
 from app.managers.data_manager import DataManager
 from app.managers.message_manager import MessageManager
+from app.metrics.pipeline import pipeline_metrics
+from app.utils.tracing import span
 from app.models.base import UUID
 from app.models.connection import SearchType
 from app.schemas.bot import BotProcessor
 from app.schemas.channel import ChannelSimple
 from app.schemas.session import SessionSimple
-from app.schemas.connection import ConnectionExport, ConnectionGroupExport
+from app.schemas.connection import ConnectionGroupExport
 from app.schemas.request import RequestSubstitute
 from app.schemas.step import StepExport, StepTemplate
 from app.services.message_service import MessageService
@@ -36,13 +41,22 @@ from app.services.s3_storage_service import S3StorageService
 from sqlalchemy import text
 from app.database import sessionmanager
 from app.schemas.templates import TemplateInstancePublic
+from app.utils.multipart import MultipartStream, StreamedFile
 from app.utils.dict import deep_merge_dicts, get_value_by_list_keys, deep_set, get_value_by_path
-from app.engine.safe_env import safe_globals
+from app.engine.sandbox import (CodeTimeoutError, CopyOnAccessDict, build_globals, code_cache, inline_deadlines,
+                                is_trivial, process_code_runner)
 
 redis = Redis.from_url(settings.CACHE_REDIS_URL)
 logger = logging.getLogger(__name__)
 
 
+@contextmanager
+def stage(name: str, **attributes):
+    """Стадия обработки сообщения: гистограмма длительности и спан трассировки."""
+    with span(f"bot.{name}", **attributes), pipeline_metrics.stage(name):
+        yield
+
+
 class ConnectionHandler(ABC):
     @abstractmethod
     async def handle(self, connection_group: ConnectionGroupExport, context: dict,
@@ -90,55 +104,81 @@ class ConnectionResponseHandler(ConnectionHandler):
             await self.logger.error(f"Auth injection failed: {e}")
 
         try:
-            files = await self._prepare_request_files(request_in.attachments)
-        except Exception as e:
-            await self.logger.error(f"Error in prepare request files handler: {e}")
-        try:
-            result_json = await make_request(
-                connection_group.request.method,
-                request_in.request_url,
-                params=request_in.params,
-                json_field=request_in.json_field,
-                content=request_in.content,
-                data=request_in.data,
-                files=files,
-                headers=request_in.headers,
-                proxies=request_in.proxies
-            )
+            async with AsyncExitStack() as stack:
+                data, content, headers = request_in.data, request_in.content, request_in.headers
+                try:
+                    files = await self._prepare_request_files(request_in.attachments, stack)
+                except Exception as e:
+                    await self.logger.error(f"Error in prepare request files handler: {e}")
+                    files = []
+                if files:
+                    # тело собирается потоково из S3, поля data идут частями формы
+                    if data is not None and not isinstance(data, dict):
+                        await self.logger.warning("Request data is not an object and is ignored for file upload")
+                    body = MultipartStream(data if isinstance(data, dict) else None, files)
+                    headers = self._request_headers(headers)
+                    # Headers без учёта регистра: пользовательский content-type заменяется, а не дублируется
+                    headers.update(body.headers)
+                    data, content = None, body
+
+                result_json = await make_request(
+                    connection_group.request.method,
+                    request_in.request_url,
+                    params=request_in.params,
+                    json_field=request_in.json_field,
+                    content=content,
+                    data=data,
+                    headers=headers,
+                    proxies=request_in.proxies,
+                    cache_ttl=request_in.cache_ttl,
+                )
             await self.logger.info(f"Response: {result_json}")
-            for file in files:
-                file[1].close()
             return result_json
         except Exception as e:
             await self.logger.error(f"Error in response handler: {e}")
             return None
 
-    async def _prepare_request_files(self, attachments: list | None):
-        files = []
+    @staticmethod
+    def _request_headers(headers: Any) -> Headers:
+        """Заголовки запроса: объект, список пар или строки вида `Name: value`."""
+        if not headers:
+            return Headers()
+        if isinstance(headers, str):
+            lines = [line.split(":", 1) for line in headers.splitlines() if ":" in line]
+            return Headers([(name.strip(), value.strip()) for name, value in lines])
+        return Headers(headers)
+
+    async def _prepare_request_files(self, attachments: str | list | dict | None,
+                                     stack: AsyncExitStack) -> list[StreamedFile]:
+        """Открывает вложения как потоки из S3; потоки закрываются вместе со `stack`."""
         if not attachments:
-            return files
+            return []
+        if not isinstance(attachments, list):
+            attachments = [attachments]
 
         # attachments can be IDs or variable placeholders already substituted into dicts
-        repo = SqlAttachmentRepository(sessionmanager.engine)
+        attachment_ids = [str(att.get("id") if isinstance(att, dict) else att) for att in attachments]
+        attachment_ids = [attachment_id for attachment_id in attachment_ids if attachment_id and attachment_id != "None"]
+        metas = await SqlAttachmentRepository(sessionmanager.engine).get_many(attachment_ids)
         storage = S3StorageService()
 
-        for att in attachments:
-            attachment_id = att.get("id") if isinstance(att, dict) else att
-            if not attachment_id:
-                continue
-
-            meta = await repo.get_by_id(attachment_id)
+        files = []
+        for attachment_id in attachment_ids:
+            meta = metas.get(attachment_id)
             if not meta:
                 await self.logger.info(f"Attachment not found: {attachment_id}")
                 continue
 
             key = meta.key
-            content_type = meta.content_type or "application/octet-stream"
-            data = await storage.get_bytes(key)
+            stored = await stack.enter_async_context(storage.open_stream(key))
             filename = key.split("/")[-1] if isinstance(key, str) else "file"
-
-            # httpx files format supports tuples: (name, bytes, content_type)
-            files.append(("files", (filename, data, content_type)))
+            files.append(StreamedFile(
+                field="files",
+                filename=filename,
+                content_type=meta.content_type or stored.content_type or "application/octet-stream",
+                size=stored.size,
+                chunks=stored.chunks,
+            ))
         return files
 
 
@@ -152,7 +192,7 @@ class ConnectionCodeHandler(ConnectionHandler):
         try:
             if connection_group.code:
                 return await CodeExecutor(self.logger).execute(connection_group.code, context,
-                                                                               deepcopy(all_variables))
+                                                                CopyOnAccessDict(all_variables or {}))
         except Exception as e:
 
             await self.logger.error(f"Error in code handler: {e}")
@@ -169,31 +209,48 @@ class CodeExecutorBase(ABC):
 class CodeExecutor(CodeExecutorBase):
     def __init__(self, logger: BotLogger):
         self.logger = logger
-        self.available_globals = safe_globals
-        self.available_globals[self.logger.print.__name__] = self.logger.print
 
     async def execute(self, code: str, context: dict | None = None, variables: dict | None = None):
         available_variables = {}
         context = context or {}
         variables = variables or {}
+        if settings.CODE_EXECUTION_BACKEND == "process" and not is_trivial(code):
+            return await self._execute_in_process(code, context, variables)
+        code_globals = build_globals(self.logger.print)
         try:
-            exec(compile(code, '<string>', 'exec'),
-                 {"__builtins__": None, **self.available_globals},
-                 available_variables)
+            # wait_for не прерывает синхронный код: его ограничивает inline_deadlines
+            with inline_deadlines.limit(code_globals, settings.CODE_EXECUTION_TIMEOUT):
+                exec(code_cache.get(code), code_globals, available_variables)
 
-            if 'main' not in available_variables:
-                await self.logger.error("Error: функция 'main' не определена.")
-                return context
+                if 'main' not in available_variables:
+                    await self.logger.error("Error: функция 'main' не определена.")
+                    return context
 
-            result = await available_variables['main'](context, variables=variables)
+                result = await asyncio.wait_for(available_variables['main'](context, variables=variables),
+                                                timeout=settings.CODE_EXECUTION_TIMEOUT)
             return result
 
+        except (asyncio.TimeoutError, CodeTimeoutError):
+            await self.logger.error(f"Execution error: превышено время выполнения "
+                                    f"({settings.CODE_EXECUTION_TIMEOUT} с)")
+            return context
         except Exception as e:
             traceback_str = ''.join(traceback.format_exception(type(e), e, e.__traceback__))
             print(traceback_str)
             await self.logger.error(f"Execution error:\n{traceback_str}")
             return context
 
+    async def _execute_in_process(self, code: str, context: dict, variables: dict):
+        if isinstance(variables, CopyOnAccessDict):
+            # сериализация для процесса и так отделяет значения от исходника
+            variables = variables.raw()
+        result, printed, error = await process_code_runner.run(code, context, variables)
+        for line in printed:
+            await self.logger.info(line)
+        if error:
+            await self.logger.error(error)
+        return result
+
 
 class ConnectionHandlerFactory:
     @staticmethod
@@ -253,6 +310,13 @@ class Processor(BaseProcessor):
         self.current_step = None
         self.context: dict[str, Any] = {}
         self.message: dict[str, Any] = {}
+        self._auth_service: AuthService | None = None
+
+    @property
+    def auth_service(self) -> AuthService:
+        if self._auth_service is None:
+            self._auth_service = AuthService(CredentialsResolver(self.data_manager))
+        return self._auth_service
 
     async def _save_variables(self, variables_save_as: dict[str, str], context: dict[str, Any]):
         await self.logger.info("Save variables...")
@@ -269,15 +333,15 @@ class Processor(BaseProcessor):
         except Exception as e:
             await self.logger.info(f"Error in save variables: {e}")
 
-    async def switch_to_next_step(self, connection: ConnectionExport) -> bool:
+    async def switch_to_next_step(self, connection: CompiledConnection) -> bool:
         await self.logger.info("Switch to next step...")
         next_step = self._get_current_step(connection.next_step_id)
         return await self._switch_to_next_step(next_step)
 
-    async def _evaluate_and_switch(self, connection: ConnectionExport, context: dict) -> bool:
+    async def _evaluate_and_switch(self, connection: CompiledConnection, context: dict) -> bool:
         await self.logger.info("Check rules and context")
-        rules_str = connection.rules
-        if not rules_str or not context:
+        rules = connection.rules
+        if rules is None or not context:
             return await self.switch_to_next_step(connection)
 
         await self.logger.info("Create context")
@@ -287,18 +351,11 @@ class Processor(BaseProcessor):
             if value is None:
                 safe_all_variables[key] = {}
         context = deep_merge_dicts(safe_all_variables, context or None)
-        await self.logger.info("Substitution variables...")
-
-        try:
-            rules_str = await variable_substitution(rules_str, context)
-            evaluator = Evaluator(json.loads(rules_str))
-        except Exception as e:
-            await self.logger.error(f"Error variable substitution: {e}")
-            return False
-
         await self.logger.info("Working evaluator...")
         try:
-            if evaluator.object_matches_rules(context):
+            with stage("rules"):
+                matched = await rules.matches(context)
+            if matched:
                 return await self.switch_to_next_step(connection)
         except Exception as e:
             await self.logger.error(f"Error evaluating rules: {e}")
@@ -306,18 +363,18 @@ class Processor(BaseProcessor):
 
         return False
 
-    async def process_connection_groups(self, connection_groups: list[ConnectionGroupExport], context: dict):
-        for connection_group in connection_groups:
+    async def process_connection_groups(self, connection_groups: tuple[CompiledConnectionGroup, ...], context: dict):
+        for compiled_group in connection_groups:
+            connection_group = compiled_group.group
             await self.logger.info("Processing connection group...")
-            resolver = CredentialsResolver(self.data_manager)
-            auth_service = AuthService(resolver)
-            handler = ConnectionHandlerFactory.get_handler(connection_group.search_type, self.logger, self.bot, auth_service, self.data_manager)
+            handler = ConnectionHandlerFactory.get_handler(connection_group.search_type, self.logger, self.bot, self.auth_service, self.data_manager)
             if handler:
-                self.context = await handler.handle(connection_group, context, self.all_variables)
+                with stage("handler"):
+                    self.context = await handler.handle(connection_group, context, self.all_variables)
             await self._save_variables(connection_group.variables, self.context)
             await self.logger.info("Start evaluate rules and switch step...")
 
-            for connection in connection_group.connections:
+            for connection in compiled_group.connections:
                 if await self._evaluate_and_switch(connection, self.context):
                     return True
 
@@ -343,7 +400,8 @@ class Processor(BaseProcessor):
         if next_step.message:
             await self.logger.info("Create step message...")
             message_service = MessageService(engine=sessionmanager.engine)
-            await message_service.send_message(self.session, next_step.message, context=context)
+            with stage("publish"):
+                await message_service.send_message(self.session, next_step.message, context=context)
 
     def _get_current_step(self, step_id: str) -> StepTemplate:
         ...
@@ -353,19 +411,18 @@ class Processor(BaseProcessor):
 
 
 class TemplateProcessor(Processor):
-    def __init__(self, template, logger, data_manager: DataManager, bot):
+    def __init__(self, graph: CompiledTemplateGraph, logger, data_manager: DataManager, bot):
         super().__init__(logger, {}, data_manager)
         self.logger = logger
         self.bot = bot
-        self.instance: TemplateInstancePublic = template
+        self.graph = graph
+        self.instance: TemplateInstancePublic = graph.instance
         self.context: dict[str, Any] = {}
         self.current_step: StepExport | None = None
         self.all_variables: dict[str, Any] = {}
 
     def _get_current_step(self, step_id: str) -> StepTemplate:
-        for step in self.instance.steps:
-            if step.id == step_id:
-                return step
+        return self.graph.get_step(step_id)
 
     @staticmethod
     def _extract_inputs_from_mapping(mapping: dict, variables: dict) -> dict:
@@ -420,10 +477,10 @@ class TemplateProcessor(Processor):
                                                                             variables)}
         self.context = context
 
-        self.current_step = self._get_current_step(self.instance.first_step_id)
+        self.current_step = self._get_current_step(self.graph.first_step_id)
         await self.logger.info("Process connection groups...")
 
-        await self.process_connection_groups(self.current_step.connection_groups, self.context)
+        await self.process_connection_groups(self.graph.connection_groups(self.current_step), self.context)
 
         outputs = self._extract_outputs_to_mapping(self.instance.outputs_mapping.model_dump(), self.all_variables.get("template"))
         return outputs
@@ -437,10 +494,8 @@ class MessageProcessor(Processor):
                  data_manager: DataManager):
         super().__init__(logger, {}, data_manager)
         self.sender_id = sender_id
-        cache_structure = bot.get("cache_structure")
-        if not isinstance(cache_structure, dict):
-            raise ValueError(f"Invalid bot id-{bot.get('id')}: missing cache_structure")
-        self.bot = BotProcessor(**cache_structure)
+        self.graph: CompiledBotGraph = get_bot_graph(bot)
+        self.bot: BotProcessor = self.graph.bot
         self.channel = ChannelSimple(**channel)
         self.message: dict[str, Any] = message
         self.all_variables = None
@@ -471,54 +526,55 @@ class MessageProcessor(Processor):
         if next_step.message:
             await self.logger.info("Create step message...")
             message_service = MessageService(engine=sessionmanager.engine)
-            await message_service.send_message(self.session, next_step.message, context=context)
+            with stage("publish"):
+                await message_service.send_message(self.session, next_step.message, context=context)
         if next_step.template_instance:
             await self.logger.info("Processing template...")
 
-            template_processor = TemplateProcessor(next_step.template_instance, self.logger, self.data_manager, self.bot)
+            template_processor = TemplateProcessor(self.graph.template_graph(next_step), self.logger,
+                                                   self.data_manager, self.bot)
             template_outputs = await template_processor.run(self.context, self.all_variables)
             safe_all_variables = self.all_variables if self.all_variables is not None else {}
             safe_template_outputs = template_outputs if template_outputs is not None else {}
             self.all_variables = deep_merge_dicts(safe_all_variables, safe_template_outputs)
-            return await self.process_connection_groups(next_step.connection_groups, self.context)
+            return await self.process_connection_groups(self.graph.connection_groups(next_step), self.context)
 
         if next_step.is_proxy:
             await self.logger.info("Processing connection groups for proxy step...")
-            return await self.process_connection_groups(next_step.connection_groups, self.context)
+            return await self.process_connection_groups(self.graph.connection_groups(next_step), self.context)
 
         return True
 
     def _get_current_step(self, step_id):
-        for step in self.bot.steps:
-            if step.id == step_id:
-                return step
+        return self.graph.get_step(step_id)
 
     async def run(self, *args, **kwargs):
-        await self.logger.info("Start working bot...")
-        await self.logger.info("Get or create session...")
+        try:
+            with stage("total", bot_id=self.bot.id, channel_id=self.channel.id):
+                await self._process()
+        finally:
+            with stage("log_flush"):
+                await self.logger.flush()
 
-        self.session = SessionSimple(
-            **(await self.data_manager.get_or_create_session(self.sender_id, self.bot.id, self.channel.id,
-                                                             self.bot.first_step_id)))
+    async def _process(self):
+        await self.logger.info("Start working bot...")
+        await self.logger.info("Get or create session and load variables...")
 
-        await self.logger.info("Load variables...")
-        self.all_variables = await self.data_manager.get_all_variables(self.sender_id, self.bot.id, self.channel.id,
-                                                                       self.session.id)
+        # сессия и переменные всех областей читаются одним обращением, поэтому и стадия одна
+        with stage("load"):
+            session_data, self.all_variables = await self.data_manager.get_session_and_variables(
+                self.sender_id, self.bot.id, self.channel.id, self.bot.first_step_id)
+        self.session = SessionSimple(**session_data)
         if self.all_variables is None:
             self.all_variables = {}
         for key, value in self.all_variables.items():
             if value is None:
                 self.all_variables[key] = {}
+        self._variables_fingerprint = self.data_manager.variables_fingerprint(self.all_variables)
         self.context = self.message
         await self.logger.info("Check master groups...")
-        if await self.process_connection_groups(self.bot.master_connection_groups, self.context):
-            await self.data_manager.update_all_variables(self.sender_id, self.bot.id, self.channel.id,
-                                                         self.session.id, self.all_variables)
-            self.session.step_id = self.current_step.id
-            await self.data_manager.update_session(self.session.user_id,
-                                                   self.session.bot_id,
-                                                   self.session.channel_id,
-                                                   self.session.step_id)
+        if await self.process_connection_groups(self.graph.master_connection_groups, self.context):
+            await self._persist()
             return
 
         await self.logger.info("Check groups...")
@@ -526,24 +582,26 @@ class MessageProcessor(Processor):
 
         self.logger.set_step(self.current_step.id)
 
-        if await self.process_connection_groups(self.current_step.connection_groups, self.context):
-            await self.data_manager.update_all_variables(self.sender_id, self.bot.id, self.channel.id,
-                                                         self.session.id, self.all_variables)
+        if await self.process_connection_groups(self.graph.connection_groups(self.current_step), self.context):
+            await self._persist()
+            return
+
+        await self.logger.info("No transitions triggered, committing any updated variables.")
+        await self._persist()
+
+    async def _persist(self):
+        """Сохраняет только изменившиеся области переменных и шаг сессии, если он сменился."""
+        with stage("persist"):
+            await self.data_manager.update_changed_variables(self.sender_id, self.bot.id, self.channel.id,
+                                                             self.session.id, self.all_variables,
+                                                             self._variables_fingerprint)
+            if str(self.current_step.id) == str(self.session.step_id):
+                return
             self.session.step_id = self.current_step.id
             await self.data_manager.update_session(self.session.user_id,
                                                    self.session.bot_id,
                                                    self.session.channel_id,
                                                    self.session.step_id)
-            return
-
-        await self.logger.info("No transitions triggered, committing any updated variables.")
-        await self.data_manager.update_all_variables(self.sender_id, self.bot.id, self.channel.id,
-                                                     self.session.id, self.all_variables)
-        self.session.step_id = self.current_step.id
-        await self.data_manager.update_session(self.session.user_id,
-                                               self.session.bot_id,
-                                               self.session.channel_id,
-                                               self.session.step_id)
 
 
 async def check_message(message: dict, channel_id: UUID | str | None = None):
@@ -0,0 +1,152 @@
+"""
+Скомпилированный граф бота.
+
+Структура бота (`cache_structure`) валидируется в `BotProcessor` один раз на версию,
+после чего шаги индексируются по id, группы связей и связи сортируются по приоритету,
+а правила переходов компилируются в предикаты (см. `app.engine.rules`). Графы хранятся в LRU-кеше процесса
+с ключом (bot_id, хеш структуры).
+"""
+import hashlib
+import json
+import logging
+from collections import OrderedDict
+from types import MappingProxyType
+from typing import Any, Iterable, Mapping, Optional
+
+from app.config import settings
+from app.engine.rules import CompiledRules, compile_rules
+from app.schemas.bot import BotProcessor
+
+logger = logging.getLogger(__name__)
+
+
+class CompiledConnection:
+    __slots__ = ("connection", "next_step_id", "rules")
+
+    def __init__(self, connection):
+        self.connection = connection
+        self.next_step_id = str(connection.next_step_id) if connection.next_step_id is not None else None
+        self.rules: Optional[CompiledRules] = compile_rules(connection.rules)
+
+
+class CompiledConnectionGroup:
+    __slots__ = ("group", "connections")
+
+    def __init__(self, group):
+        self.group = group
+        self.connections: tuple[CompiledConnection, ...] = tuple(
+            CompiledConnection(connection)
+            for connection in sorted(group.connections, key=lambda c: c.priority)
+        )
+
+
+def compile_connection_groups(groups: Iterable[Any]) -> tuple[CompiledConnectionGroup, ...]:
+    """Сортирует группы связей по приоритету и компилирует их связи."""
+    return tuple(CompiledConnectionGroup(group) for group in sorted(groups or (), key=lambda g: g.priority))
+
+
+class StepIndex:
+    """Индекс шагов по id с заранее скомпилированными группами связей."""
+
+    def __init__(self, steps: Iterable[Any]):
+        steps_by_id = {}
+        groups_by_step = {}
+        for step in steps:
+            step_id = str(step.id)
+            steps_by_id[step_id] = step
+            groups_by_step[step_id] = compile_connection_groups(step.connection_groups)
+        self.steps: Mapping[str, Any] = MappingProxyType(steps_by_id)
+        self._groups: Mapping[str, tuple[CompiledConnectionGroup, ...]] = MappingProxyType(groups_by_step)
+
+    def get_step(self, step_id) -> Optional[Any]:
+        if step_id is None:
+            return None
+        return self.steps.get(str(step_id))
+
+    def connection_groups(self, step) -> tuple[CompiledConnectionGroup, ...]:
+        if step is None:
+            return ()
+        return self._groups.get(str(step.id), ())
+
+
+class CompiledTemplateGraph(StepIndex):
+    def __init__(self, instance):
+        super().__init__(instance.steps)
+        self.instance = instance
+        self.first_step_id = str(instance.first_step_id)
+
+
+class CompiledBotGraph(StepIndex):
+    def __init__(self, bot: BotProcessor, structure_hash: str, source: Optional[dict] = None):
+        super().__init__(bot.steps)
+        self.bot = bot
+        self.id = bot.id
+        self.structure_hash = structure_hash
+        self.source = source
+        self.first_step_id = bot.first_step_id
+        self.master_connection_groups = compile_connection_groups(bot.master_connection_groups)
+        self._templates: Mapping[str, CompiledTemplateGraph] = MappingProxyType({
+            step_id: CompiledTemplateGraph(step.template_instance)
+            for step_id, step in self.steps.items()
+            if step.template_instance is not None
+        })
+
+    def template_graph(self, step) -> Optional[CompiledTemplateGraph]:
+        if step is None:
+            return None
+        return self._templates.get(str(step.id))
+
+
+def structure_hash(cache_structure: dict) -> str:
+    dumped = json.dumps(cache_structure, separators=(",", ":"), ensure_ascii=False, default=str)
+    return hashlib.blake2b(dumped.encode("utf-8"), digest_size=16).hexdigest()
+
+
+class BotGraphCache:
+    """
+    LRU-кеш скомпилированных графов на уровне процесса.
+    Для каждого бота хранится только последняя версия структуры.
+    """
+
+    def __init__(self, maxsize: int):
+        self.maxsize = maxsize
+        self._graphs: OrderedDict[str, CompiledBotGraph] = OrderedDict()
+
+    def get(self, bot: dict[str, Any]) -> CompiledBotGraph:
+        cache_structure = bot.get("cache_structure")
+        if not isinstance(cache_structure, dict):
+            raise ValueError(f"Invalid bot id-{bot.get('id')}: missing cache_structure")
+
+        bot_id = str(bot.get("id") or cache_structure.get("id"))
+        graph = self._graphs.get(bot_id)
+        # тот же объект из локального кеша DataManager - структура заведомо не менялась
+        if graph is not None and graph.source is cache_structure:
+            self._graphs.move_to_end(bot_id)
+            return graph
+
+        digest = structure_hash(cache_structure)
+        if graph is not None and graph.structure_hash == digest:
+            graph.source = cache_structure
+            self._graphs.move_to_end(bot_id)
+            return graph
+
+        logger.debug(f"Compiling bot graph: {bot_id} ({digest})")
+        graph = CompiledBotGraph(BotProcessor(**cache_structure), digest, cache_structure)
+        self._graphs[bot_id] = graph
+        self._graphs.move_to_end(bot_id)
+        while len(self._graphs) > self.maxsize:
+            self._graphs.popitem(last=False)
+        return graph
+
+    def invalidate(self, bot_id) -> None:
+        self._graphs.pop(str(bot_id), None)
+
+    def clear(self) -> None:
+        self._graphs.clear()
+
+
+bot_graph_cache = BotGraphCache(settings.BOT_GRAPH_CACHE_SIZE)
+
+
+def get_bot_graph(bot: dict[str, Any]) -> CompiledBotGraph:
+    return bot_graph_cache.get(bot)
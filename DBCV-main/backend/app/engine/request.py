@@ -1,30 +1,189 @@
+import asyncio
+import base64
+import json
+import logging
+import time
+from collections import OrderedDict
+from contextlib import asynccontextmanager
+from typing import AsyncIterator
+from urllib.parse import urlsplit
+
 from httpx import AsyncClient, Response, Limits, Timeout, AsyncHTTPTransport
 
+from app.config import settings
+from app.engine.response_cache import CACHEABLE_METHODS, ResponseCache, response_cache, response_ttl
+from app.metrics.http_client import http_client_metrics
+from app.utils.partitioned import PartitionedScheduler
+
+try:
+    import h2  # noqa: F401
+    HTTP2_AVAILABLE = True
+except ImportError:
+    HTTP2_AVAILABLE = False
+
+logger = logging.getLogger(__name__)
+
+_TEXT_TYPES = ("application/xml", "application/javascript", "application/x-www-form-urlencoded")
+
+
+class HttpClientPool:
+    """
+    Клиенты httpx, переиспользуемые между запросами: один общий без прокси и по одному на
+    конфигурацию прокси (LRU, не больше `maxsize`). Запросы берут клиент через `lease`;
+    вытесненный клиент закрывается, когда через него не идёт ни одного запроса: таймаут httpx
+    ограничивает отдельные фазы, а не весь запрос, поэтому закрытие по времени обрывало бы
+    долгие загрузки и скачивания.
+    """
+
+    def __init__(self, maxsize: int, timeout: float, max_connections: int, max_keepalive: int, http2: bool):
+        self.maxsize = maxsize
+        self.timeout = timeout
+        self.limits = Limits(max_connections=max_connections, max_keepalive_connections=max_keepalive)
+        self.http2 = http2 and HTTP2_AVAILABLE
+        if http2 and not HTTP2_AVAILABLE:
+            logger.warning("HTTP/2 requested but 'h2' is not installed; using HTTP/1.1")
+        self.default = AsyncClient(timeout=Timeout(timeout), limits=self.limits, http2=self.http2)
+        self._clients: OrderedDict[str, AsyncClient] = OrderedDict()
+        # число идущих запросов по клиентам и вытесненные клиенты, ждущие их завершения
+        self._in_use: dict[AsyncClient, int] = {}
+        self._retired: set[AsyncClient] = set()
+        self._closing: set[asyncio.Task] = set()
+
+    @staticmethod
+    def _parse_proxies(proxies) -> dict[str, str]:
+        """Строка с адресом прокси, JSON или словарь {"http": ..., "https://": ..., "all://": ...}."""
+        if isinstance(proxies, str):
+            proxies = proxies.strip()
+            if proxies.startswith("{"):
+                proxies = json.loads(proxies)
+            else:
+                return {"all://": proxies}
+        return {(pattern if "://" in pattern else f"{pattern}://"): url for pattern, url in proxies.items() if url}
+
+    def _build(self, proxies: dict[str, str]) -> AsyncClient:
+        mounts = {
+            pattern: AsyncHTTPTransport(proxy=url, limits=self.limits, http2=self.http2, local_address="0.0.0.0")
+            for pattern, url in proxies.items()
+        }
+        return AsyncClient(timeout=Timeout(self.timeout), limits=self.limits, http2=self.http2, mounts=mounts)
+
+    def get(self, proxies=None) -> AsyncClient:
+        if not proxies:
+            return self.default
+        parsed = self._parse_proxies(proxies)
+        if not parsed:
+            return self.default
+        key = json.dumps(parsed, sort_keys=True)
+
+        client = self._clients.get(key)
+        if client is not None:
+            self._clients.move_to_end(key)
+            return client
+
+        client = self._clients[key] = self._build(parsed)
+        while len(self._clients) > self.maxsize:
+            _, evicted = self._clients.popitem(last=False)
+            if evicted in self._in_use:
+                self._retired.add(evicted)
+            else:
+                self._close_in_background(evicted)
+        return client
 
-global_http_client = AsyncClient(
-    timeout=Timeout(30.0),
-    limits=Limits(
-        max_connections=100,           # до 100 одновременных соединений (параллельных)
-        max_keepalive_connections=20   # держать открытыми 20 соединений
-    ),
+    @asynccontextmanager
+    async def lease(self, proxies=None) -> AsyncIterator[AsyncClient]:
+        """Клиент для одного запроса: пока он не завершён, вытесненный клиент не закрывается."""
+        client = self.get(proxies)
+        self._in_use[client] = self._in_use.get(client, 0) + 1
+        try:
+            yield client
+        finally:
+            self._in_use[client] -= 1
+            if not self._in_use[client]:
+                del self._in_use[client]
+                if client in self._retired:
+                    self._retired.discard(client)
+                    self._close_in_background(client)
+
+    def _close_in_background(self, client: AsyncClient) -> None:
+        task = asyncio.create_task(client.aclose())
+        self._closing.add(task)
+        task.add_done_callback(self._closing.discard)
+
+    async def aclose(self) -> None:
+        if self._closing:
+            await asyncio.gather(*self._closing, return_exceptions=True)
+        clients, self._clients = list(self._clients.values()), OrderedDict()
+        retired, self._retired = list(self._retired), set()
+        for client in [self.default, *clients, *retired]:
+            await client.aclose()
+
+
+http_client_pool = HttpClientPool(
+    maxsize=settings.HTTP_CLIENT_POOL_SIZE,
+    timeout=settings.HTTP_CLIENT_TIMEOUT,
+    max_connections=settings.HTTP_MAX_CONNECTIONS,
+    max_keepalive=settings.HTTP_MAX_KEEPALIVE_CONNECTIONS,
+    http2=settings.HTTP_CLIENT_HTTP2,
+)
+global_http_client = http_client_pool.default
+
+# не больше HTTP_MAX_CONNECTIONS_PER_HOST одновременных запросов к одному хосту
+host_scheduler = PartitionedScheduler(
+    max_concurrency=settings.HTTP_MAX_CONNECTIONS,
+    per_key=settings.HTTP_MAX_CONNECTIONS_PER_HOST,
 )
 
 
+def decode_response(response: Response):
+    """Тело ответа по Content-Type: JSON, текст или base64 для бинарных данных."""
+    content_type = response.headers.get("content-type", "").split(";")[0].strip().lower()
+    if not response.content:
+        return None
+    if content_type == "application/json" or content_type.endswith("+json") or not content_type:
+        try:
+            return response.json()
+        except ValueError:
+            return response.text
+    if content_type.startswith("text/") or content_type in _TEXT_TYPES or content_type.endswith("+xml"):
+        return response.text
+    return {
+        "content_type": content_type,
+        "size": len(response.content),
+        "base64": base64.b64encode(response.content).decode(),
+    }
+
+
+async def send_request(method, url, params=None, headers=None, content=None, data=None, json_field=None, files=None,
+                       proxies=None) -> Response:
+    started = time.perf_counter()
+    status_code = None
+    try:
+        async with http_client_pool.lease(proxies) as http_client:
+            response = await host_scheduler.run(
+                urlsplit(url).netloc,
+                lambda: http_client.request(
+                    method, url, params=params, files=files, content=content, json=json_field, data=data,
+                    headers=headers,
+                ),
+            )
+        status_code = response.status_code
+        return response
+    finally:
+        http_client_metrics.observe(str(getattr(method, "value", method)).upper(), status_code,
+                                    time.perf_counter() - started)
+
+
 async def make_request(method, url, params=None, headers=None, content=None, data=None, json_field=None, files=None,
-                       proxies=None) -> dict:
-    http_client = global_http_client
-    if proxies is not None:
-        http_client = AsyncClient(
-            timeout=Timeout(30.0),
-            limits=Limits(
-                max_connections=100,  # до 100 одновременных соединений (параллельных)
-                max_keepalive_connections=20  # держать открытыми 20 соединений
-            ),
-            proxies=proxies,
-            transport=AsyncHTTPTransport(local_address="0.0.0.0")
-        )
-    response: Response = await http_client.request(
-        method, url, params=params, files=files, content=content, json=json_field, data=data, headers=headers,
-    )
-    json_result = {"response": response.json()}
-    return json_result
+                       proxies=None, cache_ttl: int | None = None) -> dict:
+    cacheable = (cache_ttl and str(getattr(method, "value", method)).upper() in CACHEABLE_METHODS
+                 and not (files or content or data or json_field))
+    if not cacheable:
+        response = await send_request(method, url, params, headers, content, data, json_field, files, proxies)
+        return {"response": decode_response(response)}
+
+    async def fetch() -> tuple[dict, int]:
+        response = await send_request(method, url, params, headers, proxies=proxies)
+        ttl = response_ttl(response.status_code, response.headers.get("cache-control"), cache_ttl)
+        return {"response": decode_response(response)}, ttl
+
+    return await response_cache.get_or_fetch(ResponseCache.key(method, url, params, headers, proxies), fetch)
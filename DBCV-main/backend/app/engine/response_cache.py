@@ -0,0 +1,99 @@
+"""
+Кеш ответов внешних запросов (Request) для групп соединений.
+
+Включается на запросе полем `cache_ttl`. Кешируются только GET/HEAD без тела и только
+успешные ответы; Cache-Control ответа учитывается (no-store/no-cache/private - не кешировать,
+max-age сокращает TTL). Одинаковые запросы, выполняемые одновременно, объединяются:
+в процессе - общей задачей, между процессами - блокировкой в Redis.
+"""
+import asyncio
+import hashlib
+import json
+import logging
+from copy import deepcopy
+from typing import Any, Awaitable, Callable
+
+from redis.asyncio import Redis
+
+from app.config import settings
+from app.managers.codecs import cache_codec
+from app.managers.data_manager import redis_lock
+from app.metrics.cache import cache_metrics
+
+logger = logging.getLogger(__name__)
+
+CACHEABLE_METHODS = ("GET", "HEAD")
+_NO_CACHE_DIRECTIVES = {"no-store", "no-cache", "private"}
+
+
+def response_ttl(status_code: int, cache_control: str | None, ttl: int) -> int:
+    """Сколько секунд можно хранить ответ с учётом статуса и Cache-Control."""
+    if not 200 <= status_code < 300:
+        return 0
+    for directive in (cache_control or "").lower().split(","):
+        name, _, value = directive.strip().partition("=")
+        if name in _NO_CACHE_DIRECTIVES:
+            return 0
+        if name in ("max-age", "s-maxage"):
+            try:
+                ttl = min(ttl, int(value.strip('"')))
+            except ValueError:
+                pass
+    return max(ttl, 0)
+
+
+class ResponseCache:
+    def __init__(self, redis: Redis):
+        self.redis = redis
+        self.codec = cache_codec
+        self._inflight: dict[str, asyncio.Task] = {}
+
+    @staticmethod
+    def key(method: str, url: str, params: Any, headers: Any, proxies: Any = None) -> str:
+        # заголовки (в том числе Authorization) входят в ключ только хешем
+        raw = json.dumps([method.upper(), url, params, headers, proxies], sort_keys=True, default=str)
+        return "http:response:" + hashlib.blake2b(raw.encode("utf-8"), digest_size=16).hexdigest()
+
+    async def _get(self, key: str) -> dict | None:
+        try:
+            cached = await self.redis.get(self.codec.key(key))
+        except Exception as e:
+            logger.warning(f"Response cache unavailable: {e}")
+            return None
+        return self.codec.loads(cached) if cached else None
+
+    async def _fetch(self, key: str, fetch: Callable[[], Awaitable[tuple[dict, int]]]) -> dict:
+        async with redis_lock(self.redis, key):
+            # ответ мог сохранить другой процесс, пока мы ждали блокировку
+            cached = await self._get(key)
+            if cached is not None:
+                return cached
+            result, ttl = await fetch()
+            if ttl > 0:
+                try:
+                    await self.redis.set(self.codec.key(key), self.codec.dumps(result), ex=ttl)
+                except Exception as e:
+                    logger.warning(f"Failed to cache response {key}: {e}")
+            return result
+
+    async def get_or_fetch(self, key: str, fetch: Callable[[], Awaitable[tuple[dict, int]]]) -> dict:
+        """fetch возвращает (результат, TTL); TTL 0 - результат не сохраняется."""
+        cached = await self._get(key)
+        if cached is not None:
+            logger.debug(f"Response cache hit: {key}")
+            cache_metrics.hit("response", key)
+            return cached
+
+        task = self._inflight.get(key)
+        if task is not None:
+            cache_metrics.observe("response", key, "coalesced")
+        else:
+            cache_metrics.miss("response", key)
+            task = asyncio.create_task(self._fetch(key, fetch))
+            self._inflight[key] = task
+            task.add_done_callback(lambda _: self._inflight.pop(key, None))
+        # результат общий для всех ожидающих: каждому своя копия
+        return deepcopy(await asyncio.shield(task))
+
+
+response_cache = ResponseCache(Redis.from_url(settings.CACHE_REDIS_URL))
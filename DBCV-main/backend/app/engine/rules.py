@@ -0,0 +1,139 @@
+"""
+Предкомпилированные правила переходов (формат jqqb).
+
+Правила разбираются один раз при компиляции графа бота. Узлы без плейсхолдеров
+`{$var$}` превращаются в готовые `CompiledRule`/`CompiledRuleGroup`; узлы с плейсхолдерами
+подставляют переменные при вычислении и кешируют собранное правило по значениям слотов.
+"""
+import json
+from abc import ABC, abstractmethod
+from collections import OrderedDict
+from typing import Any, Optional
+
+from app.engine.variables import extract_variable_names, render_variables, variable_substitution, VARIABLE_PATTERN
+from app.jqqb import CompiledRuleGroup
+from app.utils.dict import get_value_by_list_keys
+
+SLOT_CACHE_SIZE = 64
+
+
+def _has_slots(node: Any) -> bool:
+    return bool(VARIABLE_PATTERN.search(json.dumps(node, ensure_ascii=False, default=str)))
+
+
+def _slot_key(values: tuple) -> Any:
+    # 1, 1.0 и True равны как ключи словаря, но подставляются в правило по-разному
+    values = tuple((type(value).__name__, value) for value in values)
+    try:
+        hash(values)
+        return values
+    except TypeError:
+        return json.dumps(values, sort_keys=True, ensure_ascii=False, default=str)
+
+
+class CompiledRules(ABC):
+    """Предикат, проверяющий контекст на соответствие правилам."""
+
+    @abstractmethod
+    async def matches(self, context: dict) -> bool:
+        pass
+
+
+class StaticRules(CompiledRules):
+    def __init__(self, rules: dict):
+        self.rule = CompiledRuleGroup.get_rule_object(rules)
+
+    def evaluate(self, context: dict) -> bool:
+        return self.rule.evaluate(context)
+
+    async def matches(self, context: dict) -> bool:
+        return self.rule.evaluate(context)
+
+
+class SlotRules(CompiledRules):
+    """Узел с плейсхолдерами: подставляются только значения слотов."""
+
+    def __init__(self, rules: dict):
+        self.rules = rules
+        self.slots = tuple(sorted(extract_variable_names(json.dumps(rules, ensure_ascii=False, default=str)) or ()))
+        self._slot_paths = tuple(slot.split(".") for slot in self.slots)
+        self._cache: OrderedDict[Any, StaticRules] = OrderedDict()
+
+    def resolve(self, context: dict) -> StaticRules:
+        key = _slot_key(tuple(get_value_by_list_keys(context, path) for path in self._slot_paths))
+        compiled = self._cache.get(key)
+        if compiled is not None:
+            self._cache.move_to_end(key)
+            return compiled
+
+        compiled = StaticRules(render_variables(self.rules, context))
+        self._cache[key] = compiled
+        if len(self._cache) > SLOT_CACHE_SIZE:
+            self._cache.popitem(last=False)
+        return compiled
+
+    async def matches(self, context: dict) -> bool:
+        return self.resolve(context).evaluate(context)
+
+
+class GroupRules(CompiledRules):
+    """Группа, часть дочерних узлов которой содержит плейсхолдеры."""
+
+    def __init__(self, rules: dict):
+        self.condition = rules['condition']
+        self.children = tuple(_compile_node(rule) for rule in rules['rules'])
+
+    async def matches(self, context: dict) -> bool:
+        if self.condition == 'AND':
+            for child in self.children:
+                if not await child.matches(context):
+                    return False
+            return True
+        for child in self.children:
+            if await child.matches(context):
+                return True
+        return False
+
+
+class RawRules(CompiledRules):
+    """Правила, не являющиеся валидным JSON до подстановки: обрабатываются по-старому."""
+
+    def __init__(self, rules: str):
+        self.rules = rules
+
+    async def matches(self, context: dict) -> bool:
+        rules = json.loads(await variable_substitution(self.rules, context))
+        return CompiledRuleGroup.get_rule_object(rules).evaluate(context)
+
+
+class InvalidRules(CompiledRules):
+    """Правила, которые не удалось скомпилировать: ошибка поднимается при вычислении."""
+
+    def __init__(self, error: Exception):
+        self.error = error
+
+    async def matches(self, context: dict) -> bool:
+        raise self.error
+
+
+def _compile_node(rules: dict) -> CompiledRules:
+    if not _has_slots(rules):
+        return StaticRules(rules)
+    if isinstance(rules.get('rules'), list) and not _has_slots(rules.get('condition')):
+        return GroupRules(rules)
+    return SlotRules(rules)
+
+
+def compile_rules(rules: Any) -> Optional[CompiledRules]:
+    """Компилирует правила связи (dict или JSON-строку) в переиспользуемый предикат."""
+    if not rules:
+        return None
+    if isinstance(rules, str):
+        try:
+            rules = json.loads(rules)
+        except json.JSONDecodeError:
+            return RawRules(rules)
+    try:
+        return _compile_node(rules)
+    except Exception as e:
+        return InvalidRules(e)
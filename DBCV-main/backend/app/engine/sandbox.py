@@ -0,0 +1,452 @@
+"""
+Окружение выполнения пользовательского кода шагов.
+
+Код компилируется один раз (кеш по хешу исходника), глобальные имена собираются
+для каждого вызова поверх общего `safe_globals` без его изменения, а переменные
+передаются в код обёрткой, которая копирует значение при первом обращении к нему.
+При CODE_EXECUTION_BACKEND=process нетривиальный код выполняется в отдельных процессах.
+"""
+import ast
+import asyncio
+import hashlib
+import multiprocessing
+import os
+import signal
+import threading
+import time
+import traceback
+from collections import OrderedDict
+from contextlib import contextmanager
+from copy import deepcopy
+from functools import lru_cache
+from types import CodeType
+from typing import Any, Callable, Iterator
+
+try:
+    import resource
+except ImportError:
+    resource = None
+
+from app.config import settings
+from app.engine.safe_env import safe_globals
+
+CODE_FILENAME = "<bot-code>"
+
+_BASE_GLOBALS = {"__builtins__": None, **safe_globals}
+
+
+class CodeCache:
+    """LRU-кеш скомпилированного кода по blake2b-хешу исходника."""
+
+    def __init__(self, maxsize: int):
+        self.maxsize = maxsize
+        self._items: OrderedDict[str, CodeType] = OrderedDict()
+
+    def get(self, code: str) -> CodeType:
+        key = hashlib.blake2b(code.encode("utf-8"), digest_size=16).hexdigest()
+        compiled = self._items.get(key)
+        if compiled is not None:
+            self._items.move_to_end(key)
+            return compiled
+        compiled = compile(code, CODE_FILENAME, "exec")
+        self._items[key] = compiled
+        if len(self._items) > self.maxsize:
+            self._items.popitem(last=False)
+        return compiled
+
+    def clear(self) -> None:
+        self._items.clear()
+
+
+code_cache = CodeCache(settings.CODE_CACHE_SIZE)
+
+
+def build_globals(print_func: Callable) -> dict[str, Any]:
+    """Глобальные имена для одного выполнения: общий `safe_globals` не изменяется."""
+    available_globals = _BASE_GLOBALS.copy()
+    available_globals["print"] = print_func
+    return available_globals
+
+
+class CopyOnAccessDict(dict):
+    """
+    Переменные для пользовательского кода, изолированные от исходника лениво.
+    Хранилище сначала ссылается на исходные значения; значение копируется при первом обращении
+    к ключу (вложенный словарь - такой же обёрткой, прочие изменяемые - deepcopy), ключи,
+    которые код не трогал, не копируются. Все пути чтения идут через __getitem__: переопределённый
+    __iter__ отключает быстрые пути CPython для dict(x), {**x}, f(**x) и x | y.
+    """
+    __slots__ = ("_shared",)
+
+    def __init__(self, source=()):
+        if isinstance(source, CopyOnAccessDict):
+            source = dict.items(source)
+        super().__init__(source)
+        # ключи, значения которых ещё общие с исходником
+        self._shared = set(dict.keys(self))
+
+    def __getitem__(self, key):
+        value = dict.__getitem__(self, key)
+        if key in self._shared:
+            value = _isolate(value)
+            dict.__setitem__(self, key, value)
+            self._shared.discard(key)
+        return value
+
+    def __setitem__(self, key, value):
+        dict.__setitem__(self, key, value)
+        self._shared.discard(key)
+
+    def __delitem__(self, key):
+        dict.__delitem__(self, key)
+        self._shared.discard(key)
+
+    def __iter__(self):
+        return dict.__iter__(self)
+
+    def get(self, key, default=None):
+        return self[key] if key in self else default
+
+    def setdefault(self, key, default=None):
+        if key in self:
+            return self[key]
+        self[key] = default
+        return default
+
+    def pop(self, key, *default):
+        if key in self:
+            value = self[key]
+            del self[key]
+            return value
+        return dict.pop(self, key, *default)
+
+    def popitem(self):
+        if not self:
+            raise KeyError("popitem(): dictionary is empty")
+        key = next(reversed(dict.keys(self)))
+        return key, self.pop(key)
+
+    def _materialize(self) -> None:
+        for key in list(self._shared):
+            self[key]
+
+    def values(self):
+        self._materialize()
+        return dict.values(self)
+
+    def items(self):
+        self._materialize()
+        return dict.items(self)
+
+    def update(self, *args, **kwargs):
+        for key, value in dict(*args, **kwargs).items():
+            self[key] = value
+
+    def clear(self):
+        dict.clear(self)
+        self._shared.clear()
+
+    def __ior__(self, other):
+        self.update(other)
+        return self
+
+    def __or__(self, other):
+        if not isinstance(other, dict):
+            return NotImplemented
+        merged = dict(self)
+        merged.update(other)
+        return merged
+
+    def __ror__(self, other):
+        if not isinstance(other, dict):
+            return NotImplemented
+        merged = dict(other)
+        merged.update(self)
+        return merged
+
+    def copy(self):
+        return CopyOnAccessDict(self)
+
+    def __copy__(self):
+        return self.copy()
+
+    def __deepcopy__(self, memo):
+        return deepcopy(dict(self), memo)
+
+    def __reduce__(self):
+        return dict, (dict(self),)
+
+    def raw(self) -> dict:
+        """Значения без копирования - для передачи в процесс пула, где изоляцию даёт сериализация."""
+        return dict(dict.items(self))
+
+
+_IMMUTABLE = (str, int, float, bool, bytes, type(None))
+
+
+def _isolate(value):
+    if type(value) is dict or isinstance(value, CopyOnAccessDict):
+        return CopyOnAccessDict(value)
+    if isinstance(value, _IMMUTABLE):
+        return value
+    return deepcopy(value)
+
+
+_LOOP_NODES = (ast.For, ast.AsyncFor, ast.While, ast.ListComp, ast.SetComp, ast.DictComp, ast.GeneratorExp)
+
+# вызовы, которые и без цикла в коде перебирают произвольно большие последовательности:
+# itertools и statistics из safe_globals, агрегаты встроенных функций, range
+_HEAVY_CALLS = frozenset(
+    name for name, value in safe_globals.items()
+    if getattr(value, "__module__", None) in ("itertools", "statistics")
+) | {"range", "sum", "sorted", "max", "min"}
+
+
+def _is_heavy(node: ast.AST) -> bool:
+    if isinstance(node, _LOOP_NODES):
+        return True
+    if isinstance(node, ast.BinOp) and isinstance(node.op, ast.Pow):
+        return True
+    return isinstance(node, ast.Call) and isinstance(node.func, ast.Name) and node.func.id in _HEAVY_CALLS
+
+
+@lru_cache(maxsize=1024)
+def is_trivial(code: str) -> bool:
+    """
+    Короткий код без циклов, генераторов, возведения в степень и вызовов из _HEAVY_CALLS
+    выгоднее выполнить в текущем процессе. Код с синтаксической ошибкой тривиальным не считается.
+    """
+    if len(code) > settings.CODE_INLINE_MAX_LENGTH:
+        return False
+    try:
+        tree = ast.parse(code)
+    except SyntaxError:
+        return False
+    return not any(_is_heavy(node) for node in ast.walk(tree))
+
+
+class CodeTimeoutError(Exception):
+    pass
+
+
+class InlineDeadlines:
+    """
+    Ограничение времени кода, выполняемого прямо в event loop воркера.
+    asyncio.wait_for прерывает код только на await, поэтому по SIGALRM обработчик проходит
+    по стеку текущего кадра: если там код шага с истёкшим сроком (кадры узнаются по словарю
+    глобальных имён выполнения), в нём поднимается CodeTimeoutError. Пока код перехватывает
+    исключение, сигнал повторяется. Сигналы доступны только в главном потоке; в других
+    потоках и на платформах без setitimer остаётся лишь ограничение wait_for.
+    """
+    RETRY_INTERVAL = 0.01
+
+    def __init__(self):
+        self._deadlines: dict[int, float] = {}
+        self._installed = False
+
+    def _available(self) -> bool:
+        return hasattr(signal, "setitimer") and threading.current_thread() is threading.main_thread()
+
+    @contextmanager
+    def limit(self, code_globals: dict, timeout: float) -> Iterator[None]:
+        if not self._available():
+            yield
+            return
+        if not self._installed:
+            signal.signal(signal.SIGALRM, self._on_alarm)
+            self._installed = True
+        self._deadlines[id(code_globals)] = time.monotonic() + timeout
+        self._arm()
+        try:
+            yield
+        finally:
+            self._deadlines.pop(id(code_globals), None)
+            self._arm()
+
+    def _arm(self) -> None:
+        if not self._deadlines:
+            signal.setitimer(signal.ITIMER_REAL, 0)
+            return
+        delay = min(self._deadlines.values()) - time.monotonic()
+        signal.setitimer(signal.ITIMER_REAL, max(delay, self.RETRY_INTERVAL))
+
+    def _on_alarm(self, signum, frame) -> None:
+        now = time.monotonic()
+        self._arm()
+        while frame is not None:
+            deadline = self._deadlines.get(id(frame.f_globals))
+            if deadline is not None and deadline <= now:
+                raise CodeTimeoutError("превышено время выполнения")
+            frame = frame.f_back
+
+
+inline_deadlines = InlineDeadlines()
+
+
+def _init_worker(memory_limit_mb: int) -> None:
+    if memory_limit_mb > 0 and resource is not None:
+        limit = memory_limit_mb * 1024 * 1024
+        resource.setrlimit(resource.RLIMIT_AS, (limit, limit))
+
+
+def _on_cpu_timeout(signum, frame):
+    raise CodeTimeoutError("превышено время выполнения")
+
+
+def _run_in_worker(code: str, context: dict, variables: dict, timeout: float) -> tuple[Any, list[str], str | None]:
+    """Выполняется в процессе пула: результат main, напечатанные строки и текст ошибки."""
+    printed: list[str] = []
+
+    async def print_func(*args, sep=' ', end='\n'):
+        printed.append((sep.join(str(arg) for arg in args) + end).rstrip('\n'))
+
+    available_variables = {}
+    # ITIMER_PROF считает процессорное время: прерывает и синхронные циклы
+    signal.signal(signal.SIGPROF, _on_cpu_timeout)
+    signal.setitimer(signal.ITIMER_PROF, timeout)
+    try:
+        exec(code_cache.get(code), build_globals(print_func), available_variables)
+        if 'main' not in available_variables:
+            return context, printed, "Error: функция 'main' не определена."
+        loop = asyncio.new_event_loop()
+        try:
+            result = loop.run_until_complete(available_variables['main'](context, variables=variables))
+        finally:
+            loop.close()
+        return result, printed, None
+    except CodeTimeoutError:
+        return context, printed, f"Execution error: превышено время выполнения ({timeout} с)"
+    except MemoryError:
+        return context, printed, "Execution error: превышен лимит памяти"
+    except Exception as e:
+        return context, printed, "Execution error:\n" + "".join(traceback.format_exception(type(e), e, e.__traceback__))
+    finally:
+        signal.setitimer(signal.ITIMER_PROF, 0)
+
+
+def _worker_main(conn, memory_limit_mb: int) -> None:
+    """Цикл процесса-исполнителя: задание из канала - результат обратно, пустое задание - прогрев."""
+    _init_worker(memory_limit_mb)
+    while True:
+        try:
+            job = conn.recv()
+        except EOFError:
+            return
+        if job is None:
+            return
+        if not job:
+            conn.send(None)
+            continue
+        code, context, variables, timeout = job
+        try:
+            conn.send(_run_in_worker(code, context, variables, timeout))
+        except Exception as e:
+            # например, результат main не сериализуется
+            conn.send((context, [], f"Execution error: {e!r}"))
+
+
+class CodeWorker:
+    """Один процесс-исполнитель с каналом заданий; зависший процесс завершается отдельно от остальных."""
+
+    def __init__(self, memory_limit_mb: int):
+        context = multiprocessing.get_context("spawn")
+        self.conn, child_conn = context.Pipe()
+        self.process = context.Process(target=_worker_main, args=(child_conn, memory_limit_mb), daemon=True)
+        self.process.start()
+        child_conn.close()
+
+    async def call(self, job: tuple, timeout: float):
+        self.conn.send(job)
+        loop = asyncio.get_running_loop()
+        return await asyncio.wait_for(loop.run_in_executor(None, self.conn.recv), timeout=timeout)
+
+    def kill(self) -> None:
+        if self.process.is_alive():
+            self.process.kill()
+        self.process.join(timeout=1)
+        self.conn.close()
+
+
+class ProcessCodeRunner:
+    """
+    Процессы для пользовательского кода: изоляция event loop воркера и использование всех ядер.
+    Контекст и переменные передаются сериализованными, результат возвращается так же.
+    Задание ждёт свободный процесс под семафором; отсчёт запасного таймаута начинается,
+    когда задание отправлено процессу, и при его срабатывании завершается только этот процесс.
+    """
+
+    def __init__(self, workers: int, memory_limit_mb: int, timeout: float):
+        self.workers = workers
+        self.memory_limit_mb = memory_limit_mb
+        self.timeout = timeout
+        # запас сверх таймаута в процессе: сериализация и await в коде (ITIMER_PROF их не считает)
+        self.backstop_margin = 5.0
+        self._idle: list[CodeWorker] = []
+        self._workers: set[CodeWorker] = set()
+        self._slots: asyncio.Semaphore | None = None
+
+    @property
+    def slots(self) -> asyncio.Semaphore:
+        if self._slots is None:
+            self._slots = asyncio.Semaphore(self.workers)
+        return self._slots
+
+    def _acquire(self) -> CodeWorker:
+        if self._idle:
+            return self._idle.pop()
+        worker = CodeWorker(self.memory_limit_mb)
+        self._workers.add(worker)
+        return worker
+
+    def _kill(self, worker: CodeWorker) -> None:
+        self._workers.discard(worker)
+        worker.kill()
+
+    async def warm_up(self) -> None:
+        await asyncio.gather(*[self._warm_up_worker() for _ in range(self.workers)])
+
+    async def _warm_up_worker(self) -> None:
+        async with self.slots:
+            worker = self._acquire()
+            try:
+                # процесс spawn импортирует модули приложения: первый ответ может идти долго
+                await worker.call((), timeout=60)
+            except (asyncio.TimeoutError, EOFError, OSError):
+                self._kill(worker)
+                raise
+            self._idle.append(worker)
+
+    async def run(self, code: str, context: dict, variables: dict) -> tuple[Any, list[str], str | None]:
+        async with self.slots:
+            worker = self._acquire()
+            try:
+                result = await worker.call((code, context, dict(variables), self.timeout),
+                                           timeout=self.timeout + self.backstop_margin)
+            except asyncio.TimeoutError:
+                self._kill(worker)
+                return context, [], f"Execution error: превышено время выполнения ({self.timeout} с)"
+            except asyncio.CancelledError:
+                # процесс занят брошенным заданием: вернуть его в пул нельзя
+                self._kill(worker)
+                raise
+            except (EOFError, OSError):
+                self._kill(worker)
+                return context, [], "Execution error: процесс выполнения кода аварийно завершился"
+            except Exception as e:
+                # задание не сериализовалось и не было отправлено: процесс исправен
+                self._idle.append(worker)
+                return context, [], f"Execution error: {e!r}"
+            self._idle.append(worker)
+            return result
+
+    def shutdown(self) -> None:
+        workers, self._workers, self._idle = self._workers, set(), []
+        for worker in workers:
+            worker.kill()
+
+
+process_code_runner = ProcessCodeRunner(
+    workers=settings.CODE_PROCESS_POOL_SIZE or os.cpu_count() or 1,
+    memory_limit_mb=settings.CODE_PROCESS_MEMORY_LIMIT_MB,
+    timeout=settings.CODE_EXECUTION_TIMEOUT,
+)
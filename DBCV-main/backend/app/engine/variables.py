@@ -1,5 +1,6 @@
 import json
 import logging
+from copy import deepcopy
 from typing import Any, Dict, List, Union, Optional, Tuple, Type
 from sqlalchemy.ext.asyncio import AsyncSession
 
@@ -34,80 +35,146 @@ async def variable_loader(
     return value
 
 
-async def replace_variables_universal(
-        data: Union[str, List[Any], Dict[str, Any]] = {},
+class TemplateSlot:
+    __slots__ = ("name", "path")
+
+    def __init__(self, name: str):
+        self.name = name
+        self.path = tuple(name.split("."))
+
+
+class CompiledTemplate:
+    """
+    Строка, разобранная на литералы и слоты {$variable_name$}.
+    Разбирается один раз (см. compile_template) и рендерится за один проход.
+    """
+    __slots__ = ("text", "parts", "names", "whole")
+
+    def __init__(self, text: str):
+        parts: List[Union[str, TemplateSlot]] = []
+        position = 0
+        for match in VARIABLE_PATTERN.finditer(text):
+            if match.start() > position:
+                parts.append(text[position:match.start()])
+            parts.append(TemplateSlot(match.group(1)))
+            position = match.end()
+        if position < len(text):
+            parts.append(text[position:])
+
+        self.text = text
+        self.parts = tuple(parts)
+        self.names = tuple(dict.fromkeys(p.name for p in parts if isinstance(p, TemplateSlot)))
+        # Вся строка - один плейсхолдер: значение можно вернуть без сериализации
+        self.whole = parts[0] if len(parts) == 1 and isinstance(parts[0], TemplateSlot) else None
+
+    @property
+    def is_static(self) -> bool:
+        return not self.names
+
+    def render(self, context: Dict[str, Any] | None) -> Any:
+        if not self.names:
+            return self.text
+        if self.whole is not None:
+            return _typed_value(_lookup(context, self.whole.path))
+
+        rendered = "".join(
+            part if isinstance(part, str) else _stringify(_lookup(context, part.path))
+            for part in self.parts
+        )
+        return _maybe_json(rendered)
+
+
+# Первые символы, с которых может начинаться JSON-документ
+_JSON_START = frozenset('{["-0123456789tfnNI')
+
+
+def _lookup(context: Dict[str, Any] | None, path: Tuple[str, ...]) -> Any:
+    if not context:
+        return None
+    return get_value_by_list_keys(context, path)
+
+
+def _stringify(value: Any) -> str:
+    if isinstance(value, (dict, list)):
+        return json.dumps(value, ensure_ascii=False)
+    if value is None:
+        return ""
+    return str(value)
+
+
+def _maybe_json(text: str) -> Any:
+    """Пытается получить из строки JSON, не бросая исключение там, где JSON быть не может."""
+    stripped = text.lstrip()
+    if not stripped or stripped[0] not in _JSON_START:
+        return text
+    try:
+        return json.loads(text)
+    except json.JSONDecodeError:
+        return text
+
+
+def _typed_value(value: Any) -> Any:
+    """
+    Значение для строки, целиком состоящей из одного плейсхолдера.
+    Словари и списки возвращаются копией (как раньше после JSON), числа - как есть; строки,
+    как и раньше, декодируются из JSON, если это возможно; остальные типы приводятся к строке.
+    """
+    if isinstance(value, (dict, list)):
+        return deepcopy(value)
+    if isinstance(value, (int, float)) and not isinstance(value, bool):
+        return value
+    if isinstance(value, str):
+        return _maybe_json(value)
+    return _maybe_json(_stringify(value))
+
+
+# Строки длиннее этого порога компилируются без кеширования, чтобы кеш не удерживал большие payload'ы
+TEMPLATE_CACHE_MAX_LENGTH = 8192
+
+
+@lru_cache(maxsize=4096)
+def _compile_template_cached(text: str) -> CompiledTemplate:
+    return CompiledTemplate(text)
+
+
+def compile_template(text: str) -> CompiledTemplate:
+    """Возвращает скомпилированный шаблон строки (с кешированием)."""
+    if len(text) > TEMPLATE_CACHE_MAX_LENGTH:
+        return CompiledTemplate(text)
+    return _compile_template_cached(text)
+
+
+def render_variables(
+        data: Union[str, List[Any], Dict[str, Any]],
         context: Dict[str, Any] | None = None
 ) -> Union[str, List[Any], Dict[str, Any]]:
     """
     Рекурсивно заменяет переменные в формате {$variable_name$} в строке, списке или словаре
-    на соответствующие значения, полученные с помощью функции variable_loader.
-    """
-
-    def replace_in_string(text: str, replacements: Dict[str, Any]) -> str:
-        """
-        Заменяет переменные в строке, используя предоставленные значения.
-        """
-
-        def replace_match(match: re.Match) -> str:
-            """
-            Внутренняя функция для обработки одного совпадения переменной.
-            """
-            variable_name = match.group(1)
-            # Ensure the value is JSON encoded only if it's not a primitive or collection type
-            value = replacements[variable_name]
-            if isinstance(value, (dict, list)):
-                return json.dumps(value, ensure_ascii=False)  # Encode for complex types
-            else:
-                if value is None:
-                    return ""
-                return str(value)  # Ensure it is still represented as string in the target data
-
-        return VARIABLE_PATTERN.sub(replace_match, text)  # Returns origin Type
-
+    на соответствующие значения из контекста.
+    """
     if isinstance(data, str):
-        # 1. Extract replace map
-        variable_names = extract_variable_names(data)  # Extract map to go through.
-        if variable_names:
-            replacements: Dict[str, Any] = {}
-            for variable_name in variable_names:  # Go through variable names
-                value = await variable_loader(variable_name, context)  # Load values from variable loader, Passing context
-                replacements[variable_name] = value
-
-            new_string = replace_in_string(data, replacements)  # Returns origin Type
-            # Now we attempt to convert this to JSON or leave it be
-
-            if isinstance(new_string, str):  # This is only done IF new Type == str
-                try:
-                    return json.loads(new_string)  # Try to get back a JSON if you can
-                except json.JSONDecodeError as e:
-                    return new_string  # return String if cant
-            else:
-                return new_string  # We have JSON - no need to string it.
-        return data  # Return data if No variables where found!
+        return compile_template(data).render(context)
 
     elif isinstance(data, list):
-        new_list: List[Any] = []
-        for item in data:
-            # Рекурсивно обрабатываем каждый элемент списка.
-            new_list.append(
-                await replace_variables_universal(item, context))
-        return new_list
+        return [render_variables(item, context) for item in data]
 
     elif isinstance(data, dict):
-        new_dict: Dict[str, Any] = {}
-        for key, value in data.items():
-            # Process Key
-            new_key = key
-            if isinstance(key, str):
-                # Рекурсивно обрабатываем ключ, если он строка.
-                new_key = await replace_variables_universal(key, context)
+        return {
+            (compile_template(key).render(context) if isinstance(key, str) else key): render_variables(value, context)
+            for key, value in data.items()
+        }
 
-            # Рекурсивно обрабатываем значение.
-            new_dict[new_key] = await replace_variables_universal(value, context)
+    return data
 
-        return new_dict
 
-    return data
+async def replace_variables_universal(
+        data: Union[str, List[Any], Dict[str, Any]] = {},
+        context: Dict[str, Any] | None = None
+) -> Union[str, List[Any], Dict[str, Any]]:
+    """
+    Асинхронная обёртка над render_variables, сохранённая для совместимости.
+    """
+    return render_variables(data, context)
 
 
 def extract_variable_names(text: str) -> Optional[List[str]]:
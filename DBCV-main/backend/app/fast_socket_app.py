@@ -9,6 +9,8 @@ from app.schemas import rebuild_models
 from app.api.routes.sockets import notify_channel, notify_bot
 from app.schemas.message import MessagePublic
 from app.broker import broker
+from app.utils.tracing import TRACE_FIELD, span
+from app.utils.ws_routing import NODE_ID, node_channel, ws_router
 
 logging.config.dictConfig(LOGGING_CONFIG)
 rebuild_models()
@@ -17,28 +19,48 @@ logger = logging.getLogger(__name__)
 fast_socket_app = FastStream(broker)
 
 
-@broker.subscriber("message_queue")
-async def handle_channel_message(msg: dict):
+async def deliver_channel_message(msg: dict):
     try:
         channel_id = msg["channel_id"]
-        message_data = MessagePublic(**msg["message"])
-        await notify_channel(channel_id, message_data)
+        with span("ws.deliver", carrier=msg.get(TRACE_FIELD), channel_id=channel_id):
+            message_data = MessagePublic(**msg["message"])
+            await notify_channel(channel_id, message_data)
     except Exception as e:
         logger.error(f"[ERROR][message_queue] {e}")
 
 
-@broker.subscriber("bot_message_queue")
-async def handle_bot_message(msg: dict):
+async def deliver_bot_message(msg: dict):
     try:
         bot_id = msg["bot_id"]
-        message_data = msg["message"]
-        await notify_bot(bot_id, message_data)
+        # BotLogger отправляет записи пачкой, клиенту они уходят по одной, как раньше
+        for message_data in msg.get("messages") or [msg["message"]]:
+            await notify_bot(bot_id, message_data)
     except Exception as e:
         logger.error(f"[ERROR][bot_message_queue] {e}")
 
 
+# общие каналы режима WS_ROUTING=broadcast (по умолчанию)
+@broker.subscriber("message_queue")
+async def handle_channel_message(msg: dict):
+    await deliver_channel_message(msg)
+
+
+@broker.subscriber("bot_message_queue")
+async def handle_bot_message(msg: dict):
+    await deliver_bot_message(msg)
+
+
+# канал этого узла: уведомления только для сущностей, к которым здесь есть подключения
+@broker.subscriber(node_channel(NODE_ID))
+async def handle_node_message(msg: dict):
+    if msg.get("kind") == "bot":
+        await deliver_bot_message(msg)
+    else:
+        await deliver_channel_message(msg)
+
+
 async def publish_bot_message(bot_id: str, message: dict):
-    await broker.publish({"bot_id": bot_id, "message": message}, "bot_message_queue")
+    await ws_router.publish("bot", str(bot_id), {"bot_id": bot_id, "message": message})
 
 
 if __name__ == "__main__":
@@ -1,14 +1,26 @@
 ﻿import asyncio
 import logging
 import os
+import time
 from uuid import uuid4
 
 from faststream import FastStream
 from faststream.redis import StreamSub
+from prometheus_client import start_http_server
 from app.broker import broker
 from app.schemas import rebuild_models
 from app.config import settings
-from app.engine.bot_processor import check_message
+from app.database import sessionmanager
+from app.engine.bot_processor import check_message, redis as cache_redis
+from app.engine.request import http_client_pool
+from app.engine.sandbox import process_code_runner
+from app.services.s3_client import s3_clients
+from app.managers.data_manager import DataManager
+from app.managers.local_cache import local_cache
+from app.metrics.streams import stream_metrics
+from app.utils.partitioned import PartitionedScheduler
+from app.utils.streams import PendingRecovery
+from app.utils.tracing import setup_tracing, shutdown_tracing, span, TRACE_FIELD
 from redis.asyncio import Redis
 
 import logging.config
@@ -23,7 +35,7 @@ consumer_id = f"{role}-consumer-{uuid4()}"
 
 app = FastStream(broker)
 
-semaphore = asyncio.Semaphore(settings.DB_POOL_SIZE)
+scheduler = PartitionedScheduler(settings.WORKER_MAX_CONCURRENCY, settings.WORKER_KEY_CONCURRENCY)
 
 
 async def handle_message(message_data):
@@ -34,28 +46,47 @@ async def handle_message(message_data):
         logger.error(f"handle_message: invalid message_data: {message_data} | {e}")
         return
 
-    await check_message(message, channel_id)
+    with span("worker.check_message", carrier=message_data.get(TRACE_FIELD), role=role, channel_id=channel_id):
+        await check_message(message, channel_id)
+
+
+def partition_key(message_data):
+    """
+    Ключ очерёдности: (отправитель, канал). Получатель в ключ не входит: сообщение без получателя
+    запускает бота по умолчанию и всех ботов-подписчиков, и параллельно с адресными сообщениями
+    тем же ботам они читали бы и писали одну сессию и переменные.
+    """
+    try:
+        message = message_data["message"].get("message") or {}
+        return message.get("sender_id"), message_data.get("channel_id")
+    except (KeyError, TypeError, AttributeError):
+        return "unkeyed", id(message_data)
 
 
 async def process_batch(messages, stream_name, group_name, from_claim=False):
+    started = time.perf_counter()
+    failed = 0
+
     async def process_one_safe(m):
-        async with semaphore:
-            try:
-                if from_claim:
-                    msg_id, payload = m
-                    await handle_message(payload)
-                    return msg_id
-                else:
-                    if isinstance(m.get("channel_id"), str) and m.get("channel_id") == "init":
-                        logger.debug("Skipping init message")
-                        return
-                    await handle_message(m)
-                    return None
-            except Exception:
-                logger.exception("Failed to process message")
-                return None
-
-    results = await asyncio.gather(*[process_one_safe(m) for m in messages])
+        nonlocal failed
+        msg_id, payload = m if from_claim else (None, m)
+        try:
+            if isinstance(payload, dict) and payload.get("channel_id") == "init":
+                logger.debug("Skipping init message")
+                return msg_id
+            await handle_message(payload)
+            return msg_id
+        except Exception:
+            failed += 1
+            logger.exception("Failed to process message")
+            return None
+
+    results = await scheduler.run_all(
+        messages,
+        key=lambda m: partition_key(m[1] if from_claim else m),
+        func=process_one_safe,
+    )
+    stream_metrics.observe_batch(stream_name, len(messages), failed, time.perf_counter() - started)
 
     if from_claim:
         ack_ids = [msg_id for msg_id in results if msg_id]
@@ -70,7 +101,7 @@ if role == "user":
         group=settings.USER_STREAM_GROUP,
         consumer=consumer_id,
         batch=True,
-        max_records=100,
+        max_records=settings.STREAM_MAX_RECORDS,
         no_ack=False))
     async def handle_user_message(messages):
         logger.info(f"Received {len(messages)} user messages")
@@ -83,7 +114,7 @@ elif role == "bot":
         group=settings.BOT_STREAM_GROUP,
         consumer=consumer_id,
         batch=True,
-        max_records=100,
+        max_records=settings.STREAM_MAX_RECORDS,
         no_ack=False))
     async def handle_bot_message(messages):
         logger.info(f"Received {len(messages)} bot messages")
@@ -97,6 +128,7 @@ else:
 async def after_startup_tasks():
     stream_name = settings.BOT_STREAM_NAME if role == "bot" else settings.USER_STREAM_NAME
     group_name = settings.BOT_STREAM_GROUP if role == "bot" else settings.USER_STREAM_GROUP
+    setup_tracing(f"worker-{role}")
 
     redis = Redis.from_url(settings.REDIS_URL)
     try:
@@ -105,42 +137,73 @@ async def after_startup_tasks():
     except Exception as e:
         logger.warning(f"[{role.upper()}] Stream initialization skipped or failed: {e}")
 
-    async def reclaim_pending():
-        logger.info(f"[{role.upper()}] Reclaim loop started for stream: {stream_name}, group: {group_name}, consumer: {consumer_id}")
-
-        while True:
-            try:
-                pending = await redis.xpending_range(
-                    stream_name,
-                    group_name,
-                    min="-",
-                    max="+",
-                    count=10
-                )
-                logger.debug(f"[{role.upper()}] Pending messages: {len(pending)}")
-
-                to_reclaim = [entry for entry in pending if entry["consumer"] != consumer_id]
-                for entry in to_reclaim:
-                    msg_id = entry["message_id"]
-                    logger.warning(f"[{role.upper()}] Reclaiming {msg_id} from {entry['consumer']}")
-
-                    claimed = await redis.xclaim(
-                        stream_name,
-                        group_name,
-                        consumer_id,
-                        min_idle_time=10_000,
-                        message_ids=[msg_id],
-                    )
-                    logger.info(f"[{role.upper()}] Claimed {len(claimed)} message(s)")
-
-                    await process_batch(claimed, stream_name, group_name, from_claim=True)
-            except Exception as e:
-                logger.exception(f"[{role.upper()}] Error during reclaim_pending: {e}")
-
-            logger.debug(f"[{role.upper()}] Reclaim loop sleeping 30s...")
-            await asyncio.sleep(30)
-
-    asyncio.create_task(reclaim_pending())
+    recovery = PendingRecovery(
+        redis, stream_name, group_name, consumer_id,
+        process=lambda claimed: process_batch(claimed, stream_name, group_name, from_claim=True),
+        min_idle_ms=settings.STREAM_CLAIM_MIN_IDLE_MS,
+        batch_size=settings.STREAM_CLAIM_BATCH_SIZE,
+        max_deliveries=settings.STREAM_MAX_DELIVERIES,
+        min_interval=settings.STREAM_CLAIM_MIN_INTERVAL,
+        max_interval=settings.STREAM_CLAIM_MAX_INTERVAL,
+    )
+    asyncio.create_task(recovery.run())
+    local_cache.start_listeners()
+    start_metrics_server()
+    await s3_clients.start()
+
+    if settings.VARIABLES_WRITE_BEHIND:
+        asyncio.create_task(flush_variables_loop())
+
+    if settings.CODE_EXECUTION_BACKEND == "process":
+        await process_code_runner.warm_up()
+
+
+def start_metrics_server():
+    """/metrics воркера для Prometheus на METRICS_PORT (0 - не поднимать)."""
+    if not settings.METRICS_PORT:
+        return
+    try:
+        start_http_server(settings.METRICS_PORT)
+        logger.info(f"[{role.upper()}] Metrics exposed on :{settings.METRICS_PORT}/metrics")
+    except OSError as e:
+        logger.warning(f"[{role.upper()}] Metrics server not started: {e}")
+
+
+async def flush_variables_loop():
+    data_manager = DataManager(cache_redis, sessionmanager.engine)
+    logger.info(f"[{role.upper()}] Variables flush loop started, interval {settings.VARIABLES_FLUSH_INTERVAL}s")
+    while True:
+        try:
+            await data_manager.flush_pending_variables()
+        except Exception as e:
+            logger.exception(f"[{role.upper()}] Error during variables flush: {e}")
+        await asyncio.sleep(settings.VARIABLES_FLUSH_INTERVAL)
+
+
+@app.on_shutdown
+async def stop_code_runner():
+    process_code_runner.shutdown()
+
+
+@app.on_shutdown
+async def close_http_clients():
+    await http_client_pool.aclose()
+    await s3_clients.close()
+
+
+@app.on_shutdown
+async def stop_tracing():
+    shutdown_tracing()
+
+
+@app.on_shutdown
+async def flush_variables_on_shutdown():
+    if not settings.VARIABLES_WRITE_BEHIND:
+        return
+    try:
+        await DataManager(cache_redis, sessionmanager.engine).flush_pending_variables()
+    except Exception as e:
+        logger.exception(f"[{role.upper()}] Final variables flush failed: {e}")
 
 
 if __name__ == "__main__":
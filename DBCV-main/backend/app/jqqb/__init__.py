@@ -1,4 +1,4 @@
 from jqqb_evaluator.evaluator import Evaluator
 
-from .rule import Rule
-from .rule_group import RuleGroup
+from .rule import Rule, CompiledRule
+from .rule_group import RuleGroup, CompiledRuleGroup
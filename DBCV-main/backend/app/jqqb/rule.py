@@ -76,3 +76,24 @@ class Rule:
 
     def get_values(self):
         return self.get_value()
+
+
+class CompiledRule(Rule):
+    """
+    Правило с заранее разрешённым оператором и приведённым значением.
+    Ошибки приведения откладываются до вычисления, как в обычном Rule.
+    """
+
+    def __init__(self, rule_dict):
+        super().__init__(rule_dict)
+        self._operator = self.get_operator()
+        try:
+            self._value = self.get_value()
+            self._value_ready = True
+        except (TypeError, ValueError):
+            self._value = None
+            self._value_ready = False
+
+    def evaluate(self, obj):
+        value = self._value if self._value_ready else self.get_value()
+        return self._operator(self.get_input(obj), value)
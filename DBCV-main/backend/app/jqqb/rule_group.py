@@ -1,4 +1,4 @@
-from app.jqqb.rule import Rule
+from app.jqqb.rule import Rule, CompiledRule
 
 
 class RuleGroup:
@@ -50,4 +50,22 @@ class RuleGroup:
         ...
 
     def find_params(self):
-        ...
\ No newline at end of file
+        ...
+
+class CompiledRuleGroup(RuleGroup):
+    """Группа правил, дочерние объекты которой создаются один раз."""
+
+    def __init__(self, rule_group_dict):
+        super().__init__(rule_group_dict)
+        self.rule_objects = tuple(CompiledRuleGroup.get_rule_object(rule) for rule in self.rules)
+
+    def evaluate(self, obj):
+        if self.condition == 'AND':
+            return all(rule.evaluate(obj) for rule in self.rule_objects)
+        return any(rule.evaluate(obj) for rule in self.rule_objects)
+
+    @staticmethod
+    def get_rule_object(rule):
+        if 'rules' in rule:
+            return CompiledRuleGroup(rule)
+        return CompiledRule(rule)
@@ -1,15 +1,80 @@
+import asyncio
 import logging
-from app.broker import broker
+import random
+import time
+from collections import OrderedDict
+from copy import deepcopy
+
+from redis.asyncio import Redis
+
+from app.utils.ws_routing import ws_router
 from app.logging_config import LOGGING_CONFIG
 from app.config import settings
 
+_redis: Redis | None = None
+# {bot_id: (время истечения, есть ли подписчики, уровень логов бота)}, LRU на BOT_LOG_STATE_CACHE_SIZE ботов.
+# LocalCache отсюда не импортируется: пакет app.managers сам импортирует этот модуль.
+_bot_states: OrderedDict[str, tuple[float, bool, int]] = OrderedDict()
+
+
+def _get_redis() -> Redis:
+    global _redis
+    if _redis is None:
+        _redis = Redis.from_url(settings.REDIS_URL)
+    return _redis
+
+
+def watchers_key(bot_id: str) -> str:
+    return f"ws:bot:{bot_id}:watchers"
+
+
+async def get_bot_log_state(bot_id: str) -> tuple[bool, int]:
+    """
+    Есть ли открытые WebSocket-подключения к боту и какой уровень логов для него задан.
+    Результат кешируется в процессе на BOT_LOG_STATE_TTL секунд.
+    """
+    now = time.monotonic()
+    state = _bot_states.get(bot_id)
+    if state is not None and state[0] > now:
+        _bot_states.move_to_end(bot_id)
+        return state[1], state[2]
+
+    default_level = logging.getLevelName(settings.BOT_LOG_LEVEL.upper())
+    try:
+        async with _get_redis().pipeline(transaction=False) as pipe:
+            pipe.zcount(watchers_key(bot_id), time.time(), "+inf")
+            pipe.hget(settings.BOT_LOG_LEVELS_KEY, bot_id)
+            watchers, level = await pipe.execute()
+        watched = bool(watchers)
+        level = logging.getLevelName(level.decode().upper()) if level else default_level
+    except Exception as e:
+        logging.getLogger(__name__).warning(f"Failed to read bot log state for {bot_id}: {e}")
+        watched, level = True, default_level
+    if not isinstance(level, int):
+        level = default_level
+
+    _bot_states[bot_id] = (now + settings.BOT_LOG_STATE_TTL, watched, level)
+    _bot_states.move_to_end(bot_id)
+    while len(_bot_states) > settings.BOT_LOG_STATE_CACHE_SIZE:
+        _bot_states.popitem(last=False)
+    return watched, level
+
 
 class BotLogger:
+    """
+    Логгер бота. Записи пишутся в обычный лог и копятся в буфере; буфер отправляется в брокер
+    одним сообщением по размеру или по времени. В брокер уходят только записи ботов, к которым
+    открыто WebSocket-подключение.
+    """
+
     def __init__(self, bot_id: str):
         self.bot_id = bot_id
         self.step_id = None
         self.logger = logging.getLogger(__name__)
         self.formatter = logging.Formatter(LOGGING_CONFIG["formatters"]["default"]["format"])
+        self._buffer: list[dict] = []
+        self._flush_handle: asyncio.TimerHandle | None = None
+        self._flushing: set[asyncio.Task] = set()
 
     def set_step(self, step_id: str):
         self.step_id = step_id
@@ -24,6 +89,13 @@ class BotLogger:
         await self.log(message, logging.ERROR)
 
     async def log(self, message: str, level: int = logging.INFO):
+        watched, bot_level = await get_bot_log_state(str(self.bot_id))
+        publish = watched and level >= bot_level and (
+            level >= logging.WARNING or random.random() < settings.BOT_LOG_SAMPLE_RATE
+        )
+        if not publish and not self.logger.isEnabledFor(level):
+            return
+
         # Форматирование сообщения
         record = self.logger.makeRecord(
             self.logger.name, level, None, None, message, None, None
@@ -33,15 +105,44 @@ class BotLogger:
         # Логирование в обычный логгер
         self.logger.log(level, formatted_message)
 
-        # Отправка лога в брокер
-        await broker.publish({"bot_id": self.bot_id, "message": {"type": "logs", "level": logging.getLevelName(level), "step_id": self.step_id, "message": formatted_message}}, "bot_message_queue")
+        if publish:
+            await self._push({"type": "logs", "level": logging.getLevelName(level), "step_id": self.step_id,
+                              "message": formatted_message})
 
     async def print(self, *args, sep=' ', end='\n'):
         message = sep.join(str(arg) for arg in args) + end
         await self.info(message.rstrip('\n'))
 
     async def send_variables(self, variables: dict):
-        await broker.publish({"bot_id": self.bot_id, "message": {"type": "variables", "variables": variables}}, "bot_message_queue")
+        watched, _ = await get_bot_log_state(str(self.bot_id))
+        if watched:
+            await self._push({"type": "variables", "variables": deepcopy(variables)})
+
+    async def _push(self, message: dict):
+        self._buffer.append(message)
+        if len(self._buffer) >= settings.BOT_LOG_BATCH_SIZE:
+            await self.flush()
+        elif self._flush_handle is None:
+            loop = asyncio.get_running_loop()
+            self._flush_handle = loop.call_later(settings.BOT_LOG_FLUSH_INTERVAL, self._flush_in_background)
+
+    def _flush_in_background(self):
+        task = asyncio.create_task(self.flush())
+        self._flushing.add(task)
+        task.add_done_callback(self._flushing.discard)
+
+    async def flush(self):
+        """Отправляет накопленные записи одним сообщением."""
+        if self._flush_handle is not None:
+            self._flush_handle.cancel()
+            self._flush_handle = None
+        if not self._buffer:
+            return
+        messages, self._buffer = self._buffer, []
+        try:
+            await ws_router.publish("bot", str(self.bot_id), {"bot_id": self.bot_id, "messages": messages})
+        except Exception as e:
+            self.logger.warning(f"Failed to publish {len(messages)} bot log record(s) for {self.bot_id}: {e}")
 
 
 class NoopBotLogger(BotLogger):
@@ -58,4 +159,6 @@ class NoopBotLogger(BotLogger):
 
     async def print(self, *args, **kwargs): return
 
-    async def send_variables(self, variables: dict): return
\ No newline at end of file
+    async def send_variables(self, variables: dict): return
+
+    async def flush(self): return
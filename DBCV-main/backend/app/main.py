@@ -6,7 +6,8 @@ import traceback
 from contextlib import asynccontextmanager
 import uvicorn
 from fastapi import FastAPI, Request
-from starlette.responses import JSONResponse
+from starlette.responses import JSONResponse, Response
+from prometheus_client import CONTENT_TYPE_LATEST, generate_latest
 from fastapi.staticfiles import StaticFiles
 from starlette.middleware.cors import CORSMiddleware
 
@@ -48,7 +49,10 @@ from app.admin import dashboard
 from database import sessionmanager
 from app.broker import broker
 from app.fast_socket_app import fast_socket_app
-from app.engine.request import global_http_client
+from app.engine.request import http_client_pool
+from app.services.s3_client import s3_clients
+from app.managers.local_cache import local_cache
+from app.utils.tracing import setup_tracing, shutdown_tracing
 from uvicorn.config import LOGGING_CONFIG as UVICORN_LOGGING_CONFIG
 
 logging.config.dictConfig(LOGGING_CONFIG)
@@ -58,18 +62,25 @@ logger = logging.getLogger(__name__)
 @asynccontextmanager
 async def lifespan(app: FastAPI):
     """Manage startup and shutdown tasks for the FastAPI application."""
+    setup_tracing("api")
     try:
         await broker.start()
         await fast_socket_app.start()
+        cache_listeners = local_cache.start_listeners()
+        await s3_clients.start()
         logging.info("Background services started")
         yield
+        for listener in cache_listeners:
+            listener.cancel()
     except Exception as exc:
         logging.error(f"Failed to start background services: {exc}")
     finally:
         await broker.close()
         await fast_socket_app.stop()
         logging.info("Background services stopped")
-        await global_http_client.aclose()
+        await http_client_pool.aclose()
+        await s3_clients.close()
+        shutdown_tracing()
         if sessionmanager.engine is not None:  # pyright: ignore
             await sessionmanager.close()
 
@@ -106,6 +117,11 @@ async def healthcheck():
     return JSONResponse(content={"status": "ok"})
 
 
+@app.get("/metrics", tags=["health"], include_in_schema=False)
+async def metrics():
+    return Response(content=generate_latest(), media_type=CONTENT_TYPE_LATEST)
+
+
 app.add_middleware(
     CORSMiddleware,
     allow_origins=["*"],  # Allow all origins; restrict in production.
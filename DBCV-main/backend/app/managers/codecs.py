@@ -0,0 +1,144 @@
+"""
+Кодеки значений кеша в Redis.
+
+Сериализатор выбирается настройкой CACHE_CODEC (json, orjson, msgpack), сжатие больших
+значений - CACHE_COMPRESSION (zstd). Ключи всех форматов, кроме исходного json без сжатия,
+получают префикс с версией и именем кодека: процессы с разными настройками во время
+выкатки не читают значения друг друга.
+"""
+import json
+import logging
+from typing import Any
+
+from app.config import settings
+
+logger = logging.getLogger(__name__)
+
+try:
+    import orjson
+    ORJSON_AVAILABLE = True
+except ImportError:
+    orjson = None
+    ORJSON_AVAILABLE = False
+
+try:
+    import msgpack
+    MSGPACK_AVAILABLE = True
+except ImportError:
+    msgpack = None
+    MSGPACK_AVAILABLE = False
+
+try:
+    import zstandard
+    ZSTD_AVAILABLE = True
+except ImportError:
+    zstandard = None
+    ZSTD_AVAILABLE = False
+
+CODEC_FORMAT_VERSION = 1
+
+_RAW = b"\x00"
+_ZSTD = b"\x01"
+
+
+class Serializer:
+    name = ""
+
+    def dumps(self, data: Any) -> bytes:
+        raise NotImplementedError("Subclasses must implement this method")
+
+    def loads(self, raw: bytes) -> Any:
+        raise NotImplementedError("Subclasses must implement this method")
+
+
+class JsonSerializer(Serializer):
+    name = "json"
+
+    def dumps(self, data: Any) -> bytes:
+        return json.dumps(data, default=str).encode()
+
+    def loads(self, raw: bytes) -> Any:
+        return json.loads(raw)
+
+
+class OrjsonSerializer(Serializer):
+    name = "orjson"
+
+    def dumps(self, data: Any) -> bytes:
+        return orjson.dumps(data, default=str, option=orjson.OPT_NON_STR_KEYS)
+
+    def loads(self, raw: bytes) -> Any:
+        return orjson.loads(raw)
+
+
+class MsgpackSerializer(Serializer):
+    name = "msgpack"
+
+    def dumps(self, data: Any) -> bytes:
+        return msgpack.packb(data, default=str, use_bin_type=True)
+
+    def loads(self, raw: bytes) -> Any:
+        return msgpack.unpackb(raw, raw=False, strict_map_key=False)
+
+
+SERIALIZERS: dict[str, tuple[type[Serializer], bool]] = {
+    "json": (JsonSerializer, True),
+    "orjson": (OrjsonSerializer, ORJSON_AVAILABLE),
+    "msgpack": (MsgpackSerializer, MSGPACK_AVAILABLE),
+}
+
+
+class CacheCodec:
+    """
+    Сериализатор + необязательное сжатие zstd значений больше порога.
+    При сжатии каждое значение начинается с байта-признака (сырое/сжатое).
+    """
+
+    def __init__(self, serializer: Serializer, compression: str = "", threshold: int = 4096, level: int = 3):
+        self.serializer = serializer
+        self.compress = compression == "zstd"
+        self.threshold = threshold
+        if self.compress:
+            self._compressor = zstandard.ZstdCompressor(level=level)
+            self._decompressor = zstandard.ZstdDecompressor()
+        self.name = serializer.name + ("+zstd" if self.compress else "")
+        self.prefix = "" if self.name == "json" else f"c{CODEC_FORMAT_VERSION}:{self.name}:"
+
+    def key(self, key: str) -> str:
+        return self.prefix + key
+
+    def dumps(self, data: Any) -> bytes:
+        raw = self.serializer.dumps(data)
+        if not self.compress:
+            return raw
+        if len(raw) < self.threshold:
+            return _RAW + raw
+        return _ZSTD + self._compressor.compress(raw)
+
+    def loads(self, raw: bytes | str) -> Any:
+        if not self.compress:
+            return self.serializer.loads(raw)
+        if isinstance(raw, str):
+            raw = raw.encode()
+        if raw[:1] == _ZSTD:
+            return self.serializer.loads(self._decompressor.decompress(raw[1:]))
+        return self.serializer.loads(raw[1:])
+
+
+def build_codec(name: str, compression: str = "", threshold: int = 4096, level: int = 3) -> CacheCodec:
+    serializer_cls, available = SERIALIZERS.get(name, (None, False))
+    if serializer_cls is None or not available:
+        logger.warning(f"Cache codec '{name}' is not available, falling back to json")
+        serializer_cls = JsonSerializer
+    if compression == "zstd" and not ZSTD_AVAILABLE:
+        logger.warning("zstandard is not installed, cache compression disabled")
+        compression = ""
+    return CacheCodec(serializer_cls(), compression, threshold, level)
+
+
+cache_codec = build_codec(
+    settings.CACHE_CODEC,
+    settings.CACHE_COMPRESSION,
+    settings.CACHE_COMPRESSION_THRESHOLD,
+    settings.CACHE_COMPRESSION_LEVEL,
+)
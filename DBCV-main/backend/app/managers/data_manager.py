@@ -1,5 +1,7 @@
 import json
 import logging
+import time
+from contextlib import asynccontextmanager
 from datetime import datetime
 from typing import Any, Callable, Optional, List, Tuple, Dict
 from uuid import uuid4
@@ -8,25 +10,125 @@ from redis.asyncio import Redis
 from sqlalchemy.ext.asyncio import AsyncEngine
 from sqlalchemy import text
 import asyncio
+from app.config import settings
+from app.managers.codecs import cache_codec
+from app.managers.local_cache import credentials_cache, local_cache
+from app.metrics.cache import cache_metrics
 from app.models.base import BaseModel
 from app.utils.secret_box import decrypt_blob_to_dict
 
 logger = logging.getLogger(__name__)
 
+VARIABLE_TABLES = {
+    "bot": "bot_variables",
+    "channel": "channel_variables",
+    "session": "session_variables",
+    "user": "user_variables",
+}
+
+PENDING_VARIABLES_LOCK = "variables:pending:lock"
+PENDING_VARIABLES_LOCK_TTL = 30
+
+# Удаляет из hash поля, значение которых не изменилось с момента чтения (ARGV: field, value, ...)
+COMPARE_AND_DELETE_SCRIPT = """
+local deleted = 0
+for i = 1, #ARGV, 2 do
+    if redis.call('HGET', KEYS[1], ARGV[i]) == ARGV[i + 1] then
+        deleted = deleted + redis.call('HDEL', KEYS[1], ARGV[i])
+    end
+end
+return deleted
+"""
+
+RELEASE_LOCK_SCRIPT = """
+if redis.call('GET', KEYS[1]) == ARGV[1] then
+    return redis.call('DEL', KEYS[1])
+end
+return 0
+"""
+
+# Продлевает блокировку, только если она всё ещё принадлежит владельцу (ARGV: token, ttl в секундах)
+EXTEND_LOCK_SCRIPT = """
+if redis.call('GET', KEYS[1]) == ARGV[1] then
+    return redis.call('EXPIRE', KEYS[1], ARGV[2])
+end
+return 0
+"""
+
+
+@asynccontextmanager
+async def redis_lock(redis: Redis, key: str):
+    """
+    Блокировка в Redis (SET NX PX с токеном владельца).
+    Не получив её, ждём освобождения не дольше CACHE_LOCK_WAIT: вызывающий код после этого
+    перечитывает кеш, куда владелец блокировки уже записал значение.
+    """
+    lock_key = f"lock:{key}"
+    token = uuid4().hex
+    try:
+        acquired = await redis.set(lock_key, token, nx=True, px=settings.CACHE_LOCK_TTL_MS)
+    except Exception as e:
+        logger.warning(f"Distributed lock unavailable for {key}: {e}")
+        acquired, token = False, None
+
+    if token is None:
+        yield
+        return
+
+    if not acquired:
+        deadline = time.monotonic() + settings.CACHE_LOCK_WAIT
+        while time.monotonic() < deadline and await redis.exists(lock_key):
+            await asyncio.sleep(0.05)
+        yield
+        return
+
+    try:
+        yield
+    finally:
+        try:
+            await redis.eval(RELEASE_LOCK_SCRIPT, 1, lock_key, token)
+        except Exception as e:
+            logger.warning(f"Failed to release distributed lock for {key}: {e}")
+
+
+class _LockEntry:
+    __slots__ = ("lock", "refs")
+
+    def __init__(self):
+        self.lock = asyncio.Lock()
+        self.refs = 0
+
 
 class CacheLock:
     """
     Механизм блокировок на уровне ключей, чтобы не допустить множественные обращения к БД.
-    Не блокирует другие ключи.
+    Не блокирует другие ключи. Блокировка удаляется, когда её больше никто не ждёт.
+    При CACHE_DISTRIBUTED_LOCK дополнительно берётся блокировка в Redis, общая для всех процессов.
     """
 
     def __init__(self):
-        self.locks: dict[str, asyncio.Lock] = {}
+        self.locks: dict[str, _LockEntry] = {}
+
+    @asynccontextmanager
+    async def acquire(self, key: str, redis: Redis | None = None):
+        entry = self.locks.get(key)
+        if entry is None:
+            entry = self.locks[key] = _LockEntry()
+        entry.refs += 1
+        try:
+            async with entry.lock:
+                if redis is not None and settings.CACHE_DISTRIBUTED_LOCK:
+                    async with redis_lock(redis, key):
+                        yield
+                else:
+                    yield
+        finally:
+            entry.refs -= 1
+            if entry.refs == 0 and self.locks.get(key) is entry:
+                del self.locks[key]
 
-    def get_lock(self, key: str) -> asyncio.Lock:
-        if key not in self.locks:
-            self.locks[key] = asyncio.Lock()
-        return self.locks[key]
+
+cache_lock = CacheLock()
 
 
 class QueryProvider:
@@ -133,6 +235,51 @@ class QueryProvider:
                     AND channel_id = :channel_id
                     LIMIT 1""", {"user_id": user_id, "bot_id": bot_id, "channel_id": channel_id}
 
+    @staticmethod
+    def get_session_variables_by_session_query(user_id: str, bot_id: str,
+                                               channel_id: str) -> tuple[str, dict[str, Any]]:
+        return """SELECT *
+                    FROM session_variables
+                    WHERE id = (SELECT id
+                                FROM session
+                                WHERE user_id = :user_id
+                                AND bot_id = :bot_id
+                                AND channel_id = :channel_id
+                                LIMIT 1)""", {"user_id": user_id, "bot_id": bot_id, "channel_id": channel_id}
+
+    @staticmethod
+    def create_session_query(user_id: str, bot_id: str, channel_id: str,
+                             step_id: str) -> tuple[str, dict[str, Any]]:
+        now = datetime.utcnow()
+        return """WITH inserted AS (
+                        INSERT INTO session (id, user_id, bot_id, channel_id, step_id, created_at, updated_at)
+                        VALUES (:id, :user_id, :bot_id, :channel_id, :step_id, :created_at, :updated_at)
+                        RETURNING *
+                    ), variables AS (
+                        INSERT INTO session_variables (id, data)
+                        SELECT id, '{}' FROM inserted
+                    )
+                    SELECT * FROM inserted""", {"id": str(uuid4()), "user_id": user_id, "bot_id": bot_id,
+                                                "channel_id": channel_id, "step_id": step_id,
+                                                "created_at": now, "updated_at": now}
+
+    @staticmethod
+    def union_scopes_query(queries: dict[str, tuple[str, dict[str, Any]]]) -> tuple[str, dict[str, Any]]:
+        """
+        Объединяет запросы нескольких областей в один UNION ALL.
+        Каждая строка результата: (scope, data), где data - строка исходного запроса в виде JSON.
+        """
+        parts = []
+        params: dict[str, Any] = {}
+        for index, (scope, (query, query_params)) in enumerate(queries.items()):
+            for name, value in query_params.items():
+                if name in params and params[name] != value:
+                    raise ValueError(f"Conflicting parameter {name} in union query")
+                params[name] = value
+            params[f"scope_{index}"] = scope
+            parts.append(f"SELECT CAST(:scope_{index} AS text) AS scope, row_to_json(q) AS data FROM ({query}) q")
+        return "\nUNION ALL\n".join(parts), params
+
     @staticmethod
     def get_steps(bot_id: str) -> tuple[str, dict[str, Any]]:
         return "SELECT * FROM step WHERE bot_id = :bot_id", {"bot_id": bot_id}
@@ -178,6 +325,15 @@ class QueryProvider:
         return ("UPDATE user_variables SET data = :variables WHERE id = :id RETURNING data",
                 {"id": user_id, "variables": variables})
 
+    @staticmethod
+    def update_variables_batch_query(table: str, ids: list[str], payloads: list[str]) -> tuple[str, dict[str, Any]]:
+        return (f"""UPDATE {table} AS t
+                    SET data = CAST(v.data AS json)
+                    FROM (SELECT unnest(CAST(:ids AS varchar[])) AS id,
+                                 unnest(CAST(:payloads AS text[])) AS data) AS v
+                    WHERE t.id = v.id""",
+                {"ids": ids, "payloads": payloads})
+
     @staticmethod
     def update_session_query(user_id: str, bot_id: str, channel_id: str, step_id: str) -> tuple[str, dict[str, Any]]:
         return """UPDATE session
@@ -240,38 +396,21 @@ class QueryProvider:
         """, {"cred_id": cred_id}
 
     @staticmethod
-    def get_default_credential(bot_id: str, provider: str, strategy: str | None) -> tuple[str, dict[str, Any]]:
-        base = """
-          SELECT id, bot_id, name, provider, strategy, scopes, is_default, data
-          FROM credentials_entity
-          WHERE bot_id = :bot_id AND provider = :provider AND is_default = true
-        """
-        params = {"bot_id": bot_id, "provider": provider}
-        if strategy:
-            base += " AND strategy = :strategy"
-            params["strategy"] = strategy
-        base += " LIMIT 1"
-        return base, params
-
-    @staticmethod
-    def get_single_for_provider(bot_id: str, provider: str, strategy: str | None) -> tuple[str, dict[str, Any]]:
-        base = """
+    def list_provider_credentials(bot_id: str, provider: str) -> tuple[str, dict[str, Any]]:
+        """Все учётки бота для провайдера (данные зашифрованы): default и единственная выбираются из них."""
+        return """
           SELECT id, bot_id, name, provider, strategy, scopes, is_default, data
           FROM credentials_entity
           WHERE bot_id = :bot_id AND provider = :provider
-        """
-        params = {"bot_id": bot_id, "provider": provider}
-        if strategy:
-            base += " AND strategy = :strategy"
-            params["strategy"] = strategy
-        base += " ORDER BY is_default DESC, updated_at DESC LIMIT 1"
-        return base, params
+          ORDER BY is_default DESC, updated_at DESC
+        """, {"bot_id": bot_id, "provider": provider}
 
 class DataManager:
     def __init__(self, redis: Redis, engine: AsyncEngine):
         self.redis = redis
         self.engine = engine
-        self.cache_lock = CacheLock()
+        self.cache_lock = cache_lock
+        self.codec = cache_codec
         self.query_provider = QueryProvider(engine)
 
     @staticmethod
@@ -292,41 +431,114 @@ class DataManager:
         return data
 
     async def _get_or_load_list(self, key: str, ttl: int, db_query: Callable[[], tuple[str, dict]]) -> list:
-        cached = await self.redis.get(key)
+        cached = await self.redis.get(self.codec.key(key))
         if cached:
             logger.debug(f"Cache hit: {key}")
-            return json.loads(cached)
+            cache_metrics.hit("redis", key)
+            return self.codec.loads(cached)
 
-        lock = self.cache_lock.get_lock(key)
-        async with lock:
+        async with self.cache_lock.acquire(key, self.redis):
+            cached = await self.redis.get(self.codec.key(key))
             if cached:
                 logger.debug(f"Delayed cache hit: {key}")
-                return json.loads(cached)
+                cache_metrics.observe("redis", key, "coalesced")
+                return self.codec.loads(cached)
             async with self.engine.connect() as conn:
                 data = await self._get_list_db_query(db_query, conn)
-                await self.redis.set(key, json.dumps(data, default=str), ex=ttl)
+                await self.redis.set(self.codec.key(key), self.codec.dumps(data), ex=ttl)
                 logger.debug(f"Cache miss: {key}, loading from DB")
+                cache_metrics.miss("redis", key)
                 return data
 
     async def _get_or_load(self, key: str, ttl: int, db_query: Callable[[], tuple[str, dict]]) -> dict:
-        cached = await self.redis.get(key)
+        local = local_cache.accepts(key)
+        if local:
+            data = local_cache.get(key)
+            if data is not None:
+                logger.debug(f"Local cache hit: {key}")
+                cache_metrics.hit("local", key)
+                return data
+            cache_metrics.miss("local", key)
+        epoch = local_cache.epoch
+
+        cached = await self.redis.get(self.codec.key(key))
         if cached:
             logger.debug(f"Cache hit: {key}")
-            return json.loads(cached)
+            cache_metrics.hit("redis", key)
+            data = self.codec.loads(cached)
+            if local:
+                local_cache.set(key, data, epoch)
+            return data
 
-        lock = self.cache_lock.get_lock(key)
-        async with lock:
-            cached = await self.redis.get(key)
+        async with self.cache_lock.acquire(key, self.redis):
+            cached = await self.redis.get(self.codec.key(key))
             if cached:
                 logger.debug(f"Delayed cache hit: {key}")
-                return json.loads(cached)
+                cache_metrics.observe("redis", key, "coalesced")
+                data = self.codec.loads(cached)
+                if local:
+                    local_cache.set(key, data, epoch)
+                return data
             async with self.engine.connect() as conn:
 
                 data = await self._get_db_query(db_query, conn)
-                await self.redis.set(key, json.dumps(data, default=str), ex=ttl)
+                await self.redis.set(self.codec.key(key), self.codec.dumps(data), ex=ttl)
                 logger.debug(f"Cache miss: {key}, loading from DB")
+                cache_metrics.miss("redis", key)
+                if local:
+                    local_cache.set(key, data, epoch)
                 return data
 
+    @staticmethod
+    async def _get_union_db_query(queries: dict[str, tuple[str, dict]], conn) -> dict[str, dict]:
+        query, params = QueryProvider.union_scopes_query(queries)
+        result = await conn.execute(text(query), params)
+        return {row["scope"]: row["data"] for row in result.mappings()}
+
+    async def _get_many_cached(self, keys: list[str]) -> list[Any]:
+        values = await self.redis.mget([self.codec.key(key) for key in keys])
+        loaded = []
+        for key, value in zip(keys, values):
+            if value:
+                logger.debug(f"Cache hit: {key}")
+                cache_metrics.hit("redis", key)
+                loaded.append(self.codec.loads(value))
+            else:
+                cache_metrics.miss("redis", key)
+                loaded.append(None)
+        return loaded
+
+    async def _update_cache_many(self, items: list[tuple[str, int, dict | list]]):
+        if not items:
+            return
+        async with self.redis.pipeline(transaction=False) as pipe:
+            for key, ttl, data in items:
+                pipe.set(self.codec.key(key), self.codec.dumps(data), ex=ttl)
+            await pipe.execute()
+        logger.debug(f"Cache updated: {', '.join(key for key, _, _ in items)}")
+
+    async def _get_or_load_many(self,
+                                entries: dict[str, tuple[str, int, Callable[[], tuple[str, dict]]]]) -> dict[str, dict]:
+        """
+        Загружает несколько ключей одним MGET; промахи читаются из БД одним UNION-запросом
+        и записываются в кеш одним pipeline.
+        entries: {scope: (key, ttl, db_query)}
+        """
+        scopes = list(entries)
+        cached = await self._get_many_cached([entries[scope][0] for scope in scopes])
+        results = {scope: value for scope, value in zip(scopes, cached) if value is not None}
+
+        missing = [scope for scope in scopes if scope not in results]
+        if missing:
+            queries = {scope: entries[scope][2]() for scope in missing}
+            async with self.engine.connect() as conn:
+                loaded = await self._get_union_db_query(queries, conn)
+            for scope in missing:
+                logger.debug(f"Cache miss: {entries[scope][0]}, loading from DB")
+                results[scope] = loaded.get(scope) or {}
+            await self._update_cache_many([(entries[scope][0], entries[scope][1], results[scope]) for scope in missing])
+        return results
+
     @staticmethod
     async def _update_db_query(db_query: Callable[[], tuple[str, dict]], conn) -> dict:
         query, params = db_query()
@@ -336,12 +548,14 @@ class DataManager:
         return row
 
     async def _update_cache(self, key: str, ttl: int, data: dict | list):
-        await self.redis.set(key, json.dumps(data, default=str), ex=ttl)
+        await self.redis.set(self.codec.key(key), self.codec.dumps(data), ex=ttl)
+        await local_cache.publish_invalidation(self.redis, key)
         logger.debug(f"Cache updated: {key}")
 
     async def _invalidate_cache(self, key: str):
         """Инвалидирует кеш по ключу"""
-        await self.redis.delete(key)
+        await self.redis.delete(self.codec.key(key))
+        await local_cache.publish_invalidation(self.redis, key)
         logger.debug(f"Cache invalidated: {key}")
 
     async def invalidate_user_variables_cache(self, user_id: str):
@@ -464,12 +678,89 @@ class DataManager:
             db_query=lambda: QueryProvider.get_session_query(user_id, bot_id, channel_id)
         )
 
+    @staticmethod
+    def _variables_entries(user_id: str, bot_id: str, channel_id: str) -> dict[str, tuple[str, int, Callable]]:
+        return {
+            "bot": (f"variables:bot:{bot_id}", 300, lambda: QueryProvider.get_bot_variables_query(bot_id)),
+            "channel": (f"variables:channel:{channel_id}", 300,
+                        lambda: QueryProvider.get_channel_variables_query(channel_id)),
+            "user": (f"variables:user:{user_id}", 300, lambda: QueryProvider.get_user_variables_query(user_id)),
+        }
+
     async def get_all_variables(self, user_id: str, bot_id: str, channel_id: str, session_id: str) -> dict:
-        bot_result = await self.get_bot_variables(bot_id)
-        channel_result = await self.get_channel_variables(channel_id)
-        session_data = (await self.get_session_variables(session_id)).get("data")
-        user_result = await self.get_user_variables(user_id)
-        
+        entries = self._variables_entries(user_id, bot_id, channel_id)
+        entries["session"] = (f"variables:session:{session_id}", 300,
+                              lambda: QueryProvider.get_session_variables_query(session_id))
+        results = await self._get_or_load_many(entries)
+        return self._build_all_variables(user_id, bot_id, channel_id, results)
+
+    async def get_session_and_variables(self, user_id: str, bot_id: str, channel_id: str,
+                                        first_step_id: str) -> tuple[dict, dict]:
+        """
+        Загружает (или создаёт) сессию и переменные всех областей за минимальное число обращений:
+        один MGET по сессии и переменным бота/канала/пользователя, GET переменных сессии
+        и, при промахах, один UNION-запрос к БД и один pipeline на запись в кеш.
+        """
+        session_key = f"session:user:{user_id}:bot:{bot_id}:channel:{channel_id}"
+        entries = self._variables_entries(user_id, bot_id, channel_id)
+        scopes = list(entries)
+
+        async def with_cached_session(session_data: dict, results: dict[str, dict]) -> tuple[dict, dict]:
+            session_id = session_data["id"]
+            entries["session"] = (f"variables:session:{session_id}", 300,
+                                  lambda: QueryProvider.get_session_variables_query(session_id))
+            results.update(await self._get_or_load_many(
+                {scope: entry for scope, entry in entries.items() if scope not in results}
+            ))
+            return session_data, self._build_all_variables(user_id, bot_id, channel_id, results)
+
+        cached = await self._get_many_cached([session_key, *(entries[scope][0] for scope in scopes)])
+        results = {scope: value for scope, value in zip(scopes, cached[1:]) if value is not None}
+        if cached[0] is not None:
+            return await with_cached_session(cached[0], results)
+
+        async with self.cache_lock.acquire(session_key, self.redis):
+            session_data = (await self._get_many_cached([session_key]))[0]
+            if session_data is not None:
+                logger.debug(f"Delayed cache hit: {session_key}")
+                return await with_cached_session(session_data, results)
+
+            logger.debug(f"Cache miss: {session_key}, checking DB")
+            queries = {scope: entries[scope][2]() for scope in scopes if scope not in results}
+            queries["session"] = QueryProvider.get_session_query(user_id, bot_id, channel_id)
+            queries["session_variables"] = QueryProvider.get_session_variables_by_session_query(
+                user_id, bot_id, channel_id)
+
+            async with self.engine.begin() as conn:
+                loaded = await self._get_union_db_query(queries, conn)
+                session_data = loaded.get("session")
+                if session_data:
+                    session_variables = loaded.get("session_variables") or {}
+                else:
+                    logger.debug("Session not found, creating new one...")
+                    query, params = QueryProvider.create_session_query(user_id, bot_id, channel_id, first_step_id)
+                    result = await conn.execute(text(query), params)
+                    session_data = dict(result.mappings().first())
+                    session_variables = {"id": session_data["id"], "data": {}}
+
+            to_cache = [(session_key, 3600, session_data)]
+            for scope in scopes:
+                if scope not in results:
+                    results[scope] = loaded.get(scope) or {}
+                    to_cache.append((entries[scope][0], entries[scope][1], results[scope]))
+            results["session"] = session_variables
+            to_cache.append((f"variables:session:{session_data['id']}", 300, session_variables))
+            await self._update_cache_many(to_cache)
+
+            return session_data, self._build_all_variables(user_id, bot_id, channel_id, results)
+
+    @staticmethod
+    def _build_all_variables(user_id: str, bot_id: str, channel_id: str, results: dict[str, dict]) -> dict:
+        bot_result = results.get("bot") or {}
+        channel_result = results.get("channel") or {}
+        session_data = (results.get("session") or {}).get("data")
+        user_result = results.get("user") or {}
+
         bot_variables = bot_result.get("data") if bot_result.get("data") is not None else {}
         bot_base_data = {
             "id": str(bot_result.get("id", bot_id)),
@@ -511,19 +802,21 @@ class DataManager:
 
     async def get_or_create_session(self, user_id: str, bot_id: str, channel_id: str, first_step_id: str) -> dict:
         key = f"session:user:{user_id}:bot:{bot_id}:channel:{channel_id}"
-        cached = await self.redis.get(key)
+        cached = await self.redis.get(self.codec.key(key))
         if cached:
             logger.debug(f"Cache hit: {key}")
-            return json.loads(cached)
+            cache_metrics.hit("redis", key)
+            return self.codec.loads(cached)
 
-        lock = self.cache_lock.get_lock(key)
-        async with lock:
-            cached = await self.redis.get(key)
+        async with self.cache_lock.acquire(key, self.redis):
+            cached = await self.redis.get(self.codec.key(key))
             if cached:
                 logger.debug(f"Delayed cache hit: {key}")
-                return json.loads(cached)
+                cache_metrics.observe("redis", key, "coalesced")
+                return self.codec.loads(cached)
 
             logger.debug(f"Cache miss: {key}, checking DB")
+            cache_metrics.miss("redis", key)
 
             query, params = QueryProvider.get_session_query(user_id, bot_id, channel_id)
             async with self.engine.connect() as conn:
@@ -554,7 +847,7 @@ class DataManager:
                     result = await conn.execute(insert_query, insert_params)
                     session_data = dict(result.mappings().first())
 
-                await self.redis.set(key, json.dumps(session_data, default=str), ex=3600)
+                await self.redis.set(self.codec.key(key), self.codec.dumps(session_data), ex=3600)
                 return session_data
 
     async def update_bot(self, bot_id: str, cache_structure: dict) -> dict:
@@ -616,6 +909,102 @@ class DataManager:
         await self.update_channel_variables(channel_id, all_variables.get("channel"))
         await self.update_session_variables(session_id, all_variables.get("session"))
 
+    @staticmethod
+    def variables_fingerprint(all_variables: dict) -> dict[str, str]:
+        """Сериализованный снимок переменных по областям - для определения изменённых областей."""
+        return {
+            scope: json.dumps(all_variables.get(scope) if all_variables.get(scope) is not None else {}, default=str)
+            for scope in VARIABLE_TABLES
+        }
+
+    async def update_changed_variables(self, user_id: str, bot_id: str, channel_id: str, session_id: str,
+                                       all_variables: dict, fingerprint: dict[str, str]) -> list[str]:
+        """
+        Сохраняет только области переменных, изменившиеся относительно снимка fingerprint.
+        В режиме VARIABLES_WRITE_BEHIND запись в Postgres откладывается (см. flush_pending_variables).
+        Возвращает список сохранённых областей.
+        """
+        current = self.variables_fingerprint(all_variables)
+        changed = {scope: dumped for scope, dumped in current.items() if fingerprint.get(scope) != dumped}
+        if not changed:
+            return []
+
+        ids = {"bot": str(bot_id), "channel": str(channel_id), "session": str(session_id), "user": str(user_id)}
+        if settings.VARIABLES_WRITE_BEHIND:
+            await self._queue_variables(ids, changed, all_variables)
+            return list(changed)
+
+        queries = {
+            "bot": QueryProvider.update_bot_variables_query,
+            "channel": QueryProvider.update_channel_variables_query,
+            "session": QueryProvider.update_session_variables_query,
+            "user": QueryProvider.update_user_variables_query,
+        }
+        for scope, dumped in changed.items():
+            await self._update(
+                key=f"variables:{scope}:{ids[scope]}",
+                ttl=300,
+                db_query=lambda: queries[scope](ids[scope], dumped)
+            )
+        return list(changed)
+
+    async def _queue_variables(self, ids: dict[str, str], changed: dict[str, str], all_variables: dict) -> None:
+        """Обновляет кеш и ставит изменения в очередь на запись; повторные изменения одного ключа склеиваются."""
+        async with self.redis.pipeline(transaction=True) as pipe:
+            for scope, dumped in changed.items():
+                pipe.set(self.codec.key(f"variables:{scope}:{ids[scope]}"),
+                         self.codec.dumps({"data": all_variables.get(scope) or {}}), ex=300)
+                pipe.hset(f"variables:pending:{scope}", ids[scope], dumped)
+            await pipe.execute()
+        logger.debug(f"Variables queued for write-behind: {', '.join(changed)}")
+
+    async def flush_pending_variables(self, batch_size: int | None = None) -> int:
+        """
+        Сбрасывает накопленные изменения переменных в Postgres пачками.
+        Одновременно работает только один сбросчик (блокировка в Redis с токеном владельца,
+        продлевается перед каждой пачкой); записи удаляются из очереди, только если не были
+        перезаписаны за время сброса.
+        """
+        batch_size = batch_size or settings.VARIABLES_FLUSH_BATCH_SIZE
+        token = uuid4().hex
+        if not await self.redis.set(PENDING_VARIABLES_LOCK, token, nx=True, ex=PENDING_VARIABLES_LOCK_TTL):
+            return 0
+
+        flushed = 0
+        compare_and_delete = self.redis.register_script(COMPARE_AND_DELETE_SCRIPT)
+        extend_lock = self.redis.register_script(EXTEND_LOCK_SCRIPT)
+
+        async def still_owner() -> bool:
+            return bool(await extend_lock(keys=[PENDING_VARIABLES_LOCK], args=[token, PENDING_VARIABLES_LOCK_TTL]))
+
+        try:
+            for scope, table in VARIABLE_TABLES.items():
+                pending_key = f"variables:pending:{scope}"
+                items = await self.redis.hgetall(pending_key)
+                if not items:
+                    continue
+                entries = [(key.decode() if isinstance(key, bytes) else key,
+                            value.decode() if isinstance(value, bytes) else value)
+                           for key, value in items.items()]
+                for start in range(0, len(entries), batch_size):
+                    if not await still_owner():
+                        logger.warning("Variables flush lock lost, leaving the rest to the new owner")
+                        return flushed
+                    batch = entries[start:start + batch_size]
+                    query, params = QueryProvider.update_variables_batch_query(
+                        table, [entry_id for entry_id, _ in batch], [payload for _, payload in batch]
+                    )
+                    async with self.engine.begin() as conn:
+                        await conn.execute(text(query), params)
+                    await compare_and_delete(keys=[pending_key], args=[item for entry in batch for item in entry])
+                    flushed += len(batch)
+        finally:
+            await self.redis.eval(RELEASE_LOCK_SCRIPT, 1, PENDING_VARIABLES_LOCK, token)
+
+        if flushed:
+            logger.debug(f"Flushed {flushed} pending variable scopes")
+        return flushed
+
     async def get_bot_credentials_list(self, bot_id: str) -> list[dict]:
         return await self._get_or_load_list(
             key=f"bot:{bot_id}:credentials",
@@ -623,55 +1012,63 @@ class DataManager:
             db_query=lambda: self.query_provider.list_bot_credentials(bot_id),
         )
 
-    async def get_credential_internal_by_id(self, cred_id: str) -> dict:
-        async with self.engine.connect() as conn:
-            q, p = self.query_provider.get_credential_by_id(cred_id)
-            row = (await conn.execute(text(q), p)).mappings().first()
-            if not row:
-                return {}
-            data = dict(row)
-            data["payload"] = decrypt_blob_to_dict(data.pop("data"))
+    @staticmethod
+    def _decrypt_credential(row: dict) -> dict:
+        data = dict(row)
+        data["payload"] = decrypt_blob_to_dict(data.pop("data"))
+        return data
+
+    async def _get_decrypted(self, key: str, load: Callable[[], Any]) -> Any:
+        """
+        Учётные данные: в Redis лежат зашифрованными (как в БД), расшифрованные - только
+        в памяти процесса на CREDENTIALS_CACHE_TTL секунд.
+        """
+        data = credentials_cache.get(key)
+        if data is not None:
+            logger.debug(f"Local cache hit: {key}")
+            cache_metrics.hit("local", key)
             return data
+        cache_metrics.miss("local", key)
+        epoch = credentials_cache.epoch
+        data = await load()
+        credentials_cache.set(key, data, epoch)
+        return data
+
+    async def _get_provider_credentials(self, bot_id: str, provider: str) -> list[dict]:
+        key = f"credentials:bot:{bot_id}:provider:{provider}"
+
+        async def load() -> list[dict]:
+            rows = await self._get_or_load_list(
+                key=key,
+                ttl=300,
+                db_query=lambda: self.query_provider.list_provider_credentials(bot_id, provider),
+            )
+            return [self._decrypt_credential(row) for row in rows]
+
+        return await self._get_decrypted(key, load)
+
+    async def get_credential_internal_by_id(self, cred_id: str) -> dict:
+        key = f"credentials:id:{cred_id}"
+
+        async def load() -> dict:
+            row = await self._get_or_load(
+                key=key,
+                ttl=300,
+                db_query=lambda: self.query_provider.get_credential_by_id(cred_id),
+            )
+            return self._decrypt_credential(row) if row else {}
+
+        return await self._get_decrypted(key, load)
 
     async def resolve_default_credential(self, bot_id: str, provider: str, strategy: str | None = None) -> dict:
-        # Кэшируем credentials для быстрого доступа
-        cache_key = f"credential:bot:{bot_id}:provider:{provider}:strategy:{strategy or 'default'}:default"
-        cached = await self.redis.get(cache_key)
-        if cached:
-            logger.debug(f"Cache hit: {cache_key}")
-            return json.loads(cached)
-        
-        # Если нет в кэше, загружаем из БД
-        async with self.engine.connect() as conn:
-            q, p = self.query_provider.get_default_credential(bot_id, provider, strategy)
-            row = (await conn.execute(text(q), p)).mappings().first()
-            if not row:
-                return {}
-            data = dict(row)
-            data["payload"] = decrypt_blob_to_dict(data.pop("data"))
-            # Кэшируем на 5 минут (credentials редко меняются)
-            await self.redis.set(cache_key, json.dumps(data, default=str), ex=300)
-            logger.debug(f"Cache miss: {cache_key}, loaded from DB")
-            return data
+        for data in await self._get_provider_credentials(bot_id, provider):
+            if data["is_default"] and (not strategy or data["strategy"] == strategy):
+                return data
+        return {}
 
     async def resolve_singleton_credential(self, bot_id: str, provider: str,
                                            strategy: str | None = None) -> dict | None:
-        # Кэшируем credentials для быстрого доступа
-        cache_key = f"credential:bot:{bot_id}:provider:{provider}:strategy:{strategy or 'default'}:singleton"
-        cached = await self.redis.get(cache_key)
-        if cached:
-            logger.debug(f"Cache hit: {cache_key}")
-            return json.loads(cached)
-        
-        # Если нет в кэше, загружаем из БД
-        async with self.engine.connect() as conn:
-            q, p = self.query_provider.get_single_for_provider(bot_id, provider, strategy)
-            rows = [dict(r) for r in (await conn.execute(text(q), p)).mappings().all()]
-            if len(rows) != 1:
-                return None
-            data = rows[0]
-            data["payload"] = decrypt_blob_to_dict(data.pop("data"))
-            # Кэшируем на 5 минут
-            await self.redis.set(cache_key, json.dumps(data, default=str), ex=300)
-            logger.debug(f"Cache miss: {cache_key}, loaded from DB")
-            return data
\ No newline at end of file
+        for data in await self._get_provider_credentials(bot_id, provider):
+            if not strategy or data["strategy"] == strategy:
+                return data
+        return None
\ No newline at end of file
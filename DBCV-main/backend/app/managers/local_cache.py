@@ -0,0 +1,133 @@
+"""
+Локальный (in-process) кеш первого уровня перед Redis.
+
+Хранит уже распарсенные объекты для почти статичных ключей (`bot:*`, `channel:*`),
+ограничен по размеру (LRU) и времени жизни записи. Изменения ключей рассылаются
+через Redis pub/sub, каждый процесс слушает канал и удаляет у себя устаревшие записи.
+Возвращаемые объекты общие для всех обращений и не должны изменяться.
+
+`credentials_cache` держит расшифрованные учётные данные только в памяти процесса
+(в Redis они лежат зашифрованными) и получает инвалидации через слушателя `local_cache`.
+"""
+import asyncio
+import logging
+import time
+from collections import OrderedDict
+from typing import Any, Iterable, Optional
+
+from redis.asyncio import Redis
+
+from app.config import settings
+
+logger = logging.getLogger(__name__)
+
+
+class LocalCache:
+    def __init__(self, maxsize: int, ttl: float, prefixes: Iterable[str]):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.prefixes = tuple(prefix for prefix in prefixes if prefix)
+        self._items: OrderedDict[str, tuple[float, Any]] = OrderedDict()
+        self._epoch = 0
+        self._linked: list["LocalCache"] = []
+
+    def link(self, other: "LocalCache") -> None:
+        """Инвалидации, полученные этим кешем, применяются и к `other` (один слушатель на оба)."""
+        self._linked.append(other)
+
+    def accepts(self, key: str) -> bool:
+        return self.maxsize > 0 and key.startswith(self.prefixes)
+
+    @property
+    def epoch(self) -> int:
+        """Счётчик инвалидаций: значение, прочитанное до инвалидации, не попадает в кеш."""
+        return self._epoch
+
+    def get(self, key: str) -> Optional[Any]:
+        item = self._items.get(key)
+        if item is None:
+            return None
+        expires_at, value = item
+        if expires_at < time.monotonic():
+            self._items.pop(key, None)
+            return None
+        self._items.move_to_end(key)
+        return value
+
+    def set(self, key: str, value: Any, epoch: int | None = None) -> None:
+        if not self.accepts(key) or (epoch is not None and epoch != self._epoch):
+            return
+        self._items[key] = (time.monotonic() + self.ttl, value)
+        self._items.move_to_end(key)
+        while len(self._items) > self.maxsize:
+            self._items.popitem(last=False)
+
+    def invalidate(self, key: str) -> None:
+        self._epoch += 1
+        self._items.pop(key, None)
+        for other in self._linked:
+            other.invalidate(key)
+
+    def clear(self) -> None:
+        self._epoch += 1
+        self._items.clear()
+        for other in self._linked:
+            other.clear()
+
+    async def publish_invalidation(self, redis: Redis, key: str) -> None:
+        """Удаляет ключ локально и рассылает инвалидацию остальным процессам."""
+        if not self.accepts(key):
+            return
+        self.invalidate(key)
+        try:
+            await redis.publish(settings.LOCAL_CACHE_CHANNEL, key)
+        except Exception as e:
+            logger.warning(f"Failed to publish cache invalidation for {key}: {e}")
+
+    async def _listen_once(self, url: str) -> None:
+        redis = Redis.from_url(url)
+        pubsub = redis.pubsub()
+        try:
+            await pubsub.subscribe(settings.LOCAL_CACHE_CHANNEL)
+            # за время переподключения могли быть пропущены инвалидации
+            self.clear()
+            async for message in pubsub.listen():
+                if message.get("type") != "message":
+                    continue
+                key = message["data"]
+                self.invalidate(key.decode() if isinstance(key, bytes) else key)
+        finally:
+            await pubsub.aclose()
+            await redis.aclose()
+
+    async def listen(self, url: str) -> None:
+        """Слушает канал инвалидаций; при обрыве соединения переподключается."""
+        while True:
+            try:
+                await self._listen_once(url)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.warning(f"Local cache invalidation listener error ({url}): {e}")
+            await asyncio.sleep(1)
+
+    def start_listeners(self) -> list[asyncio.Task]:
+        """Запускает слушателей для всех Redis, через которые DataManager пишет кеш."""
+        if self.maxsize <= 0 and all(other.maxsize <= 0 for other in self._linked):
+            return []
+        urls = dict.fromkeys((settings.CACHE_REDIS_URL, settings.REDIS_URL))
+        return [asyncio.create_task(self.listen(url)) for url in urls]
+
+
+local_cache = LocalCache(
+    maxsize=settings.LOCAL_CACHE_SIZE,
+    ttl=settings.LOCAL_CACHE_TTL,
+    prefixes=settings.LOCAL_CACHE_PREFIXES.split(","),
+)
+
+credentials_cache = LocalCache(
+    maxsize=settings.CREDENTIALS_CACHE_SIZE,
+    ttl=settings.CREDENTIALS_CACHE_TTL,
+    prefixes=("credentials:",),
+)
+local_cache.link(credentials_cache)
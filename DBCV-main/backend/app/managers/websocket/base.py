@@ -1,77 +1,202 @@
 import asyncio
 import json
 import logging
+import time
 from typing import Dict, Union
 from uuid import UUID
 from fastapi import WebSocket
 from pydantic import BaseModel
 
+from app.config import settings
+from app.metrics.websocket import websocket_metrics
+from app.utils.ws_routing import ws_router
+
 logger = logging.getLogger(__name__)
 
+# задачи закрытия сокетов отключённых клиентов: подключение к этому моменту уже удалено из менеджера
+_closing_sockets: set[asyncio.Task] = set()
+
+
+class WebSocketConnection:
+    """
+    Подключение с собственной очередью отправки: notify только кладёт сообщение в очередь,
+    отправку выполняет отдельная задача, поэтому медленный клиент не задерживает остальных.
+    Клиент может приостановить отправку (pause/resume): сообщения копятся в очереди
+    в пределах WS_SEND_QUEUE_SIZE, дальше действует WS_OVERFLOW_POLICY.
+    """
+
+    def __init__(self, websocket: WebSocket, on_failed, metrics_label: str = ""):
+        self.websocket = websocket
+        self.queue: asyncio.Queue[str] = asyncio.Queue(maxsize=settings.WS_SEND_QUEUE_SIZE)
+        self.metrics_label = metrics_label
+        self._on_failed = on_failed
+        self._resumed = asyncio.Event()
+        self._resumed.set()
+        self._task = asyncio.create_task(self._sender())
+
+    @property
+    def paused(self) -> bool:
+        return not self._resumed.is_set()
+
+    def pause(self) -> None:
+        self._resumed.clear()
+
+    def resume(self) -> None:
+        self._resumed.set()
+
+    def enqueue(self, message: str) -> bool:
+        """Возвращает False, если сообщение не поставлено (очередь полна)."""
+        try:
+            self.queue.put_nowait(message)
+            return True
+        except asyncio.QueueFull:
+            pass
+        if settings.WS_OVERFLOW_POLICY == "drop_oldest":
+            self.queue.get_nowait()
+            self.queue.put_nowait(message)
+            return True
+        if settings.WS_OVERFLOW_POLICY == "disconnect":
+            self._fail("send queue overflow")
+        return False
+
+    async def _sender(self) -> None:
+        while True:
+            message = await self.queue.get()
+            await self._resumed.wait()
+            try:
+                await asyncio.wait_for(self.websocket.send_text(message), settings.WS_SEND_TIMEOUT)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                self._fail(repr(e))
+                return
+            websocket_metrics.observe_sent(self.metrics_label, len(message.encode()))
+
+    def _fail(self, reason: str) -> None:
+        self._on_failed(self, reason)
+        self.close()
+        task = asyncio.create_task(self._close_socket())
+        _closing_sockets.add(task)
+        task.add_done_callback(_closing_sockets.discard)
+
+    async def _close_socket(self) -> None:
+        try:
+            await self.websocket.close()
+        except Exception:
+            pass
+
+    def close(self) -> None:
+        if not self._task.done() and self._task is not asyncio.current_task():
+            self._task.cancel()
+
 
 class WebSocketManagerBase:
+    # тип сущности в реестре маршрутов между узлами (app.utils.ws_routing); None - без реестра
+    kind: str | None = None
+
     def __init__(self):
-        # Активные WebSocket-подключения: {entity_id: {unique_user_key: websocket}}
-        self.active_connections: Dict[str, Dict[str, WebSocket]] = {}
-        self.lock = asyncio.Lock()
+        # Активные WebSocket-подключения: {entity_id: {unique_user_key: connection}}.
+        # Словари не изменяются на месте, а заменяются копией (copy-on-write): notify читает
+        # снимок без блокировки, а между await подключения могут меняться.
+        self.active_connections: Dict[str, Dict[str, WebSocketConnection]] = {}
+        self.metrics_label = type(self).__name__
+        self._refresh_task: asyncio.Task | None = None
 
     @staticmethod
     def _normalize_key(key: Union[UUID, str]) -> str:
         """Преобразовать key в строку."""
         return str(key)
 
+    @staticmethod
+    def _serialize(message: BaseModel | str | dict) -> str:
+        if isinstance(message, str):
+            return message
+        if isinstance(message, BaseModel):
+            return message.model_dump_json()
+        try:
+            return json.dumps(message)
+        except (TypeError, ValueError):
+            raise ValueError("Invalid message")
+
     async def notify(self, entity_id: Union[UUID, str], message: BaseModel | str) -> None:
-        """Отправить сообщение пользователю в сущности, если он подключен."""
+        """Отправить сообщение всем подключениям сущности: сериализуется один раз, отправка в фоне."""
         entity_id = self._normalize_key(entity_id)
-        async with self.lock:
-            connections = self.active_connections.get(entity_id)
+        connections = self.active_connections.get(entity_id)
+        if not connections:
+            # в режиме broadcast уведомления приходят на все узлы, это ожидаемо
+            logger.debug(f"[WS] No active connections for {entity_id}")
+            return
 
-            if not connections:
-                logger.warning(f"[WS] No active connections for {entity_id}")
-                return
+        started = time.perf_counter()
+        msg = self._serialize(message)
+        sent = failed = 0
+        for user_key, connection in connections.items():
+            if connection.enqueue(msg):
+                sent += 1
+            else:
+                failed += 1
+                logger.warning(f"[WS] Dropped message for {user_key} in {entity_id}: send queue is full")
+        websocket_metrics.observe_broadcast(self.metrics_label, sent, failed, time.perf_counter() - started)
+
+    def _discard(self, entity_id: str, connection_uuid: str, connection: WebSocketConnection | None = None) -> bool:
+        entity_conns = self.active_connections.get(entity_id)
+        if not entity_conns or connection_uuid not in entity_conns:
+            return False
+        if connection is not None and entity_conns[connection_uuid] is not connection:
+            return False
+        removed = entity_conns[connection_uuid]
+        entity_conns = {key: value for key, value in entity_conns.items() if key != connection_uuid}
+        if entity_conns:
+            self.active_connections[entity_id] = entity_conns
+        else:
+            del self.active_connections[entity_id]
+        removed.close()
+        websocket_metrics.dec_active(self.metrics_label)
+        return True
 
-            disconnected = []
-
-            for user_key, websocket in connections.items():
-                try:
-                    msg = None
-                    if isinstance(message, str):
-                        msg = message
-
-                    if isinstance(message, BaseModel):
-                        msg = message.model_dump_json()
-                    if msg is None:
-                        try:
-                            msg = json.dumps(message)
-                        except json.JSONDecodeError:
-                            raise ValueError("Invalid message")
-                    await websocket.send_text(msg)
-                except Exception as e:
-                    logger.error(f"[WS] Send failed to {user_key} in {entity_id}: {repr(e)}")
-                    disconnected.append(user_key)
-
-            # Удаляем недоступные соединения
-            for user_key in disconnected:
-                del connections[user_key]
-                logger.info(f"[WS] Removed dead connection {user_key} from {entity_id}")
-
-            if not connections:
-                del self.active_connections[entity_id]
-
-    async def add_connection(self, entity_id: Union[UUID, str], connection_uuid: Union[UUID, str], websocket: WebSocket):
+    async def add_connection(self, entity_id: Union[UUID, str], connection_uuid: Union[UUID, str],
+                             websocket: WebSocket) -> WebSocketConnection:
         entity_id = self._normalize_key(entity_id)
-        async with self.lock:
-            if entity_id not in self.active_connections:
-                self.active_connections[entity_id] = {}
-            self.active_connections[entity_id][connection_uuid] = websocket
-            logger.info(f"[WS] Connected: {connection_uuid} to {entity_id}")
+
+        def on_failed(connection: WebSocketConnection, reason: str) -> None:
+            logger.error(f"[WS] Send failed to {connection_uuid} in {entity_id}: {reason}")
+            if self._discard(entity_id, connection_uuid, connection):
+                logger.info(f"[WS] Removed dead connection {connection_uuid} from {entity_id}")
+
+        # повторное подключение с тем же ключом заменяет старое
+        self._discard(entity_id, connection_uuid)
+        connection = WebSocketConnection(websocket, on_failed, self.metrics_label)
+        first = entity_id not in self.active_connections
+        self.active_connections[entity_id] = {**self.active_connections.get(entity_id, {}), connection_uuid: connection}
+        websocket_metrics.inc_active(self.metrics_label)
+        logger.info(f"[WS] Connected: {connection_uuid} to {entity_id}")
+
+        if first and self.kind:
+            await ws_router.register(self.kind, [entity_id])
+        if self._refresh_task is None or self._refresh_task.done():
+            self._refresh_task = asyncio.create_task(self._refresh_loop())
+        return connection
 
     async def remove_connection(self, entity_id: Union[UUID, str], connection_uuid: Union[UUID, str]):
         entity_id = self._normalize_key(entity_id)
-        async with self.lock:
-            entity_conns = self.active_connections.get(entity_id)
-            if entity_conns and connection_uuid in entity_conns:
-                del entity_conns[connection_uuid]
-                logger.info(f"[WS] Disconnected: {connection_uuid} from {entity_id}")
-                if not entity_conns:
-                    del self.active_connections[entity_id]
\ No newline at end of file
+        if self._discard(entity_id, connection_uuid):
+            logger.info(f"[WS] Disconnected: {connection_uuid} from {entity_id}")
+        if self.kind and entity_id not in self.active_connections:
+            await ws_router.unregister(self.kind, entity_id)
+
+    async def _refresh(self) -> None:
+        """Продлевает регистрацию подключений этого узла в Redis."""
+        if self.kind and self.active_connections:
+            await ws_router.register(self.kind, list(self.active_connections))
+
+    @property
+    def refresh_interval(self) -> float:
+        return settings.WS_ROUTE_TTL / 3
+
+    async def _refresh_loop(self) -> None:
+        while self.active_connections:
+            await asyncio.sleep(self.refresh_interval)
+            try:
+                await self._refresh()
+            except Exception as e:
+                logger.warning(f"[WS] Failed to refresh registrations: {e}")
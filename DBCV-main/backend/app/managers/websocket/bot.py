@@ -1,9 +1,69 @@
+import logging
+import time
 from typing import Union
 from uuid import UUID
+
 from pydantic import BaseModel
+from redis.asyncio import Redis
+
+from app.config import settings
+from app.loggers.bot import watchers_key
 from .base import WebSocketManagerBase
 
+logger = logging.getLogger(__name__)
+
 
 class BotWebSocketManager(WebSocketManagerBase):
+    """
+    Подключения к ботам дополнительно регистрируются в Redis (ZSET со временем истечения),
+    чтобы воркеры отправляли логи только тех ботов, которые кто-то смотрит.
+    """
+    kind = "bot"
+
+    def __init__(self):
+        super().__init__()
+        self._redis: Redis | None = None
+
+    @property
+    def redis(self) -> Redis:
+        if self._redis is None:
+            self._redis = Redis.from_url(settings.REDIS_URL)
+        return self._redis
+
     async def notify_bot(self, bot_id: Union[UUID, str], message: BaseModel | str) -> None:
         await self.notify(bot_id, message)
+
+    async def add_connection(self, entity_id: Union[UUID, str], connection_uuid: Union[UUID, str], websocket):
+        connection = await super().add_connection(entity_id, connection_uuid, websocket)
+        await self._register(self._normalize_key(entity_id), [connection_uuid])
+        return connection
+
+    async def remove_connection(self, entity_id: Union[UUID, str], connection_uuid: Union[UUID, str]):
+        await super().remove_connection(entity_id, connection_uuid)
+        try:
+            await self.redis.zrem(watchers_key(self._normalize_key(entity_id)), str(connection_uuid))
+        except Exception as e:
+            logger.warning(f"[WS] Failed to unregister watcher {connection_uuid}: {e}")
+
+    async def _register(self, bot_id: str, connection_uuids) -> None:
+        ttl = settings.BOT_LOG_WATCH_TTL
+        now = time.time()
+        key = watchers_key(bot_id)
+        try:
+            async with self.redis.pipeline(transaction=False) as pipe:
+                pipe.zadd(key, {str(connection_uuid): now + ttl for connection_uuid in connection_uuids})
+                pipe.zremrangebyscore(key, "-inf", now)
+                pipe.expire(key, int(ttl))
+                await pipe.execute()
+        except Exception as e:
+            logger.warning(f"[WS] Failed to register watchers for bot {bot_id}: {e}")
+
+    @property
+    def refresh_interval(self) -> float:
+        return min(settings.WS_ROUTE_TTL, settings.BOT_LOG_WATCH_TTL) / 3
+
+    async def _refresh(self) -> None:
+        await super()._refresh()
+        for bot_id, connections in list(self.active_connections.items()):
+            if connections:
+                await self._register(bot_id, list(connections))
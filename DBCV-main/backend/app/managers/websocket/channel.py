@@ -5,5 +5,7 @@ from .base import WebSocketManagerBase
 
 
 class ChannelWebSocketManager(WebSocketManagerBase):
+    kind = "channel"
+
     async def notify_channel(self, channel_id: Union[UUID, str], message: BaseModel | str) -> None:
         await self.notify(channel_id, message)
\ No newline at end of file
@@ -0,0 +1,31 @@
+from __future__ import annotations
+
+from prometheus_client import Counter
+
+
+class CacheMetrics:
+    """Prometheus metrics helpers for the local, Redis and response caches."""
+
+    def __init__(self) -> None:
+        self._lookups = Counter(
+            "cache_lookups_total",
+            "Cache lookups by layer, key kind and result (hit, coalesced, miss).",
+            labelnames=("layer", "kind", "result"),
+        )
+
+    @staticmethod
+    def kind(key: str) -> str:
+        # only the key prefix, so entity ids never become label values
+        return key.split(":", 1)[0]
+
+    def observe(self, layer: str, key: str, result: str) -> None:
+        self._lookups.labels(layer=layer, kind=self.kind(key), result=result).inc()
+
+    def hit(self, layer: str, key: str) -> None:
+        self.observe(layer, key, "hit")
+
+    def miss(self, layer: str, key: str) -> None:
+        self.observe(layer, key, "miss")
+
+
+cache_metrics = CacheMetrics()
@@ -0,0 +1,29 @@
+from __future__ import annotations
+
+from prometheus_client import Counter, Histogram
+
+
+class HttpClientMetrics:
+    """Prometheus metrics helpers for outgoing HTTP requests of bot steps."""
+
+    def __init__(self) -> None:
+        self._requests = Counter(
+            "http_client_requests_total",
+            "Outgoing HTTP requests by method and status class.",
+            labelnames=("method", "status"),
+        )
+        self._duration = Histogram(
+            "http_client_request_duration_seconds",
+            "Outgoing HTTP request duration, including waiting for a per-host slot.",
+            labelnames=("method",),
+            buckets=(0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0),
+        )
+
+    def observe(self, method: str, status_code: int | None, duration: float) -> None:
+        # no host label: bots call arbitrary URLs and would blow up cardinality
+        status = f"{status_code // 100}xx" if status_code else "error"
+        self._requests.labels(method=method, status=status).inc()
+        self._duration.labels(method=method).observe(duration)
+
+
+http_client_metrics = HttpClientMetrics()
@@ -0,0 +1,34 @@
+from __future__ import annotations
+
+import time
+from contextlib import contextmanager
+from typing import Iterator
+
+from prometheus_client import Histogram
+
+
+class PipelineMetrics:
+    """Prometheus metrics helpers for the bot message pipeline stages."""
+
+    def __init__(self) -> None:
+        self._stage_duration = Histogram(
+            "message_stage_duration_seconds",
+            "Time spent in each stage of bot message processing.",
+            labelnames=("stage",),
+            buckets=(0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0),
+        )
+
+    def observe_stage(self, stage: str, duration: float) -> None:
+        self._stage_duration.labels(stage=stage).observe(duration)
+
+    @contextmanager
+    def stage(self, stage: str) -> Iterator[None]:
+        """Measure the wrapped block (including awaits inside it) as one stage."""
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe_stage(stage, time.perf_counter() - started)
+
+
+pipeline_metrics = PipelineMetrics()
@@ -0,0 +1,64 @@
+from __future__ import annotations
+
+from prometheus_client import Counter, Gauge, Histogram
+
+
+class StreamMetrics:
+    """Prometheus metrics helpers for Redis stream consumers."""
+
+    def __init__(self) -> None:
+        self._pending = Gauge(
+            "stream_pending_messages",
+            "Messages delivered to the consumer group but not acknowledged yet.",
+            labelnames=("stream",),
+        )
+        self._claimed = Counter(
+            "stream_claimed_messages_total",
+            "Messages reclaimed from idle consumers.",
+            labelnames=("stream",),
+        )
+        self._dead_lettered = Counter(
+            "stream_dead_lettered_messages_total",
+            "Messages moved to the dead-letter stream after too many deliveries.",
+            labelnames=("stream",),
+        )
+        self._processed = Counter(
+            "stream_messages_processed_total",
+            "Stream messages handled by workers by result (ok, failed).",
+            labelnames=("stream", "result"),
+        )
+        self._batch_size = Histogram(
+            "stream_batch_size",
+            "Number of messages in a batch read from the stream.",
+            labelnames=("stream",),
+            buckets=(1, 2, 5, 10, 20, 50, 100, 200, 500),
+        )
+        self._batch_duration = Histogram(
+            "stream_batch_duration_seconds",
+            "Time spent processing one batch of stream messages.",
+            labelnames=("stream",),
+            buckets=(0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0),
+        )
+
+    def observe_batch(self, stream: str, size: int, failed: int, duration: float) -> None:
+        """Record batch size, duration and per-message results."""
+        self._batch_size.labels(stream=stream).observe(size)
+        self._batch_duration.labels(stream=stream).observe(duration)
+        if size - failed:
+            self._processed.labels(stream=stream, result="ok").inc(size - failed)
+        if failed:
+            self._processed.labels(stream=stream, result="failed").inc(failed)
+
+    def set_pending(self, stream: str, pending: int) -> None:
+        self._pending.labels(stream=stream).set(pending)
+
+    def inc_claimed(self, stream: str, count: int) -> None:
+        if count:
+            self._claimed.labels(stream=stream).inc(count)
+
+    def inc_dead_lettered(self, stream: str, count: int) -> None:
+        if count:
+            self._dead_lettered.labels(stream=stream).inc(count)
+
+
+stream_metrics = StreamMetrics()
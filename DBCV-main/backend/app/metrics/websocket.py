@@ -28,6 +28,31 @@ class WebSocketMetrics:
             "Active WebSocket connections managed by this process.",
             labelnames=("manager",),
         )
+        self._connections_opened = Counter(
+            "websocket_connections_opened_total",
+            "WebSocket connections accepted by this process.",
+            labelnames=("manager",),
+        )
+        self._disconnects = Counter(
+            "websocket_disconnects_total",
+            "Closed WebSocket connections by reason.",
+            labelnames=("manager", "reason"),
+        )
+        self._bytes_sent = Counter(
+            "websocket_bytes_sent_total",
+            "Payload bytes sent to WebSocket clients.",
+            labelnames=("manager",),
+        )
+        self._bytes_received = Counter(
+            "websocket_bytes_received_total",
+            "Payload bytes received from WebSocket clients.",
+            labelnames=("manager",),
+        )
+        self._messages_received = Counter(
+            "websocket_messages_received_total",
+            "Messages received from WebSocket clients.",
+            labelnames=("manager",),
+        )
 
     def observe_broadcast(self, manager: str, sent: int, failed: int, duration: float) -> None:
         """Record broadcast duration and success/failure counters."""
@@ -39,9 +64,20 @@ class WebSocketMetrics:
 
     def inc_active(self, manager: str) -> None:
         self._active_connections.labels(manager=manager).inc()
+        self._connections_opened.labels(manager=manager).inc()
 
     def dec_active(self, manager: str) -> None:
         self._active_connections.labels(manager=manager).dec()
 
+    def inc_disconnect(self, manager: str, reason: str) -> None:
+        self._disconnects.labels(manager=manager, reason=reason).inc()
+
+    def observe_sent(self, manager: str, size: int) -> None:
+        self._bytes_sent.labels(manager=manager).inc(size)
+
+    def observe_received(self, manager: str, size: int) -> None:
+        self._messages_received.labels(manager=manager).inc()
+        self._bytes_received.labels(manager=manager).inc(size)
+
 
 websocket_metrics = WebSocketMetrics()
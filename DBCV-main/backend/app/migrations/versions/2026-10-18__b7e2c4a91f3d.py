@@ -0,0 +1,24 @@
+"""add cache_ttl to request
+
+Revision ID: b7e2c4a91f3d
+Revises: add_integration_fields
+Create Date: 2026-10-18 12:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'b7e2c4a91f3d'
+down_revision = 'add_integration_fields'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.add_column('request', sa.Column('cache_ttl', sa.Integer(), nullable=True))
+
+
+def downgrade():
+    op.drop_column('request', 'cache_ttl')
@@ -35,6 +35,7 @@ class RequestModel(BaseModel):
     attachments: Mapped[Optional[str]]
     headers: Mapped[Optional[str]]
     proxies: Mapped[Optional[str]]
+    cache_ttl: Mapped[Optional[int]]
 
     url_params: Mapped[Optional[JSON]] = mapped_column(type_=JSON)
 
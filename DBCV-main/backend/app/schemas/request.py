@@ -27,6 +27,8 @@ class RequestBase(BaseModel):
     url_params: Optional[Union[JsonSchemaValue, str]] = None
     attachments: Optional[str] = None
     proxies: Optional[str] = None
+    # кеш ответа GET/HEAD в секундах; None или 0 - без кеша
+    cache_ttl: Optional[int] = None
 
 
 class RequestSimple(RequestBase, Timestamp):
@@ -1,7 +1,7 @@
 from __future__ import annotations
 
 from typing import Optional
-from sqlalchemy import text
+from sqlalchemy import bindparam, text
 from sqlalchemy.ext.asyncio import AsyncEngine, AsyncConnection
 
 from app.services.attachment_service import AttachmentRepository, AttachmentMeta
@@ -53,4 +53,20 @@ class SqlAttachmentRepository(AttachmentRepository):
         data = dict(row)
         return AttachmentMeta(id=data["id"], content_type=data.get("content_type"), key=data.get("file"))
 
-
+    async def get_many(self, attachment_ids: list[str]) -> dict[str, AttachmentMeta]:
+        """Метаданные нескольких вложений одним запросом: {id: meta}, ненайденных нет в результате."""
+        if not attachment_ids:
+            return {}
+        query = text(
+            "SELECT id, content_type, file FROM attachment WHERE id IN :ids"
+        ).bindparams(bindparam("ids", expanding=True))
+        if hasattr(self.engine, "connect"):
+            async with self.engine.connect() as conn:  # type: ignore[attr-defined]
+                rows = (await conn.execute(query, {"ids": list(attachment_ids)})).mappings().all()
+        else:
+            conn = self.engine  # type: ignore[assignment]
+            rows = (await conn.execute(query, {"ids": list(attachment_ids)})).mappings().all()
+        return {
+            str(row["id"]): AttachmentMeta(id=row["id"], content_type=row.get("content_type"), key=row.get("file"))
+            for row in rows
+        }
@@ -25,6 +25,7 @@ class AttachmentStoragePort(Protocol):
 class AttachmentRepository(Protocol):
     async def create(self, content_type: Optional[str], key: str, message_id: Optional[str] = None) -> AttachmentMeta: ...
     async def get_by_id(self, attachment_id: str) -> Optional[AttachmentMeta]: ...
+    async def get_many(self, attachment_ids: list[str]) -> dict[str, AttachmentMeta]: ...
 
 
 class AttachmentService:
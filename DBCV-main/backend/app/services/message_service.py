@@ -5,6 +5,7 @@ from app.managers.widget_manager import WidgetManager
 from app.schemas.message import MessagePublic, MessageCreate
 from app.schemas.session import SessionSimple
 from app.utils.message import publish_notify_message, check_channel_access
+from app.utils.tracing import span
 from app.utils.widget import prepare_widget_copy_data
 
 
@@ -15,6 +16,10 @@ class MessageService:
         self.widget_manager = WidgetManager(engine)
 
     async def send_message(self, session: SessionSimple, message_schema: MessagePublic, context: dict) -> dict:
+        with span("message.send", bot_id=session.bot_id, channel_id=session.channel_id):
+            return await self._send_message(session, message_schema, context)
+
+    async def _send_message(self, session: SessionSimple, message_schema: MessagePublic, context: dict) -> dict:
 
         # TODO: Реализовать проверку доступа
         # recipient_id = message_schema.recipient_id or session.user_id
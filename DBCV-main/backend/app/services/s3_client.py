@@ -0,0 +1,88 @@
+"""
+Общий на процесс клиент S3.
+
+Клиент aiobotocore держит пул соединений (keep-alive), поэтому создаётся один раз:
+в lifespan FastAPI и при старте воркеров, либо лениво при первом обращении.
+Для presigned-ссылок отдельный клиент с публичным endpoint (сетевых запросов он не делает).
+"""
+import asyncio
+from contextlib import AsyncExitStack
+
+import aiobotocore.session
+from aiobotocore.config import AioConfig
+
+from app.config import settings
+
+
+def _config() -> AioConfig:
+    return AioConfig(
+        signature_version="s3v4",
+        s3={"addressing_style": "path"},
+        max_pool_connections=settings.S3_MAX_POOL_CONNECTIONS,
+        connect_timeout=settings.S3_CONNECT_TIMEOUT,
+        read_timeout=settings.S3_READ_TIMEOUT,
+        retries={"max_attempts": settings.S3_MAX_ATTEMPTS, "mode": "standard"},
+    )
+
+
+def close_body(body) -> None:
+    """Освобождает соединение тела ответа (без дочитывания оно не вернётся в пул)."""
+    try:
+        body.close()
+    except Exception:
+        pass
+
+
+class S3ClientManager:
+    def __init__(self):
+        self._session = aiobotocore.session.AioSession()
+        self._stack: AsyncExitStack | None = None
+        self._client = None
+        self._presign_client = None
+        self._lock = asyncio.Lock()
+
+    def _create(self, endpoint_url: str):
+        return self._session.create_client(
+            "s3",
+            endpoint_url=endpoint_url,
+            region_name=settings.S3_REGION,
+            config=_config(),
+            aws_secret_access_key=settings.S3_SECRET_KEY,
+            aws_access_key_id=settings.S3_ACCESS_KEY,
+        )
+
+    async def start(self) -> None:
+        async with self._lock:
+            if self._client is not None:
+                return
+            stack = AsyncExitStack()
+            try:
+                client = await stack.enter_async_context(self._create(settings.S3_ENDPOINT))
+                presign_client = await stack.enter_async_context(
+                    self._create(settings.S3_PUBLIC_ENDPOINT or settings.S3_ENDPOINT)
+                )
+            except BaseException:
+                # без этого следующий start() счёл бы менеджер запущенным, а presign_client() вернул бы None
+                await stack.aclose()
+                raise
+            self._client, self._presign_client, self._stack = client, presign_client, stack
+
+    async def client(self):
+        if self._client is None:
+            await self.start()
+        return self._client
+
+    async def presign_client(self):
+        if self._presign_client is None:
+            await self.start()
+        return self._presign_client
+
+    async def close(self) -> None:
+        async with self._lock:
+            stack, self._stack = self._stack, None
+            self._client = self._presign_client = None
+            if stack is not None:
+                await stack.aclose()
+
+
+s3_clients = S3ClientManager()
@@ -1,62 +1,82 @@
-from typing import Optional
+from typing import AsyncIterator, Optional
+from urllib.parse import quote
 
-import aiobotocore.session
-from aiobotocore.config import AioConfig
+from botocore.exceptions import ClientError
 
 from app.config import settings
+from app.managers.local_cache import LocalCache
+from app.services.s3_client import close_body, s3_clients
 from datetime import datetime
 from email.utils import format_datetime
 
 
-aiobotocore_session = aiobotocore.session.AioSession()
+def _object_headers(meta: dict) -> dict:
+    headers = {
+        "Content-Length": str(meta.get("ContentLength", "")),
+        "Content-Type": meta.get("ContentType", "application/octet-stream"),
+    }
+    if meta.get("ContentRange"):
+        headers["Content-Range"] = meta["ContentRange"]
+    etag = meta.get("ETag")
+    if etag:
+        headers["ETag"] = etag
+    last_modified = meta.get("LastModified")
+    if isinstance(last_modified, datetime):
+        try:
+            headers["Last-Modified"] = format_datetime(last_modified, usegmt=True)
+        except Exception:
+            pass
+    return headers
 
 
 async def upload_bytes(key: str, data: bytes, content_type: Optional[str] = None) -> None:
-    async with aiobotocore_session.create_client(
-        "s3",
-        endpoint_url=settings.S3_ENDPOINT,
-        region_name=settings.S3_REGION,
-        config=AioConfig(signature_version="s3v4", s3={"addressing_style": "path"}),
-        aws_secret_access_key=settings.S3_SECRET_KEY,
-        aws_access_key_id=settings.S3_ACCESS_KEY,
-    ) as s3_client:
-        params = {"Bucket": settings.S3_BUCKET, "Key": key, "Body": data}
-        if content_type:
-            params["ContentType"] = content_type
-        await s3_client.put_object(**params)
-
-
-async def generate_presigned_get_url(key: str, expires_in: int = 3600) -> str:
-    presign_endpoint = settings.S3_PUBLIC_ENDPOINT or settings.S3_ENDPOINT
-    async with aiobotocore_session.create_client(
-        "s3",
-        endpoint_url=presign_endpoint,
-        region_name=settings.S3_REGION,
-        config=AioConfig(signature_version="s3v4", s3={"addressing_style": "path"}),
-        aws_secret_access_key=settings.S3_SECRET_KEY,
-        aws_access_key_id=settings.S3_ACCESS_KEY,
-    ) as s3_client:
-        return await s3_client.generate_presigned_url(
-            "get_object",
-            Params={"Bucket": settings.S3_BUCKET, "Key": key},
-            ExpiresIn=expires_in,
-        )
+    s3_client = await s3_clients.client()
+    params = {"Bucket": settings.S3_BUCKET, "Key": key, "Body": data}
+    if content_type:
+        params["ContentType"] = content_type
+    await s3_client.put_object(**params)
+
+
+async def generate_presigned_get_url(key: str, expires_in: int = 3600, filename: Optional[str] = None) -> str:
+    s3_client = await s3_clients.presign_client()
+    params = {"Bucket": settings.S3_BUCKET, "Key": key}
+    if filename:
+        params["ResponseContentDisposition"] = f"attachment; filename*=UTF-8''{quote(filename)}"
+    return await s3_client.generate_presigned_url(
+        "get_object",
+        Params=params,
+        ExpiresIn=expires_in,
+    )
+
+
+# presigned-ссылки переиспользуются, пока до их истечения остаётся не меньше половины срока
+_presigned_urls = LocalCache(maxsize=4096, ttl=settings.ATTACHMENT_PRESIGNED_TTL / 2, prefixes=("presigned:",))
+
+
+def _presigned_cache_key(key: str, filename: Optional[str]) -> str:
+    return f"presigned:{key}:{filename or ''}"
+
+
+def peek_presigned_url(key: str, filename: Optional[str] = None) -> Optional[str]:
+    """Ссылка из кеша без обращения к S3 или None."""
+    return _presigned_urls.get(_presigned_cache_key(key, filename))
+
+
+async def get_cached_presigned_url(key: str, filename: Optional[str] = None) -> str:
+    url = peek_presigned_url(key, filename)
+    if url is None:
+        url = await generate_presigned_get_url(key, settings.ATTACHMENT_PRESIGNED_TTL, filename)
+        _presigned_urls.set(_presigned_cache_key(key, filename), url)
+    return url
 
 
 async def object_exists(key: str) -> bool:
-    async with aiobotocore_session.create_client(
-        "s3",
-        endpoint_url=settings.S3_ENDPOINT,
-        region_name=settings.S3_REGION,
-        config=AioConfig(signature_version="s3v4", s3={"addressing_style": "path"}),
-        aws_secret_access_key=settings.S3_SECRET_KEY,
-        aws_access_key_id=settings.S3_ACCESS_KEY,
-    ) as s3_client:
-        try:
-            await s3_client.head_object(Bucket=settings.S3_BUCKET, Key=key)
-            return True
-        except Exception:
-            return False
+    s3_client = await s3_clients.client()
+    try:
+        await s3_client.head_object(Bucket=settings.S3_BUCKET, Key=key)
+        return True
+    except Exception:
+        return False
 
 
 async def stream_object(key: str, chunk_size: int = 1024 * 1024):
@@ -64,99 +84,74 @@ async def stream_object(key: str, chunk_size: int = 1024 * 1024):
 
     Uses HEAD to fetch headers first, then streams via GET in a safe async context.
     """
-    # Fetch headers via HEAD
-    async with aiobotocore_session.create_client(
-        "s3",
-        endpoint_url=settings.S3_ENDPOINT,
-        region_name=settings.S3_REGION,
-        config=AioConfig(signature_version="s3v4", s3={"addressing_style": "path"}),
-        aws_secret_access_key=settings.S3_SECRET_KEY,
-        aws_access_key_id=settings.S3_ACCESS_KEY,
-    ) as head_client:
-        head = await head_client.head_object(Bucket=settings.S3_BUCKET, Key=key)
-
-    headers = {
-        "Content-Length": str(head.get("ContentLength", "")),
-        "Content-Type": head.get("ContentType", "application/octet-stream"),
-    }
-    etag = head.get("ETag")
-    if etag:
-        headers["ETag"] = etag
-    last_modified = head.get("LastModified")
-    if isinstance(last_modified, datetime):
-        try:
-            headers["Last-Modified"] = format_datetime(last_modified, usegmt=True)
-        except Exception:
-            pass
+    s3_client = await s3_clients.client()
+    head = await s3_client.head_object(Bucket=settings.S3_BUCKET, Key=key)
+    headers = _object_headers(head)
 
     async def iterator():
-        async with aiobotocore_session.create_client(
-            "s3",
-            endpoint_url=settings.S3_ENDPOINT,
-            region_name=settings.S3_REGION,
-            config=AioConfig(signature_version="s3v4", s3={"addressing_style": "path"}),
-            aws_secret_access_key=settings.S3_SECRET_KEY,
-            aws_access_key_id=settings.S3_ACCESS_KEY,
-        ) as s3_client:
-            resp = await s3_client.get_object(Bucket=settings.S3_BUCKET, Key=key)
-            body = resp["Body"]
-            try:
-                while True:
-                    chunk = await body.read(chunk_size)
-                    if not chunk:
-                        break
-                    yield chunk
-            finally:
-                # body.close may be sync in some transports
-                try:
-                    close_result = body.close()
-                    if close_result is not None:
-                        # Some implementations return awaitable
-                        try:
-                            await close_result  # type: ignore
-                        except TypeError:
-                            pass
-                except Exception:
-                    pass
+        resp = await s3_client.get_object(Bucket=settings.S3_BUCKET, Key=key)
+        body = resp["Body"]
+        try:
+            while True:
+                chunk = await body.read(chunk_size)
+                if not chunk:
+                    break
+                yield chunk
+        finally:
+            close_body(body)
 
     return iterator(), headers
 
 
 async def get_object_bytes(key: str) -> tuple[bytes, dict]:
     """Download full object into memory and return (bytes, headers). Suitable for small-to-medium files."""
-    async with aiobotocore_session.create_client(
-        "s3",
-        endpoint_url=settings.S3_ENDPOINT,
-        region_name=settings.S3_REGION,
-        config=AioConfig(signature_version="s3v4", s3={"addressing_style": "path"}),
-        aws_secret_access_key=settings.S3_SECRET_KEY,
-        aws_access_key_id=settings.S3_ACCESS_KEY,
-    ) as s3_client:
-        resp = await s3_client.get_object(Bucket=settings.S3_BUCKET, Key=key)
-        body = resp["Body"]
+    s3_client = await s3_clients.client()
+    resp = await s3_client.get_object(Bucket=settings.S3_BUCKET, Key=key)
+    body = resp["Body"]
+    try:
         data = await body.read()
-        try:
-            close_result = body.close()
-            if close_result is not None:
-                try:
-                    await close_result  # type: ignore
-                except TypeError:
-                    pass
-        except Exception:
-            pass
-        headers = {
-            "Content-Length": str(resp.get("ContentLength", "")),
-            "Content-Type": resp.get("ContentType", "application/octet-stream"),
-        }
-        etag = resp.get("ETag")
-        if etag:
-            headers["ETag"] = etag
-        last_modified = resp.get("LastModified")
-        if isinstance(last_modified, datetime):
-            try:
-                headers["Last-Modified"] = format_datetime(last_modified, usegmt=True)
-            except Exception:
-                pass
-        return data, headers
+    finally:
+        close_body(body)
+    return data, _object_headers(resp)
 
 
+async def open_object(key: str, *, range_header: Optional[str] = None, if_none_match: Optional[str] = None,
+                      chunk_size: int = 1024 * 1024) -> tuple[int, Optional[AsyncIterator[bytes]], dict]:
+    """
+    Один GET с учётом Range и If-None-Match клиента.
+    Возвращает (HTTP-статус, итератор по телу или None, заголовки): 200, 206, 304, 404 или 416.
+    """
+    params = {"Bucket": settings.S3_BUCKET, "Key": key}
+    # S3 поддерживает только один диапазон; несколько диапазонов отдаём целым объектом
+    if range_header and range_header.startswith("bytes=") and "," not in range_header:
+        params["Range"] = range_header
+    if if_none_match:
+        params["IfNoneMatch"] = if_none_match
+
+    s3_client = await s3_clients.client()
+    try:
+        resp = await s3_client.get_object(**params)
+    except ClientError as e:
+        code = str(e.response.get("Error", {}).get("Code"))
+        if code in ("304", "NotModified"):
+            # ETag объекта из ответа S3; значение If-None-Match клиента (список, *) обратно не отдаём
+            etag = e.response.get("ResponseMetadata", {}).get("HTTPHeaders", {}).get("etag")
+            return 304, None, {"ETag": etag} if etag else {}
+        if code in ("416", "InvalidRange"):
+            return 416, None, {}
+        if code in ("404", "NoSuchKey"):
+            return 404, None, {}
+        raise
+
+    body = resp["Body"]
+
+    async def iterator():
+        try:
+            async for chunk in body.iter_chunks(chunk_size):
+                yield chunk
+        finally:
+            close_body(body)
+
+    headers = _object_headers(resp)
+    headers["Accept-Ranges"] = "bytes"
+    return (206 if resp.get("ContentRange") else 200), iterator(), headers
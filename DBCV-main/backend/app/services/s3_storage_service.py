@@ -1,52 +1,49 @@
 from __future__ import annotations
 
-from typing import Optional
-from aiobotocore.config import AioConfig
-import aiobotocore.session
+from contextlib import asynccontextmanager
+from dataclasses import dataclass
+from typing import AsyncIterator, Optional
 
 from app.config import settings
 from app.services.attachment_service import AttachmentStoragePort
+from app.services.s3_client import close_body, s3_clients
 
 
-aiobotocore_session = aiobotocore.session.AioSession()
+@dataclass
+class StoredObject:
+    size: int
+    content_type: Optional[str]
+    chunks: AsyncIterator[bytes]
 
 
 class S3StorageService(AttachmentStoragePort):
     async def upload(self, key: str, data: bytes, content_type: Optional[str] = None) -> None:
-        async with aiobotocore_session.create_client(
-            "s3",
-            endpoint_url=settings.S3_ENDPOINT,
-            region_name=settings.S3_REGION,
-            config=AioConfig(signature_version="s3v4", s3={"addressing_style": "path"}),
-            aws_secret_access_key=settings.S3_SECRET_KEY,
-            aws_access_key_id=settings.S3_ACCESS_KEY,
-        ) as s3_client:
-            params = {"Bucket": settings.S3_BUCKET, "Key": key, "Body": data}
-            if content_type:
-                params["ContentType"] = content_type
-            await s3_client.put_object(**params)
+        s3_client = await s3_clients.client()
+        params = {"Bucket": settings.S3_BUCKET, "Key": key, "Body": data}
+        if content_type:
+            params["ContentType"] = content_type
+        await s3_client.put_object(**params)
 
     async def get_bytes(self, key: str) -> bytes:
-        async with aiobotocore_session.create_client(
-            "s3",
-            endpoint_url=settings.S3_ENDPOINT,
-            region_name=settings.S3_REGION,
-            config=AioConfig(signature_version="s3v4", s3={"addressing_style": "path"}),
-            aws_secret_access_key=settings.S3_SECRET_KEY,
-            aws_access_key_id=settings.S3_ACCESS_KEY,
-        ) as s3_client:
-            resp = await s3_client.get_object(Bucket=settings.S3_BUCKET, Key=key)
-            body = resp["Body"]
-            data = await body.read()
-            try:
-                close_result = body.close()
-                if close_result is not None:
-                    try:
-                        await close_result  # type: ignore
-                    except TypeError:
-                        pass
-            except Exception:
-                pass
-            return data
-
-
+        s3_client = await s3_clients.client()
+        resp = await s3_client.get_object(Bucket=settings.S3_BUCKET, Key=key)
+        body = resp["Body"]
+        try:
+            return await body.read()
+        finally:
+            close_body(body)
+
+    @asynccontextmanager
+    async def open_stream(self, key: str, chunk_size: int | None = None) -> AsyncIterator[StoredObject]:
+        """Объект читается чанками по мере потребления; соединение держится до выхода из контекста."""
+        s3_client = await s3_clients.client()
+        resp = await s3_client.get_object(Bucket=settings.S3_BUCKET, Key=key)
+        body = resp["Body"]
+        try:
+            yield StoredObject(
+                size=int(resp["ContentLength"]),
+                content_type=resp.get("ContentType"),
+                chunks=body.iter_chunks(chunk_size or settings.ATTACHMENT_STREAM_CHUNK_SIZE),
+            )
+        finally:
+            close_body(body)
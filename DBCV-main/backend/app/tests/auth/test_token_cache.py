@@ -0,0 +1,60 @@
+import asyncio
+import time
+
+import pytest
+
+from app.auth.cache import TokenCache
+from app.auth.types import AccessToken
+
+KEY = dict(bot_id="bot", provider="google", profile="default", strategy="oauth", scopes=None)
+
+
+@pytest.mark.asyncio
+async def test_concurrent_misses_mint_once():
+    cache = TokenCache(refresh_ahead=60)
+    calls = []
+
+    async def mint():
+        calls.append(1)
+        await asyncio.sleep(0.01)
+        return AccessToken(access_token=f"t{len(calls)}", expires_at=time.time() + 3600)
+
+    tokens = await asyncio.gather(*[cache.get_or_mint(**KEY, mint=mint) for _ in range(5)])
+
+    assert len(calls) == 1
+    assert {t.access_token for t in tokens} == {"t1"}
+
+
+@pytest.mark.asyncio
+async def test_expiring_token_is_refreshed_in_background():
+    cache = TokenCache(refresh_ahead=600)
+    cache.put(**KEY, token=AccessToken(access_token="old", expires_at=time.time() + 120))
+
+    async def mint():
+        return AccessToken(access_token="new", expires_at=time.time() + 3600)
+
+    assert (await cache.get_or_mint(**KEY, mint=mint)).access_token == "old"
+    await asyncio.sleep(0)
+    await asyncio.sleep(0)
+    assert (await cache.get_or_mint(**KEY, mint=mint)).access_token == "new"
+
+
+@pytest.mark.asyncio
+async def test_tokens_are_separate_per_credential_and_payload():
+    cache = TokenCache(refresh_ahead=60)
+
+    def minter(name):
+        async def mint():
+            return AccessToken(access_token=name, expires_at=time.time() + 3600)
+        return mint
+
+    first = {"id": "c1", "payload": {"refresh_token": "a"}}
+    second = {"id": "c2", "payload": {"refresh_token": "b"}}
+    assert (await cache.get_or_mint(**KEY, credential=first, mint=minter("t1"))).access_token == "t1"
+    assert (await cache.get_or_mint(**KEY, credential=second, mint=minter("t2"))).access_token == "t2"
+
+    rotated = {"id": "c1", "payload": {"refresh_token": "c"}}
+    assert (await cache.get_or_mint(**KEY, credential=rotated, mint=minter("t3"))).access_token == "t3"
+
+    await cache.invalidate_credential("c2")
+    assert cache.get(**KEY, credential=second) is None
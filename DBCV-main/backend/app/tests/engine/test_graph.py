@@ -0,0 +1,87 @@
+"""Тесты кеша скомпилированных графов ботов."""
+from types import SimpleNamespace
+
+import pytest
+
+from app.engine import graph as graph_module
+from app.engine.graph import BotGraphCache, CompiledConnectionGroup, compile_connection_groups
+
+
+@pytest.fixture
+def compiled(monkeypatch):
+    """Подменяет схему бота: тесты проверяют кеш, а не валидацию структуры."""
+    calls = []
+
+    def bot_processor(**structure):
+        calls.append(structure["id"])
+        return SimpleNamespace(id=structure["id"], steps=[], first_step_id=None, master_connection_groups=[])
+
+    monkeypatch.setattr(graph_module, "BotProcessor", bot_processor)
+    return calls
+
+
+def _bot(bot_id: str, version: int = 1) -> dict:
+    return {"id": bot_id, "cache_structure": {"id": bot_id, "version": version}}
+
+
+def test_same_structure_object_is_served_without_hashing(compiled, monkeypatch):
+    cache = BotGraphCache(maxsize=4)
+    bot = _bot("a")
+    graph = cache.get(bot)
+
+    def fail(structure):
+        raise AssertionError("structure hashed again")
+
+    monkeypatch.setattr(graph_module, "structure_hash", fail)
+
+    assert cache.get(bot) is graph
+    assert compiled == ["a"]
+
+
+def test_equal_structure_is_reused_and_changed_structure_recompiled(compiled):
+    cache = BotGraphCache(maxsize=4)
+    graph = cache.get(_bot("a"))
+
+    assert cache.get(_bot("a")) is graph
+    changed = cache.get(_bot("a", version=2))
+
+    assert changed is not graph
+    assert changed.structure_hash != graph.structure_hash
+    assert compiled == ["a", "a"]
+
+
+def test_least_recently_used_graph_is_evicted(compiled):
+    cache = BotGraphCache(maxsize=2)
+    a, b = _bot("a"), _bot("b")
+    cache.get(a)
+    cache.get(b)
+    cache.get(a)
+    cache.get(_bot("c"))
+    cache.get(a)
+
+    assert compiled == ["a", "b", "c"]
+    cache.get(b)
+    assert compiled == ["a", "b", "c", "b"]
+
+
+def test_missing_structure_is_rejected():
+    with pytest.raises(ValueError):
+        BotGraphCache(maxsize=1).get({"id": "a"})
+
+
+def _connection(priority: int, next_step_id: str):
+    return SimpleNamespace(priority=priority, next_step_id=next_step_id, rules=None)
+
+
+def test_groups_and_connections_are_ordered_by_priority():
+    groups = [
+        SimpleNamespace(priority=2, connections=[_connection(1, "late")]),
+        SimpleNamespace(priority=1, connections=[_connection(3, "c"), _connection(1, "a"), _connection(2, "b")]),
+    ]
+
+    compiled_groups = compile_connection_groups(groups)
+
+    assert [group.group.priority for group in compiled_groups] == [1, 2]
+    assert [connection.next_step_id for connection in compiled_groups[0].connections] == ["a", "b", "c"]
+    assert isinstance(compiled_groups[0], CompiledConnectionGroup)
+    assert compiled_groups[0].connections[0].rules is None
@@ -0,0 +1,48 @@
+import asyncio
+
+import pytest
+from httpx import Response
+
+from app.engine.request import HttpClientPool, decode_response
+
+
+def test_decode_response_by_content_type():
+    assert decode_response(Response(200, json={"ok": True})) == {"ok": True}
+    assert decode_response(Response(200, text="<p>hi</p>", headers={"content-type": "text/html"})) == "<p>hi</p>"
+    assert decode_response(Response(200, text="not json", headers={"content-type": "application/json"})) == "not json"
+    assert decode_response(Response(204)) is None
+
+    binary = decode_response(Response(200, content=b"\x89PNG", headers={"content-type": "image/png"}))
+    assert binary == {"content_type": "image/png", "size": 4, "base64": "iVBORw=="}
+
+
+@pytest.mark.asyncio
+async def test_clients_are_reused_per_proxy_config():
+    pool = HttpClientPool(maxsize=1, timeout=0, max_connections=10, max_keepalive=5, http2=False)
+
+    assert pool.get(None) is pool.default
+    first = pool.get("http://proxy-a:3128")
+    assert pool.get('{"all": "http://proxy-a:3128"}') is first
+
+    pool.get("http://proxy-b:3128")
+    assert pool.get("http://proxy-a:3128") is not first
+
+    await pool.aclose()
+
+
+@pytest.mark.asyncio
+async def test_evicted_client_is_closed_only_when_idle():
+    pool = HttpClientPool(maxsize=1, timeout=0, max_connections=10, max_keepalive=5, http2=False)
+
+    async with pool.lease("http://proxy-a:3128") as busy:
+        pool.get("http://proxy-b:3128")
+        await asyncio.sleep(0)
+        assert not busy.is_closed
+
+    idle = pool.get("http://proxy-b:3128")
+    pool.get("http://proxy-c:3128")
+    await asyncio.sleep(0.01)
+
+    assert busy.is_closed
+    assert idle.is_closed
+    await pool.aclose()
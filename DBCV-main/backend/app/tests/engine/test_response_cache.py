@@ -0,0 +1,53 @@
+import asyncio
+
+import pytest
+
+from app.engine.response_cache import ResponseCache, response_ttl
+
+
+class MemoryRedis:
+    def __init__(self):
+        self.data = {}
+
+    async def get(self, key):
+        return self.data.get(key)
+
+    async def set(self, key, value, ex=None, nx=False, px=None):
+        if nx and key in self.data:
+            return None
+        self.data[key] = value
+        return True
+
+    async def exists(self, key):
+        return int(key in self.data)
+
+    async def eval(self, script, numkeys, key, token):
+        if self.data.get(key) == token:
+            del self.data[key]
+
+
+def test_response_ttl_honors_cache_control():
+    assert response_ttl(200, None, 60) == 60
+    assert response_ttl(200, "public, max-age=10", 60) == 10
+    assert response_ttl(200, "max-age=600", 60) == 60
+    assert response_ttl(200, "no-store", 60) == 0
+    assert response_ttl(500, None, 60) == 0
+
+
+@pytest.mark.asyncio
+async def test_concurrent_identical_requests_are_coalesced():
+    cache = ResponseCache(MemoryRedis())
+    calls = []
+
+    async def fetch():
+        calls.append(1)
+        await asyncio.sleep(0.01)
+        return {"response": {"price": 1}}, 60
+
+    key = ResponseCache.key("GET", "https://api.example.com/prices", None, None)
+    results = await asyncio.gather(*[cache.get_or_fetch(key, fetch) for _ in range(5)])
+
+    assert len(calls) == 1
+    assert all(result == {"response": {"price": 1}} for result in results)
+    assert await cache.get_or_fetch(key, fetch) == {"response": {"price": 1}}
+    assert len(calls) == 1
@@ -0,0 +1,59 @@
+"""Тесты предкомпилированных правил переходов."""
+import pytest
+
+from app.engine.rules import GroupRules, InvalidRules, SlotRules, StaticRules, compile_rules
+
+
+def _rule(field, value, operator="equal", type_="string"):
+    return {"id": field, "field": field, "type": type_, "input": "text", "operator": operator, "value": value}
+
+
+@pytest.mark.asyncio
+async def test_static_rules_compiled_once():
+    rules = compile_rules({"condition": "AND", "rules": [_rule("message.text", "hello")]})
+
+    assert isinstance(rules, StaticRules)
+    assert await rules.matches({"message": {"text": "hello"}})
+    assert not await rules.matches({"message": {"text": "bye"}})
+
+
+@pytest.mark.asyncio
+async def test_slot_rules_resolved_per_context():
+    rules = compile_rules('{"condition": "AND", "rules": [%s]}' % (
+        '{"id": "a", "field": "message.text", "type": "string", "input": "text", '
+        '"operator": "equal", "value": "{$user.code$}"}'
+    ))
+
+    assert isinstance(rules, GroupRules)
+    assert isinstance(rules.children[0], SlotRules)
+    assert await rules.matches({"message": {"text": "42"}, "user": {"code": "42"}})
+    assert not await rules.matches({"message": {"text": "42"}, "user": {"code": "7"}})
+    assert len(rules.children[0]._cache) == 2
+
+
+@pytest.mark.asyncio
+async def test_invalid_rules_raise_on_evaluation():
+    rules = compile_rules({"condition": "AND", "rules": [{"field": "x"}]})
+
+    assert isinstance(rules, InvalidRules)
+    with pytest.raises(KeyError):
+        await rules.matches({"x": 1})
+
+
+def test_empty_rules_are_skipped():
+    assert compile_rules(None) is None
+    assert compile_rules("") is None
+
+
+@pytest.mark.asyncio
+async def test_slot_cache_distinguishes_equal_values_of_different_types():
+    rules = compile_rules('{"condition": "AND", "rules": [%s]}' % (
+        '{"id": "a", "field": "message.text", "type": "string", "input": "text", '
+        '"operator": "equal", "value": "{$user.flag$}"}'
+    ))
+    slot_rules = rules.children[0]
+
+    assert await rules.matches({"message": {"text": "1"}, "user": {"flag": 1}})
+    assert await rules.matches({"message": {"text": "True"}, "user": {"flag": True}})
+    assert slot_rules.resolve({"user": {"flag": True}}) is not slot_rules.resolve({"user": {"flag": 1}})
+    assert len(slot_rules._cache) == 2
@@ -0,0 +1,151 @@
+import asyncio
+import json
+
+import pytest
+
+from app.engine.safe_env import safe_globals
+from app.engine.sandbox import (CodeTimeoutError, CopyOnAccessDict, ProcessCodeRunner, build_globals, code_cache,
+                                inline_deadlines, is_trivial)
+
+
+def test_copy_on_access_keeps_source_untouched():
+    source = {"user": {"name": "a", "tags": ["x"]}, "bot": {"id": "1"}}
+    variables = CopyOnAccessDict(source)
+
+    variables["user"]["name"] = "b"
+    variables["user"]["tags"].append("y")
+    variables["bot"].pop("id")
+    variables["session"] = {"step": 1}
+
+    assert source == {"user": {"name": "a", "tags": ["x"]}, "bot": {"id": "1"}}
+    assert variables["user"] == {"name": "b", "tags": ["x", "y"]}
+    assert json.loads(json.dumps(variables)) == {"user": {"name": "b", "tags": ["x", "y"]}, "bot": {},
+                                                 "session": {"step": 1}}
+
+
+def test_copies_made_by_dict_fast_paths_do_not_touch_source():
+    source = {"user": {"profile": {"name": "a"}, "tags": ["x"]}}
+    variables = CopyOnAccessDict(source)
+
+    dict(variables["user"])["profile"]["name"] = "b"
+    {**variables}["user"]["tags"].append("y")
+    (variables | {})["user"]["profile"]["age"] = 1
+
+    assert source == {"user": {"profile": {"name": "a"}, "tags": ["x"]}}
+
+
+def test_untouched_values_are_not_copied():
+    source = {"user": {"name": "a", "profile": {"age": 1}}, "history": [{"text": "hi"}], "bot": {"id": "1"}}
+    variables = CopyOnAccessDict(source)
+
+    variables["user"]["name"] = "b"
+
+    assert dict.__getitem__(variables, "history") is source["history"]
+    assert dict.__getitem__(variables, "bot") is source["bot"]
+    assert dict.__getitem__(variables["user"], "profile") is source["user"]["profile"]
+    assert source["user"]["name"] == "a"
+
+
+def test_reads_through_get_pop_and_items_do_not_touch_source():
+    source = {"a": {"x": 1}, "b": ["y"], "c": {"z": 2}}
+    variables = CopyOnAccessDict(source)
+
+    variables.get("a")["x"] = 2
+    variables.pop("b").append("z")
+    for _, value in variables.items():
+        value["z"] = 3
+
+    assert source == {"a": {"x": 1}, "b": ["y"], "c": {"z": 2}}
+
+
+def _compile_main(code: str) -> tuple[dict, dict]:
+    code_globals = build_globals(print)
+    namespace = {}
+    exec(code_cache.get(code), code_globals, namespace)
+    return code_globals, namespace
+
+
+@pytest.mark.asyncio
+async def test_inline_deadline_interrupts_synchronous_loop():
+    code_globals, namespace = _compile_main("async def main(context, variables):\n    while True:\n        pass\n")
+
+    with pytest.raises(CodeTimeoutError):
+        with inline_deadlines.limit(code_globals, 0.1):
+            await asyncio.wait_for(namespace["main"]({}, variables={}), timeout=5)
+
+
+@pytest.mark.asyncio
+async def test_inline_deadline_does_not_touch_other_code():
+    code_globals, namespace = _compile_main("async def main(context, variables):\n    return context\n")
+
+    with inline_deadlines.limit(code_globals, 0.05):
+        assert await namespace["main"]({"ok": True}, variables={}) == {"ok": True}
+        # срок истёк, но код шага не выполняется: остальной код сигнал не прерывает
+        await asyncio.sleep(0.1)
+        sum(range(10 ** 5))
+
+
+def test_globals_overlay_does_not_touch_shared_globals():
+    first, second = object(), object()
+
+    assert build_globals(first)["print"] is first
+    assert build_globals(second)["print"] is second
+    assert "print" not in safe_globals
+
+
+def test_code_is_compiled_once():
+    code = "async def main(context, variables):\n    return context\n"
+
+    assert code_cache.get(code) is code_cache.get(code)
+
+
+@pytest.mark.parametrize("code", [
+    "async def main(context, variables):\n    return list(permutations(range(11)))\n",
+    "async def main(context, variables):\n    return sum(range(10 ** 9))\n",
+    "async def main(context, variables):\n    return stdev(variables['values'])\n",
+    "async def main(context, variables)\n",
+])
+def test_heavy_code_is_not_trivial(code):
+    assert not is_trivial(code)
+
+
+def test_short_code_is_trivial():
+    assert is_trivial("async def main(context, variables):\n    context['n'] = len(variables)\n    return context\n")
+
+
+# sum по range выполняется в C: ITIMER_PROF не прерывает его, срабатывает запасной таймаут
+HUNG_CODE = "async def main(context, variables):\n    return sum(range(10 ** 12))\n"
+ECHO_CODE = "async def main(context, variables):\n    return {'echo': variables['n']}\n"
+
+
+@pytest.mark.asyncio
+async def test_hung_job_kills_only_its_worker():
+    runner = ProcessCodeRunner(workers=2, memory_limit_mb=0, timeout=0.2)
+    runner.backstop_margin = 0.5
+    try:
+        await runner.warm_up()
+        processes = {worker.process.pid for worker in runner._idle}
+
+        hung, echo = await asyncio.gather(runner.run(HUNG_CODE, {}, {}), runner.run(ECHO_CODE, {}, {"n": 1}))
+
+        assert "превышено время выполнения" in hung[2]
+        assert echo == ({"echo": 1}, [], None)
+        survivors = {worker.process.pid for worker in runner._idle}
+        assert len(survivors) == 1 and survivors <= processes
+    finally:
+        runner.shutdown()
+
+
+@pytest.mark.asyncio
+async def test_time_waiting_for_a_worker_is_not_counted():
+    runner = ProcessCodeRunner(workers=1, memory_limit_mb=0, timeout=0.2)
+    runner.backstop_margin = 0.5
+    try:
+        await runner.warm_up()
+        # второе задание ждёт процесс дольше своего запасного таймаута, но выполняется полностью
+        hung, echo = await asyncio.gather(runner.run(HUNG_CODE, {}, {}), runner.run(ECHO_CODE, {}, {"n": 2}))
+
+        assert "превышено время выполнения" in hung[2]
+        assert echo == ({"echo": 2}, [], None)
+    finally:
+        runner.shutdown()
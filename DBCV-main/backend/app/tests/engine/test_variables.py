@@ -0,0 +1,44 @@
+"""Тесты подстановки переменных {$var$}."""
+import pytest
+
+from app.engine.variables import compile_template, render_variables, replace_variables_universal
+
+CONTEXT = {"user": {"name": "Bob", "age": 30, "tags": ["a", "b"], "code": "12", "active": True}}
+
+
+def test_compile_template_is_cached():
+    template = compile_template("Hello {$user.name$}!")
+
+    assert template is compile_template("Hello {$user.name$}!")
+    assert template.names == ("user.name",)
+    assert template.whole is None
+
+
+def test_whole_placeholder_returns_typed_value():
+    assert render_variables("{$user.tags$}", CONTEXT) == ["a", "b"]
+    assert render_variables("{$user.age$}", CONTEXT) == 30
+    assert render_variables("{$user.code$}", CONTEXT) == 12
+    assert render_variables("{$user.active$}", CONTEXT) == "True"
+    assert render_variables("{$user.missing$}", CONTEXT) == ""
+
+
+def test_whole_placeholder_value_is_a_copy():
+    context = {"user": {"profile": {"name": "Bob"}}}
+
+    rendered = render_variables("{$user.profile$}", context)
+    rendered["name"] = "Alice"
+
+    assert context == {"user": {"profile": {"name": "Bob"}}}
+
+
+def test_mixed_string_and_json_templates():
+    assert render_variables("Hi {$user.name$}, {$user.age$}", CONTEXT) == "Hi Bob, 30"
+    assert render_variables('{"tags": {$user.tags$}}', CONTEXT) == {"tags": ["a", "b"]}
+    assert render_variables("no variables", CONTEXT) == "no variables"
+
+
+@pytest.mark.asyncio
+async def test_replace_variables_universal_nested():
+    data = {"{$user.name$}": ["{$user.age$}", {"k": "{$user.name$}"}], "n": 1}
+
+    assert await replace_variables_universal(data, CONTEXT) == {"Bob": [30, {"k": "Bob"}], "n": 1}
@@ -0,0 +1,109 @@
+import asyncio
+import logging
+
+import pytest
+
+from app.config import settings
+from app.loggers import bot as bot_loggers
+from app.loggers.bot import BotLogger, get_bot_log_state
+from app.utils.ws_routing import ws_router
+
+
+@pytest.fixture
+def published(monkeypatch):
+    sent = []
+
+    async def publish(kind, entity_id, payload):
+        sent.append(payload)
+
+    monkeypatch.setattr(ws_router, "publish", publish)
+    return sent
+
+
+def watched_by(monkeypatch, watched: bool, level: int = logging.DEBUG):
+    async def state(bot_id):
+        return watched, level
+
+    monkeypatch.setattr(bot_loggers, "get_bot_log_state", state)
+
+
+@pytest.mark.asyncio
+async def test_records_are_sent_in_one_batch(monkeypatch, published):
+    watched_by(monkeypatch, True)
+    monkeypatch.setattr(settings, "BOT_LOG_BATCH_SIZE", 3)
+    monkeypatch.setattr(settings, "BOT_LOG_FLUSH_INTERVAL", 60)
+    logger = BotLogger("bot")
+
+    await logger.warning("one")
+    await logger.warning("two")
+    assert published == []
+
+    await logger.warning("three")
+    assert len(published) == 1
+    assert [record["level"] for record in published[0]["messages"]] == ["WARNING"] * 3
+
+
+@pytest.mark.asyncio
+async def test_partial_batch_is_flushed_by_timer(monkeypatch, published):
+    watched_by(monkeypatch, True)
+    monkeypatch.setattr(settings, "BOT_LOG_BATCH_SIZE", 100)
+    monkeypatch.setattr(settings, "BOT_LOG_FLUSH_INTERVAL", 0.01)
+    logger = BotLogger("bot")
+
+    await logger.error("boom")
+    assert published == []
+    await asyncio.sleep(0.05)
+
+    assert len(published) == 1
+    assert logger._flush_handle is None
+    assert not logger._flushing
+
+
+@pytest.mark.asyncio
+async def test_unwatched_bot_publishes_nothing(monkeypatch, published):
+    watched_by(monkeypatch, False)
+    monkeypatch.setattr(settings, "BOT_LOG_BATCH_SIZE", 1)
+    logger = BotLogger("bot")
+
+    await logger.error("boom")
+    await logger.send_variables({"a": 1})
+    await logger.flush()
+
+    assert published == []
+
+
+class FakePipeline:
+    def __init__(self):
+        self.commands = []
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc):
+        return False
+
+    def zcount(self, *args):
+        self.commands.append("zcount")
+
+    def hget(self, *args):
+        self.commands.append("hget")
+
+    async def execute(self):
+        return [1, b"info"]
+
+
+class FakeRedis:
+    def pipeline(self, transaction=True):
+        return FakePipeline()
+
+
+@pytest.mark.asyncio
+async def test_state_cache_is_bounded(monkeypatch):
+    monkeypatch.setattr(bot_loggers, "_get_redis", lambda: FakeRedis())
+    monkeypatch.setattr(bot_loggers, "_bot_states", bot_loggers.OrderedDict())
+    monkeypatch.setattr(settings, "BOT_LOG_STATE_CACHE_SIZE", 2)
+
+    for bot_id in ("a", "b", "a", "c"):
+        assert await get_bot_log_state(bot_id) == (True, logging.INFO)
+
+    assert list(bot_loggers._bot_states) == ["a", "c"]
@@ -0,0 +1,21 @@
+import asyncio
+
+import pytest
+
+from app.managers.data_manager import CacheLock
+
+
+@pytest.mark.asyncio
+async def test_lock_is_removed_after_last_waiter():
+    cache_lock = CacheLock()
+    order = []
+
+    async def load(name):
+        async with cache_lock.acquire("key"):
+            order.append(name)
+            await asyncio.sleep(0)
+
+    await asyncio.gather(load("a"), load("b"), load("c"))
+
+    assert order == ["a", "b", "c"]
+    assert cache_lock.locks == {}
@@ -0,0 +1,36 @@
+import pytest
+
+from app.managers.codecs import CacheCodec, JsonSerializer, MsgpackSerializer, build_codec
+
+VALUE = {"id": "1", "steps": [{"name": "шаг", "n": 1}] * 50, "flag": True, "empty": None}
+
+
+def test_plain_json_keeps_legacy_keys_and_format():
+    codec = CacheCodec(JsonSerializer())
+
+    assert codec.key("bot:1") == "bot:1"
+    assert codec.loads(codec.dumps(VALUE)) == VALUE
+
+
+def test_unknown_codec_falls_back_to_json():
+    assert build_codec("unknown").name == "json"
+
+
+def test_msgpack_codec_uses_versioned_prefix():
+    pytest.importorskip("msgpack")
+    codec = CacheCodec(MsgpackSerializer())
+
+    assert codec.key("bot:1") == "c1:msgpack:bot:1"
+    assert codec.loads(codec.dumps(VALUE)) == VALUE
+
+
+def test_zstd_compresses_only_large_values():
+    pytest.importorskip("zstandard")
+    codec = CacheCodec(JsonSerializer(), compression="zstd", threshold=256)
+
+    small, large = {"a": 1}, VALUE
+    assert codec.dumps(small)[:1] == b"\x00"
+    assert codec.dumps(large)[:1] == b"\x01"
+    assert codec.loads(codec.dumps(small)) == small
+    assert codec.loads(codec.dumps(large)) == large
+    assert codec.key("bot:1") == "c1:json+zstd:bot:1"
@@ -0,0 +1,44 @@
+from app.managers.local_cache import LocalCache
+
+
+def test_only_configured_prefixes_are_cached():
+    cache = LocalCache(maxsize=10, ttl=60, prefixes=["bot:"])
+    cache.set("bot:1", {"id": "1"})
+    cache.set("session:1", {"id": "1"})
+
+    assert cache.get("bot:1") == {"id": "1"}
+    assert cache.get("session:1") is None
+
+
+def test_lru_and_ttl_bounds():
+    cache = LocalCache(maxsize=2, ttl=60, prefixes=["bot:"])
+    cache.set("bot:1", 1)
+    cache.set("bot:2", 2)
+    cache.get("bot:1")
+    cache.set("bot:3", 3)
+    assert cache.get("bot:2") is None
+    assert cache.get("bot:1") == 1
+
+    expired = LocalCache(maxsize=2, ttl=-1, prefixes=["bot:"])
+    expired.set("bot:1", 1)
+    assert expired.get("bot:1") is None
+
+
+def test_value_read_before_invalidation_is_not_stored():
+    cache = LocalCache(maxsize=10, ttl=60, prefixes=["bot:"])
+    epoch = cache.epoch
+    cache.invalidate("bot:1")
+    cache.set("bot:1", "stale", epoch)
+
+    assert cache.get("bot:1") is None
+
+
+def test_linked_cache_receives_invalidations():
+    cache = LocalCache(maxsize=10, ttl=60, prefixes=["bot:"])
+    credentials = LocalCache(maxsize=10, ttl=60, prefixes=["credentials:"])
+    cache.link(credentials)
+    credentials.set("credentials:id:1", {"payload": {}})
+
+    cache.invalidate("credentials:id:1")
+
+    assert credentials.get("credentials:id:1") is None
@@ -0,0 +1,36 @@
+import pytest
+
+from app.managers.data_manager import DataManager
+
+
+class _Recorder(DataManager):
+    def __init__(self):
+        super().__init__(redis=None, engine=None)
+        self.updated = []
+
+    async def _update(self, key, ttl, db_query):
+        self.updated.append((key, db_query()))
+        return {}
+
+
+@pytest.mark.asyncio
+async def test_only_changed_scopes_are_saved():
+    dm = _Recorder()
+    variables = {"bot": {"a": 1}, "channel": {}, "session": {"step": "x"}, "user": None}
+    fingerprint = dm.variables_fingerprint(variables)
+
+    variables["session"]["step"] = "y"
+    saved = await dm.update_changed_variables("u", "b", "c", "s", variables, fingerprint)
+
+    assert saved == ["session"]
+    assert [key for key, _ in dm.updated] == ["variables:session:s"]
+
+
+@pytest.mark.asyncio
+async def test_unchanged_variables_are_not_saved():
+    dm = _Recorder()
+    variables = {"bot": {}, "channel": {"k": [1, 2]}, "session": {}, "user": {}}
+    fingerprint = dm.variables_fingerprint(variables)
+
+    assert await dm.update_changed_variables("u", "b", "c", "s", variables, fingerprint) == []
+    assert dm.updated == []
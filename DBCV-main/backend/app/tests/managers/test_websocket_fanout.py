@@ -0,0 +1,65 @@
+import asyncio
+
+import pytest
+
+from app.managers.websocket import ChannelWebSocketManager
+from app.utils.ws_routing import ws_router
+
+
+class FakeWebSocket:
+    def __init__(self, delay: float = 0):
+        self.delay = delay
+        self.sent: list[str] = []
+
+    async def send_text(self, message: str):
+        await asyncio.sleep(self.delay)
+        self.sent.append(message)
+
+    async def close(self):
+        pass
+
+
+@pytest.fixture(autouse=True)
+def no_route_registry(monkeypatch):
+    async def noop(*args, **kwargs):
+        return None
+
+    monkeypatch.setattr(ws_router, "register", noop)
+    monkeypatch.setattr(ws_router, "unregister", noop)
+
+
+@pytest.mark.asyncio
+async def test_slow_client_does_not_delay_others():
+    manager = ChannelWebSocketManager()
+    fast, slow = FakeWebSocket(), FakeWebSocket(delay=1)
+    await manager.add_connection("channel", "fast", fast)
+    await manager.add_connection("channel", "slow", slow)
+
+    await manager.notify("channel", {"text": "hi"})
+    await asyncio.sleep(0.01)
+
+    assert fast.sent == ['{"text": "hi"}']
+    assert slow.sent == []
+
+    await manager.remove_connection("channel", "fast")
+    await manager.remove_connection("channel", "slow")
+    assert manager.active_connections == {}
+
+
+@pytest.mark.asyncio
+async def test_paused_connection_keeps_messages_until_resume():
+    manager = ChannelWebSocketManager()
+    websocket = FakeWebSocket()
+    connection = await manager.add_connection("channel", "client", websocket)
+
+    connection.pause()
+    await manager.notify("channel", "first")
+    await manager.notify("channel", "second")
+    await asyncio.sleep(0.01)
+    assert websocket.sent == []
+
+    connection.resume()
+    await asyncio.sleep(0.01)
+    assert websocket.sent == ["first", "second"]
+
+    await manager.remove_connection("channel", "client")
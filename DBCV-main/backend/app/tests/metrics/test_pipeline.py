@@ -0,0 +1,28 @@
+import asyncio
+
+import pytest
+from prometheus_client import REGISTRY
+
+from app.metrics.cache import cache_metrics
+from app.metrics.pipeline import pipeline_metrics
+
+
+def sample(name: str, **labels) -> float:
+    return REGISTRY.get_sample_value(name, labels) or 0.0
+
+
+@pytest.mark.asyncio
+async def test_stage_is_recorded_even_on_error():
+    before = sample("message_stage_duration_seconds_count", stage="test_stage")
+    with pipeline_metrics.stage("test_stage"):
+        await asyncio.sleep(0)
+    with pytest.raises(RuntimeError):
+        with pipeline_metrics.stage("test_stage"):
+            raise RuntimeError
+    assert sample("message_stage_duration_seconds_count", stage="test_stage") == before + 2
+
+
+def test_cache_kind_drops_ids():
+    before = sample("cache_lookups_total", layer="redis", kind="bot", result="hit")
+    cache_metrics.hit("redis", "bot:5d1c2c6e-1111-2222-3333-444455556666")
+    assert sample("cache_lookups_total", layer="redis", kind="bot", result="hit") == before + 1
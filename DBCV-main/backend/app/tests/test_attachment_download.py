@@ -0,0 +1,213 @@
+"""Скачивание вложений: ответы open_object по ответам S3 и ветки маршрута /attachments/download."""
+from types import SimpleNamespace
+
+import pytest
+from botocore.exceptions import ClientError
+from fastapi import HTTPException
+
+import app.crud.attachment as crud_attachment
+from app.api.routes.attachments import download_attachment_file
+from app.config import settings
+from app.services import s3_service
+from app.services.s3_client import s3_clients
+
+
+class FakeBody:
+    def __init__(self, data: bytes):
+        self.data = data
+        self.closed = False
+
+    async def iter_chunks(self, chunk_size):
+        for start in range(0, len(self.data), chunk_size):
+            yield self.data[start:start + chunk_size]
+
+    def close(self):
+        self.closed = True
+
+
+class FakeS3Client:
+    def __init__(self, response=None, error: dict | None = None):
+        self.response = response
+        self.error = error
+        self.calls = []
+
+    async def get_object(self, **params):
+        self.calls.append(params)
+        if self.error is not None:
+            raise ClientError(self.error, "GetObject")
+        return self.response
+
+
+@pytest.fixture
+def s3(monkeypatch):
+    def install(**kwargs) -> FakeS3Client:
+        client = FakeS3Client(**kwargs)
+
+        async def get_client():
+            return client
+
+        monkeypatch.setattr(s3_clients, "client", get_client)
+        return client
+
+    return install
+
+
+async def _read(iterator) -> bytes:
+    return b"".join([chunk async for chunk in iterator])
+
+
+@pytest.mark.asyncio
+async def test_full_object_is_streamed(s3):
+    body = FakeBody(b"hello")
+    s3(response={"Body": body, "ContentLength": 5, "ContentType": "text/plain", "ETag": '"abc"'})
+
+    status, iterator, headers = await s3_service.open_object("k", chunk_size=2)
+
+    assert status == 200
+    assert await _read(iterator) == b"hello"
+    assert body.closed
+    assert headers["ETag"] == '"abc"' and headers["Accept-Ranges"] == "bytes"
+
+
+@pytest.mark.asyncio
+async def test_single_range_is_passed_to_s3(s3):
+    client = s3(response={"Body": FakeBody(b"el"), "ContentLength": 2, "ContentRange": "bytes 1-2/5"})
+
+    status, iterator, headers = await s3_service.open_object("k", range_header="bytes=1-2")
+
+    assert status == 206
+    assert client.calls[0]["Range"] == "bytes=1-2"
+    assert headers["Content-Range"] == "bytes 1-2/5"
+    assert await _read(iterator) == b"el"
+
+
+@pytest.mark.asyncio
+async def test_multiple_ranges_fall_back_to_full_object(s3):
+    client = s3(response={"Body": FakeBody(b"hello"), "ContentLength": 5})
+
+    status, _, _ = await s3_service.open_object("k", range_header="bytes=0-1,3-4")
+
+    assert status == 200
+    assert "Range" not in client.calls[0]
+
+
+@pytest.mark.asyncio
+async def test_not_modified_returns_object_etag(s3):
+    s3(error={"Error": {"Code": "304"}, "ResponseMetadata": {"HTTPHeaders": {"etag": '"abc"'}}})
+
+    status, iterator, headers = await s3_service.open_object("k", if_none_match='"old", "abc"')
+
+    assert (status, iterator, headers) == (304, None, {"ETag": '"abc"'})
+
+
+@pytest.mark.asyncio
+async def test_unsatisfiable_range(s3):
+    s3(error={"Error": {"Code": "InvalidRange"}})
+
+    assert await s3_service.open_object("k", range_header="bytes=10-20") == (416, None, {})
+
+
+@pytest.fixture
+def attachment(monkeypatch):
+    attachment = SimpleNamespace(file="attachment/2024/01/01/a.txt", file_name="a.txt", content_type="text/plain")
+
+    async def get_attachment(session, attachment_id):
+        return attachment
+
+    monkeypatch.setattr(crud_attachment, "get_attachment", get_attachment)
+    return attachment
+
+
+def _request(**headers):
+    return SimpleNamespace(headers=headers)
+
+
+@pytest.mark.asyncio
+async def test_legacy_file_is_uploaded_and_object_reopened(monkeypatch, tmp_path, attachment):
+    (tmp_path / "attachment").mkdir()
+    (tmp_path / "attachment" / "a.txt").write_bytes(b"legacy")
+    monkeypatch.setattr(settings, "MEDIA_ROOT", tmp_path)
+    monkeypatch.setattr(settings, "ATTACHMENT_DOWNLOAD_MODE", "proxy")
+    uploaded = {}
+    responses = [(404, None, {}), (200, None, {"Content-Type": "text/plain"})]
+
+    async def open_object(key, **kwargs):
+        return responses.pop(0)
+
+    async def upload_bytes(key, data, content_type=None):
+        uploaded[key] = data
+
+    monkeypatch.setattr(s3_service, "open_object", open_object)
+    monkeypatch.setattr(s3_service, "upload_bytes", upload_bytes)
+
+    response = await download_attachment_file(None, "id", _request())
+
+    assert response.status_code == 200
+    assert uploaded == {attachment.file: b"legacy"}
+    assert responses == []
+
+
+@pytest.mark.asyncio
+async def test_missing_object_without_legacy_file_is_404(monkeypatch, tmp_path, attachment):
+    monkeypatch.setattr(settings, "MEDIA_ROOT", tmp_path)
+    monkeypatch.setattr(settings, "ATTACHMENT_DOWNLOAD_MODE", "proxy")
+
+    async def open_object(key, **kwargs):
+        return 404, None, {}
+
+    monkeypatch.setattr(s3_service, "open_object", open_object)
+
+    with pytest.raises(HTTPException) as error:
+        await download_attachment_file(None, "id", _request())
+    assert error.value.status_code == 404
+
+
+@pytest.mark.asyncio
+async def test_not_modified_response(monkeypatch, attachment):
+    monkeypatch.setattr(settings, "ATTACHMENT_DOWNLOAD_MODE", "proxy")
+    seen = {}
+
+    async def open_object(key, **kwargs):
+        seen.update(kwargs)
+        return 304, None, {"ETag": '"abc"'}
+
+    monkeypatch.setattr(s3_service, "open_object", open_object)
+
+    response = await download_attachment_file(None, "id", _request(**{"if-none-match": '"abc"'}))
+
+    assert response.status_code == 304
+    assert response.headers["etag"] == '"abc"'
+    assert seen["if_none_match"] == '"abc"'
+
+
+@pytest.mark.asyncio
+async def test_unsatisfiable_range_response(monkeypatch, attachment):
+    monkeypatch.setattr(settings, "ATTACHMENT_DOWNLOAD_MODE", "proxy")
+
+    async def open_object(key, **kwargs):
+        return 416, None, {}
+
+    monkeypatch.setattr(s3_service, "open_object", open_object)
+
+    with pytest.raises(HTTPException) as error:
+        await download_attachment_file(None, "id", _request(range="bytes=10-20"))
+    assert error.value.status_code == 416
+
+
+@pytest.mark.asyncio
+async def test_redirect_uses_cached_url_without_head(monkeypatch, attachment):
+    monkeypatch.setattr(settings, "ATTACHMENT_DOWNLOAD_MODE", "redirect")
+    s3_service._presigned_urls.set(s3_service._presigned_cache_key(attachment.file, attachment.file_name),
+                                   "https://s3/cached")
+
+    async def object_exists(key):
+        raise AssertionError("HEAD sent for a cached URL")
+
+    monkeypatch.setattr(s3_service, "object_exists", object_exists)
+    try:
+        response = await download_attachment_file(None, "id", _request())
+    finally:
+        s3_service._presigned_urls.clear()
+
+    assert response.status_code == 302
+    assert response.headers["location"] == "https://s3/cached"
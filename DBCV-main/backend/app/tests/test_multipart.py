@@ -0,0 +1,39 @@
+import pytest
+
+from app.utils.multipart import MultipartStream, StreamedFile
+
+
+async def _chunks(*parts: bytes):
+    for part in parts:
+        yield part
+
+
+@pytest.mark.asyncio
+async def test_streamed_body_matches_declared_length():
+    body = MultipartStream(
+        {"title": "report"},
+        [StreamedFile(field="files", filename="a.csv", content_type="text/csv", size=6,
+                      chunks=_chunks(b"a,b\n", b"1\n"))],
+    )
+
+    raw = b"".join([chunk async for chunk in body])
+
+    assert len(raw) == body.content_length
+    assert body.headers["Content-Type"] == f"multipart/form-data; boundary={body.boundary}"
+    assert b'name="title"\r\n\r\nreport\r\n' in raw
+    assert b'filename="a.csv"\r\nContent-Type: text/csv\r\n\r\na,b\n1\n\r\n' in raw
+    assert raw.endswith(f"--{body.boundary}--\r\n".encode())
+
+
+@pytest.mark.asyncio
+async def test_fields_are_encoded_like_httpx_form_data():
+    body = MultipartStream({"flag": True, "off": False, "empty": None, "tags": ["a", "b"], "n": 1}, [])
+
+    raw = b"".join([chunk async for chunk in body])
+
+    assert len(raw) == body.content_length
+    assert b'name="flag"\r\n\r\ntrue\r\n' in raw
+    assert b'name="off"\r\n\r\nfalse\r\n' in raw
+    assert b'name="empty"\r\n\r\n\r\n' in raw
+    assert b'name="tags"\r\n\r\na\r\n' in raw and b'name="tags"\r\n\r\nb\r\n' in raw
+    assert b'name="n"\r\n\r\n1\r\n' in raw
@@ -0,0 +1,49 @@
+import asyncio
+
+import pytest
+
+from app.utils.partitioned import PartitionedScheduler
+
+
+@pytest.mark.asyncio
+async def test_same_key_runs_in_order_and_keys_run_in_parallel():
+    scheduler = PartitionedScheduler(max_concurrency=10)
+    running = {"a": 0, "b": 0}
+    peak = {"a": 0, "b": 0, "total": 0}
+    order = []
+
+    async def work(item):
+        key, n = item
+        running[key] += 1
+        peak[key] = max(peak[key], running[key])
+        peak["total"] = max(peak["total"], sum(running.values()))
+        await asyncio.sleep(0.01)
+        order.append(item)
+        running[key] -= 1
+        return n
+
+    items = [("a", 1), ("b", 1), ("a", 2), ("b", 2), ("a", 3)]
+    results = await scheduler.run_all(items, key=lambda item: item[0], func=work)
+
+    assert results == [1, 1, 2, 2, 3]
+    assert [n for key, n in order if key == "a"] == [1, 2, 3]
+    assert peak["a"] == peak["b"] == 1
+    assert peak["total"] == 2
+    assert scheduler.active_keys == 0
+
+
+@pytest.mark.asyncio
+async def test_global_limit():
+    scheduler = PartitionedScheduler(max_concurrency=2)
+    running, peak = 0, 0
+
+    async def work(item):
+        nonlocal running, peak
+        running += 1
+        peak = max(peak, running)
+        await asyncio.sleep(0.01)
+        running -= 1
+
+    await scheduler.run_all(range(6), key=lambda item: item, func=work)
+
+    assert peak == 2
@@ -0,0 +1,39 @@
+import pytest
+
+from app.services.s3_client import S3ClientManager
+
+
+class FakeClientContext:
+    def __init__(self, name: str, log: list, fail: bool = False):
+        self.name, self.log, self.fail = name, log, fail
+
+    async def __aenter__(self):
+        if self.fail:
+            raise ConnectionError("endpoint unavailable")
+        self.log.append(f"open {self.name}")
+        return self.name
+
+    async def __aexit__(self, *exc):
+        self.log.append(f"close {self.name}")
+        return False
+
+
+@pytest.mark.asyncio
+async def test_failed_start_leaves_manager_stopped(monkeypatch):
+    manager = S3ClientManager()
+    log, failures = [], [False, True]
+
+    def create(endpoint_url):
+        fail = failures.pop(0) if failures else False
+        return FakeClientContext(f"client{len(log)}", log, fail)
+
+    monkeypatch.setattr(manager, "_create", create)
+
+    with pytest.raises(ConnectionError):
+        await manager.start()
+    assert log == ["open client0", "close client0"]
+    assert manager._client is None and manager._stack is None
+
+    assert await manager.presign_client() is not None
+    assert await manager.client() is not None
+    await manager.close()
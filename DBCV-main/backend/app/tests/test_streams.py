@@ -0,0 +1,82 @@
+import json
+
+import pytest
+
+from app.utils.streams import PendingRecovery, decode_stream_fields
+
+
+def test_decode_faststream_json_envelope():
+    body = {"message": {"sender_id": "u1"}, "channel_id": "c1"}
+    envelope = json.dumps({"data": json.dumps(body), "headers": {"content-type": "application/json"}})
+
+    assert decode_stream_fields({b"__data__": envelope.encode()}) == body
+
+
+def test_decode_plain_fields():
+    assert decode_stream_fields({b"message": b"init", b"channel_id": b"init"}) == {
+        "message": "init", "channel_id": "init"
+    }
+
+
+class FakePipeline:
+    def __init__(self, redis):
+        self.redis = redis
+        self.calls = []
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *args):
+        return False
+
+    def xpending_range(self, stream, group, min, max, count):
+        entries = [entry for entry in self.redis.pending if min <= entry["message_id"] <= max]
+        self.calls.append(entries[:count])
+
+    def xadd(self, stream, fields):
+        self.redis.dead.append(fields)
+        self.calls.append(None)
+
+    def xack(self, stream, group, *ids):
+        self.redis.acked.extend(ids)
+        self.calls.append(len(ids))
+
+    async def execute(self):
+        return self.calls
+
+
+class FakeRedis:
+    def __init__(self, claimed, pending):
+        self.claimed = claimed
+        self.pending = pending
+        self.dead, self.acked = [], []
+
+    async def xautoclaim(self, *args, **kwargs):
+        claimed, self.claimed = self.claimed, []
+        return "0-0", claimed
+
+    def pipeline(self, transaction=False):
+        return FakePipeline(self)
+
+
+@pytest.mark.asyncio
+async def test_recovery_dead_letters_poison_and_undecodable_messages():
+    # 1-1 и 1-3 зависли у консьюмера, но не забраны сейчас: они не должны мешать подсчёту доставок
+    pending = [{"message_id": msg_id, "times_delivered": times}
+               for msg_id, times in [("1-1", 1), ("1-2", 9), ("1-3", 1), ("1-4", 1), ("1-5", 1)]]
+    redis = FakeRedis(claimed=[("1-2", {"message": "poison"}),
+                               ("1-4", {"__data__": json.dumps({"data": "{broken"})}),
+                               ("1-5", {"message": "ok"})],
+                      pending=pending)
+    processed = []
+
+    async def process(messages):
+        processed.extend(messages)
+
+    recovery = PendingRecovery(redis, "s", "g", "c", process, min_idle_ms=0, batch_size=10, max_deliveries=3,
+                               min_interval=1, max_interval=1)
+    await recovery.recover_once()
+
+    assert processed == [("1-5", {"message": "ok"})]
+    assert sorted(redis.acked) == ["1-2", "1-4"]
+    assert [fields["__reason__"] for fields in redis.dead] == ["max_deliveries", "undecodable"]
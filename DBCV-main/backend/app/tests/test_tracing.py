@@ -0,0 +1,33 @@
+import json
+
+import pytest
+
+from app.config import settings
+from app.utils import tracing
+
+
+def test_disabled_tracing_leaves_payload_untouched():
+    payload = {"message": {}, "channel_id": "c1"}
+    with tracing.span("noop", carrier={"traceparent": "garbage"}):
+        assert tracing.inject(payload) == {"message": {}, "channel_id": "c1"}
+
+
+def test_context_travels_through_payload(monkeypatch, tmp_path):
+    pytest.importorskip("opentelemetry.sdk")
+    path = tmp_path / "traces.jsonl"
+    monkeypatch.setattr(settings, "TRACING_EXPORTER", "file")
+    monkeypatch.setattr(settings, "TRACING_FILE", str(path))
+    tracing.setup_tracing("test")
+    try:
+        with tracing.span("stream.publish"):
+            payload = tracing.inject({"message": {}})
+        # другой процесс: контекста нет, кроме поля trace в полезной нагрузке
+        with tracing.span("worker.check_message", carrier=payload[tracing.TRACE_FIELD]):
+            pass
+    finally:
+        tracing.shutdown_tracing()
+
+    spans = {span["name"]: span for span in map(json.loads, path.read_text().splitlines())}
+    publish, worker = spans["stream.publish"], spans["worker.check_message"]
+    assert worker["context"]["trace_id"] == publish["context"]["trace_id"]
+    assert worker["parent_id"] == publish["context"]["span_id"]
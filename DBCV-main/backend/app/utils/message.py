@@ -14,6 +14,8 @@ from app.models.message import MessageModel
 from app.models.subscriber import SubscriberModel
 from app.crud.channel import get_channel
 from app.broker import broker
+from app.utils.tracing import inject, span
+from app.utils.ws_routing import ws_router
 from app.config import settings
 
 import logging
@@ -22,7 +24,9 @@ logger = logging.getLogger(__name__)
 
 
 async def publish_notify_message(channel_id: UUID | str, message: MessagePublic):
-    await broker.publish({"channel_id": str(channel_id), "message": message.dict()}, "message_queue")
+    with span("ws.publish", channel_id=channel_id, message_id=message.id):
+        await ws_router.publish("channel", str(channel_id),
+                                inject({"channel_id": str(channel_id), "message": message.dict()}))
 
 
 async def publish_message(message, stream=settings.USER_STREAM_NAME):
@@ -30,7 +34,8 @@ async def publish_message(message, stream=settings.USER_STREAM_NAME):
     Publish a message to the broker.
     """
     message_data = {"message": message.get_dict(), "channel_id": None if message.channel_id is None else message.channel_id}
-    await broker.publish(message_data, stream=stream)
+    with span("stream.publish", stream=stream, message_id=message.id):
+        await broker.publish(inject(message_data), stream=stream)
 
 
 async def bot_send_message_by_id(session: AsyncSession, message_id: UUID | str, bot_id: UUID | str,
@@ -0,0 +1,89 @@
+"""
+Потоковое multipart/form-data тело запроса.
+
+httpx умеет `files=` только из байтов и синхронных файлов, поэтому для вложений из S3
+тело собирается здесь из асинхронных итераторов: в памяти одновременно не больше одного чанка.
+Размеры частей известны заранее, так что Content-Length считается без чтения данных.
+"""
+from dataclasses import dataclass
+from typing import Any, AsyncIterator, Mapping
+from uuid import uuid4
+
+
+@dataclass
+class StreamedFile:
+    field: str
+    filename: str
+    content_type: str
+    size: int
+    chunks: AsyncIterator[bytes]
+
+
+def _primitive(value: Any) -> bytes:
+    """Значение поля формы так же, как его кодирует httpx: True -> "true", None -> ""."""
+    if isinstance(value, bytes):
+        return value
+    if value is True:
+        return b"true"
+    if value is False:
+        return b"false"
+    if value is None:
+        return b""
+    return str(value).encode()
+
+
+def _form_fields(fields: Mapping[str, Any] | None) -> list[tuple[str, bytes]]:
+    """Пары (имя, значение); список или кортеж даёт повторяющиеся поля, как в httpx."""
+    result = []
+    for name, value in (fields or {}).items():
+        values = value if isinstance(value, (list, tuple)) else [value]
+        result.extend((str(name), _primitive(item)) for item in values)
+    return result
+
+
+def _quote(value: str) -> str:
+    return value.replace("\\", "\\\\").replace('"', '\\"').replace("\r", "").replace("\n", "")
+
+
+class MultipartStream:
+    def __init__(self, fields: Mapping[str, Any] | None, files: list[StreamedFile]):
+        self.boundary = uuid4().hex
+        self.fields = _form_fields(fields)
+        self.files = files
+
+    @property
+    def content_type(self) -> str:
+        return f"multipart/form-data; boundary={self.boundary}"
+
+    def _field_part(self, name: str, value: bytes) -> bytes:
+        return (f"--{self.boundary}\r\n"
+                f"Content-Disposition: form-data; name=\"{_quote(name)}\"\r\n\r\n").encode() + value + b"\r\n"
+
+    def _file_header(self, file: StreamedFile) -> bytes:
+        return (f"--{self.boundary}\r\n"
+                f"Content-Disposition: form-data; name=\"{_quote(file.field)}\"; "
+                f"filename=\"{_quote(file.filename)}\"\r\n"
+                f"Content-Type: {file.content_type}\r\n\r\n").encode()
+
+    def _closing(self) -> bytes:
+        return f"--{self.boundary}--\r\n".encode()
+
+    @property
+    def content_length(self) -> int:
+        length = sum(len(self._field_part(name, value)) for name, value in self.fields)
+        length += sum(len(self._file_header(file)) + file.size + 2 for file in self.files)
+        return length + len(self._closing())
+
+    @property
+    def headers(self) -> dict[str, str]:
+        return {"Content-Type": self.content_type, "Content-Length": str(self.content_length)}
+
+    async def __aiter__(self) -> AsyncIterator[bytes]:
+        for name, value in self.fields:
+            yield self._field_part(name, value)
+        for file in self.files:
+            yield self._file_header(file)
+            async for chunk in file.chunks:
+                yield chunk
+            yield b"\r\n"
+        yield self._closing()
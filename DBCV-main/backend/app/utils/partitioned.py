@@ -0,0 +1,52 @@
+"""
+Планировщик задач с разбиением по ключу.
+
+Задачи с одинаковым ключом выполняются в порядке поступления (не более `per_key` одновременно),
+задачи с разными ключами - параллельно, но не более `max_concurrency` всего.
+"""
+import asyncio
+import logging
+from typing import Any, Awaitable, Callable, Hashable, Iterable, TypeVar
+
+logger = logging.getLogger(__name__)
+
+T = TypeVar("T")
+
+
+class _Partition:
+    __slots__ = ("semaphore", "refs")
+
+    def __init__(self, limit: int):
+        self.semaphore = asyncio.Semaphore(limit)
+        self.refs = 0
+
+
+class PartitionedScheduler:
+    def __init__(self, max_concurrency: int, per_key: int = 1):
+        self.per_key = max(per_key, 1)
+        self._global = asyncio.Semaphore(max(max_concurrency, 1))
+        self._partitions: dict[Hashable, _Partition] = {}
+
+    @property
+    def active_keys(self) -> int:
+        return len(self._partitions)
+
+    async def run(self, key: Hashable, func: Callable[[], Awaitable[T]]) -> T:
+        partition = self._partitions.get(key)
+        if partition is None:
+            partition = self._partitions[key] = _Partition(self.per_key)
+        partition.refs += 1
+        try:
+            # сначала очередь ключа, затем общий лимит: ожидающие своей очереди не занимают общие слоты
+            async with partition.semaphore:
+                async with self._global:
+                    return await func()
+        finally:
+            partition.refs -= 1
+            if partition.refs == 0 and self._partitions.get(key) is partition:
+                del self._partitions[key]
+
+    async def run_all(self, items: Iterable[Any], key: Callable[[Any], Hashable],
+                      func: Callable[[Any], Awaitable[T]]) -> list[T]:
+        """Запускает func для каждого элемента; порядок элементов с одним ключом сохраняется."""
+        return await asyncio.gather(*[self.run(key(item), lambda item=item: func(item)) for item in items])
@@ -0,0 +1,147 @@
+"""
+Восстановление зависших сообщений Redis Streams.
+
+Сообщения, которые консьюмер группы получил, но не подтвердил дольше `min_idle_ms`
+(например, воркер упал), забираются пачками через XAUTOCLAIM. Сообщения, доставленные
+больше `max_deliveries` раз или не поддающиеся декодированию, переносятся в dead-letter
+стрим `<stream>:dead` и подтверждаются.
+"""
+import asyncio
+import json
+import logging
+from typing import Any, Awaitable, Callable
+
+from redis.asyncio import Redis
+
+from app.metrics.streams import stream_metrics
+
+logger = logging.getLogger(__name__)
+
+
+def _text(value: Any) -> Any:
+    return value.decode() if isinstance(value, bytes) else value
+
+
+def decode_stream_fields(fields: dict) -> dict | None:
+    """
+    Достаёт тело сообщения из полей записи стрима.
+    FastStream кладёт сообщение в поле `__data__`; записи без него возвращаются как есть.
+    """
+    fields = {_text(key): value for key, value in (fields or {}).items()}
+    raw = fields.get("__data__")
+    if raw is None:
+        return {key: _text(value) for key, value in fields.items()}
+
+    try:
+        envelope = json.loads(raw)
+    except (ValueError, UnicodeDecodeError):
+        envelope = None
+    if isinstance(envelope, dict) and "data" in envelope:
+        body = envelope["data"]
+        try:
+            return json.loads(body) if isinstance(body, (str, bytes)) else body
+        except (ValueError, UnicodeDecodeError) as e:
+            logger.error(f"Failed to decode stream message: {e}")
+            return None
+
+    try:
+        from faststream.redis.parser import BinaryMessageFormatV1
+        body, _ = BinaryMessageFormatV1.parse(raw)
+        return json.loads(body)
+    except Exception as e:
+        logger.error(f"Failed to decode stream message: {e}")
+        return None
+
+
+class PendingRecovery:
+    def __init__(self, redis: Redis, stream: str, group: str, consumer: str,
+                 process: Callable[[list[tuple[str, dict]]], Awaitable[Any]], *,
+                 min_idle_ms: int, batch_size: int, max_deliveries: int,
+                 min_interval: float, max_interval: float):
+        self.redis = redis
+        self.stream = stream
+        self.group = group
+        self.consumer = consumer
+        self.process = process
+        self.min_idle_ms = min_idle_ms
+        self.batch_size = batch_size
+        self.max_deliveries = max_deliveries
+        self.min_interval = min_interval
+        self.max_interval = max_interval
+        self.dead_letter_stream = f"{stream}:dead"
+
+    async def update_pending_metric(self) -> None:
+        summary = await self.redis.xpending(self.stream, self.group)
+        stream_metrics.set_pending(self.stream, int(summary.get("pending") or 0))
+
+    async def _delivery_counts(self, ids: list[str]) -> dict[str, int]:
+        # по одному запросу на id: диапазоном могли бы вернуться другие pending-сообщения консьюмера
+        async with self.redis.pipeline(transaction=False) as pipe:
+            for msg_id in ids:
+                pipe.xpending_range(self.stream, self.group, min=msg_id, max=msg_id, count=1)
+            results = await pipe.execute()
+        return {_text(entry["message_id"]): int(entry["times_delivered"])
+                for entries in results for entry in entries}
+
+    async def _dead_letter(self, messages: list[tuple[str, dict]], counts: dict[str, int],
+                           reason: str = "max_deliveries") -> None:
+        async with self.redis.pipeline(transaction=False) as pipe:
+            for msg_id, fields in messages:
+                pipe.xadd(self.dead_letter_stream, {
+                    **fields,
+                    "__source_id__": msg_id,
+                    "__deliveries__": counts.get(msg_id, 0),
+                    "__reason__": reason,
+                })
+            pipe.xack(self.stream, self.group, *[msg_id for msg_id, _ in messages])
+            await pipe.execute()
+        stream_metrics.inc_dead_lettered(self.stream, len(messages))
+        logger.error(f"Moved {len(messages)} message(s) from {self.stream} to {self.dead_letter_stream}")
+
+    async def recover_once(self) -> int:
+        """Один проход по всем зависшим сообщениям. Возвращает количество забранных сообщений."""
+        claimed_total = 0
+        start = "0-0"
+        while True:
+            response = await self.redis.xautoclaim(
+                self.stream, self.group, self.consumer,
+                min_idle_time=self.min_idle_ms, start_id=start, count=self.batch_size,
+            )
+            start, claimed = _text(response[0]), response[1]
+            claimed = [(_text(msg_id), fields) for msg_id, fields in claimed if fields]
+            if claimed:
+                claimed_total += len(claimed)
+                stream_metrics.inc_claimed(self.stream, len(claimed))
+                counts = await self._delivery_counts([msg_id for msg_id, _ in claimed])
+
+                dead = [(msg_id, fields) for msg_id, fields in claimed
+                        if counts.get(msg_id, 0) > self.max_deliveries]
+                if dead:
+                    await self._dead_letter(dead, counts)
+                dead_ids = {msg_id for msg_id, _ in dead}
+                decoded = [(msg_id, fields, decode_stream_fields(fields)) for msg_id, fields in claimed
+                           if msg_id not in dead_ids]
+                undecodable = [(msg_id, fields) for msg_id, fields, payload in decoded if payload is None]
+                if undecodable:
+                    await self._dead_letter(undecodable, counts, reason="undecodable")
+                alive = [(msg_id, payload) for msg_id, _, payload in decoded if payload is not None]
+                if alive:
+                    logger.warning(f"Reclaimed {len(alive)} message(s) from {self.stream}")
+                    await self.process(alive)
+            if start == "0-0":
+                return claimed_total
+
+    async def run(self) -> None:
+        """Цикл восстановления: опрос учащается, пока есть зависшие сообщения, и замедляется, когда их нет."""
+        logger.info(f"Pending recovery started for stream: {self.stream}, group: {self.group}, "
+                    f"consumer: {self.consumer}")
+        interval = self.min_interval
+        while True:
+            try:
+                claimed = await self.recover_once()
+                await self.update_pending_metric()
+                interval = self.min_interval if claimed else min(interval * 2, self.max_interval)
+            except Exception as e:
+                logger.exception(f"Error during pending recovery for {self.stream}: {e}")
+                interval = self.max_interval
+            await asyncio.sleep(interval)
@@ -0,0 +1,110 @@
+"""
+Сквозная трассировка сообщения: API → стрим Redis → воркер → уведомление по WebSocket.
+
+Контекст передаётся в полезной нагрузке брокера полем `trace` (W3C traceparent/tracestate).
+Спаны экспортируются в OTLP-коллектор (TRACING_EXPORTER=otlp) или в файл JSON Lines (file).
+При TRACING_EXPORTER=none или без пакетов opentelemetry спаны не создаются.
+"""
+import json
+import logging
+from contextlib import contextmanager
+from typing import Any, Iterator
+
+from app.config import settings
+
+try:
+    from opentelemetry import propagate
+    from opentelemetry.sdk.resources import Resource
+    from opentelemetry.sdk.trace import TracerProvider
+    from opentelemetry.sdk.trace.export import BatchSpanProcessor, SpanExporter, SpanExportResult
+    from opentelemetry.sdk.trace.sampling import ParentBased, TraceIdRatioBased
+    OTEL_AVAILABLE = True
+except ImportError:
+    OTEL_AVAILABLE = False
+
+logger = logging.getLogger(__name__)
+
+TRACE_FIELD = "trace"
+
+_provider = None
+_tracer = None
+
+
+if OTEL_AVAILABLE:
+    class FileSpanExporter(SpanExporter):
+        """Пишет завершённые спаны в файл, по одному JSON на строку."""
+
+        def __init__(self, path: str):
+            self._file = open(path, "a", encoding="utf-8")
+
+        def export(self, spans) -> "SpanExportResult":
+            for span in spans:
+                self._file.write(json.dumps(json.loads(span.to_json()), ensure_ascii=False) + "\n")
+            self._file.flush()
+            return SpanExportResult.SUCCESS
+
+        def shutdown(self) -> None:
+            self._file.close()
+
+
+def _exporter():
+    if settings.TRACING_EXPORTER == "otlp":
+        from opentelemetry.exporter.otlp.proto.http.trace_exporter import OTLPSpanExporter
+        return OTLPSpanExporter(endpoint=settings.TRACING_OTLP_ENDPOINT)
+    if settings.TRACING_EXPORTER == "file":
+        return FileSpanExporter(settings.TRACING_FILE)
+    raise ValueError(f"Unknown TRACING_EXPORTER: {settings.TRACING_EXPORTER}")
+
+
+def setup_tracing(service_name: str) -> None:
+    global _provider, _tracer
+    if settings.TRACING_EXPORTER == "none" or _provider is not None:
+        return
+    if not OTEL_AVAILABLE:
+        logger.warning("Tracing requested but 'opentelemetry-sdk' is not installed; tracing disabled")
+        return
+    try:
+        exporter = _exporter()
+    except Exception as e:
+        logger.warning(f"Tracing disabled: {e}")
+        return
+    provider = TracerProvider(
+        resource=Resource.create({"service.name": f"{settings.TRACING_SERVICE_PREFIX}{service_name}"}),
+        sampler=ParentBased(TraceIdRatioBased(settings.TRACING_SAMPLE_RATE)),
+    )
+    provider.add_span_processor(BatchSpanProcessor(exporter))
+    _provider, _tracer = provider, provider.get_tracer("app")
+    logger.info(f"Tracing enabled: {settings.TRACING_EXPORTER} exporter, service {service_name}")
+
+
+def shutdown_tracing() -> None:
+    """Дописывает накопленные спаны перед остановкой процесса."""
+    global _provider, _tracer
+    provider, _provider, _tracer = _provider, None, None
+    if provider is not None:
+        provider.shutdown()
+
+
+@contextmanager
+def span(name: str, carrier: dict | None = None, **attributes: Any) -> Iterator[None]:
+    """
+    Спан этапа обработки. carrier - поле `trace` из полезной нагрузки брокера:
+    спан становится продолжением трассировки процесса-отправителя.
+    """
+    if _tracer is None:
+        yield
+        return
+    context = propagate.extract(carrier) if carrier else None
+    attributes = {key: str(value) for key, value in attributes.items() if value is not None}
+    with _tracer.start_as_current_span(name, context=context, attributes=attributes):
+        yield
+
+
+def inject(payload: dict) -> dict:
+    """Добавляет в полезную нагрузку контекст текущего спана (поле `trace`)."""
+    if _tracer is not None:
+        carrier: dict[str, str] = {}
+        propagate.inject(carrier)
+        if carrier:
+            payload[TRACE_FIELD] = carrier
+    return payload
@@ -0,0 +1,90 @@
+"""
+Маршрутизация WebSocket-уведомлений между узлами API.
+
+Каждый узел регистрирует в Redis, к каким сущностям (каналам, ботам) у него есть подключения:
+ZSET `ws:route:<kind>:<entity_id>` с id узла и временем истечения записи. Уведомление
+публикуется только в каналы `ws:node:<node_id>` узлов, которые держат подключения к сущности.
+При WS_ROUTING=broadcast (по умолчанию) уведомления, как раньше, получают все узлы.
+Режим registry включается только после обновления всех узлов API: узлы на старом коде
+не регистрируются в реестре, и их клиенты перестали бы получать уведомления.
+"""
+import logging
+import time
+from typing import Iterable
+from uuid import uuid4
+
+from redis.asyncio import Redis
+
+from app.broker import broker
+from app.config import settings
+
+logger = logging.getLogger(__name__)
+
+# суффикс процесса обязателен: процессы с одним WS_NODE_ID (uvicorn --workers N) иначе
+# снимали бы маршруты друг друга при отключении последнего подписчика
+NODE_ID = f"{settings.WS_NODE_ID}-{uuid4().hex[:8]}" if settings.WS_NODE_ID else uuid4().hex
+
+# общие каналы режима broadcast
+BROADCAST_CHANNELS = {"channel": "message_queue", "bot": "bot_message_queue"}
+
+
+def node_channel(node_id: str) -> str:
+    return f"ws:node:{node_id}"
+
+
+def route_key(kind: str, entity_id: str) -> str:
+    return f"ws:route:{kind}:{entity_id}"
+
+
+class WebSocketRouter:
+    def __init__(self):
+        self._redis: Redis | None = None
+
+    @property
+    def redis(self) -> Redis:
+        if self._redis is None:
+            self._redis = Redis.from_url(settings.REDIS_URL)
+        return self._redis
+
+    async def register(self, kind: str, entity_ids: Iterable[str]) -> None:
+        """Отмечает, что этот узел держит подключения к сущностям (продлевает запись на WS_ROUTE_TTL)."""
+        ttl = settings.WS_ROUTE_TTL
+        now = time.time()
+        try:
+            async with self.redis.pipeline(transaction=False) as pipe:
+                for entity_id in entity_ids:
+                    key = route_key(kind, entity_id)
+                    pipe.zadd(key, {NODE_ID: now + ttl})
+                    pipe.zremrangebyscore(key, "-inf", now)
+                    pipe.expire(key, int(ttl))
+                await pipe.execute()
+        except Exception as e:
+            logger.warning(f"[WS] Failed to register routes for {kind}: {e}")
+
+    async def unregister(self, kind: str, entity_id: str) -> None:
+        try:
+            await self.redis.zrem(route_key(kind, entity_id), NODE_ID)
+        except Exception as e:
+            logger.warning(f"[WS] Failed to unregister route {kind}:{entity_id}: {e}")
+
+    async def nodes(self, kind: str, entity_id: str) -> list[str]:
+        nodes = await self.redis.zrangebyscore(route_key(kind, entity_id), time.time(), "+inf")
+        return [node.decode() if isinstance(node, bytes) else node for node in nodes]
+
+    async def publish(self, kind: str, entity_id: str, payload: dict) -> None:
+        """Отправляет уведомление узлам с подключениями к сущности."""
+        if settings.WS_ROUTING != "registry":
+            await broker.publish(payload, BROADCAST_CHANNELS[kind])
+            return
+        try:
+            nodes = await self.nodes(kind, str(entity_id))
+        except Exception as e:
+            # без реестра уведомление не теряем: рассылаем всем узлам
+            logger.warning(f"[WS] Route lookup failed for {kind}:{entity_id}, broadcasting: {e}")
+            await broker.publish(payload, BROADCAST_CHANNELS[kind])
+            return
+        for node_id in nodes:
+            await broker.publish({**payload, "kind": kind}, node_channel(node_id))
+
+
+ws_router = WebSocketRouter()